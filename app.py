@@ -1,7 +1,21 @@
 import os
-from flask import Flask, request, render_template, redirect, url_for, flash, send_from_directory
+import io
+import json
+import time
+import uuid
+import shutil
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Flask, Request, Response, g, request, render_template, stream_with_context, redirect, url_for, flash, send_from_directory, make_response, jsonify
 from werkzeug.utils import secure_filename
-from modules.info_extractor import AIInfoExtractor
+from modules.info_extractor import get_extractor, ROUTER_MODEL
+from modules.runner import get_mode_extractor
+from modules.document_pages import PagedExtractor, is_paged_document
+from modules.result_cache import create_cache_from_env
+from modules.job_queue import JobStore, JobQueue, QueueFullError, DONE, FAILED
+from modules.exporters import CONTENT_TYPES, export_chunks, record_from_job
+from modules.structured_output import document_items
+from modules.metrics import get_registry, get_request_id, new_request_id, bind_context, observe_bytes, timer
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -11,18 +25,198 @@ load_dotenv()
 if not os.getenv('OPENROUTER_API_KEY'):
     raise ValueError("OPENROUTER_API_KEY environment variable is required")
 
+class UploadRequest(Request):
+    """Request class allowing a larger body for batch uploads than for single documents"""
+
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'batch_upload':
+            return app.config['BATCH_MAX_CONTENT_LENGTH']
+        return app.config['MAX_CONTENT_LENGTH']
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Single documents are capped at MAX_CONTENT_LENGTH, so keep them in memory
+        # and process them straight from the upload stream; batches spool to disk
+        if self.endpoint in ('upload_file', 'upload_stream'):
+            return io.BytesIO()
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.config['SECRET_KEY'] = os.urandom(24)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'tiff', 'bmp'}
+app.config['BATCH_MAX_CONTENT_LENGTH'] = int(os.getenv('BATCH_MAX_CONTENT_LENGTH', 1024 * 1024 * 1024))  # 1GB
+app.config['BATCH_MAX_FILES'] = int(os.getenv('BATCH_MAX_FILES', '500'))
+app.config['BATCH_CONCURRENCY'] = int(os.getenv('BATCH_CONCURRENCY', '4'))
+app.config['BATCH_MAX_CONCURRENCY'] = int(os.getenv('BATCH_MAX_CONCURRENCY', '16'))
+app.config['EXTRACTION_MODE'] = os.getenv('EXTRACTION_MODE', 'ai')
+# Model used when a request does not choose one; 'auto' routes to the fastest healthy model
+app.config['DEFAULT_MODEL'] = os.getenv('DEFAULT_MODEL', ROUTER_MODEL)
+EXTRACTION_MODES = ('ai', 'tiered', 'template', 'structured', 'tiled')
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'tiff', 'tif', 'bmp', 'pdf'}
+ALLOWED_TYPES_MESSAGE = 'Invalid file type. Allowed types: PNG, JPG, JPEG, GIF, TIFF, BMP, PDF'
 
 # Create upload folder if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Extraction result cache (see RESULT_CACHE_* in .env.example)
+result_cache = create_cache_from_env()
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def structured_requested():
+    """Whether the client asked for the typed structured result (format=structured)"""
+    return request.values.get('format') == 'structured'
+
+def get_mode():
+    """Extraction mode requested by the form, falling back to EXTRACTION_MODE ('structured' for format=structured)"""
+    mode = request.form.get('mode') or ('structured' if structured_requested() else app.config['EXTRACTION_MODE'])
+    if mode not in EXTRACTION_MODES:
+        raise ValueError(f"Invalid extraction mode. Available modes: {', '.join(EXTRACTION_MODES)}")
+    return mode
+
+def run_extraction(source, model, metrics=None, mode='ai', structured=False):
+    """
+    Extract information from a saved upload or an upload stream, returning (results, cache_hit).
+    In 'tiered' mode local OCR is tried first and only low-confidence documents reach the model.
+    In 'template' mode known layouts are extracted from stored regions or with a short prompt.
+    In 'structured' mode the model fills a JSON schema instead of writing free-text JSON.
+    In 'tiled' mode very large or dense pages are cut into overlapping bands extracted concurrently.
+    PDFs and multi-frame TIFFs are extracted page by page and the results merged.
+    With `structured` (structured mode only) the typed result (Document.to_dict) is returned
+    instead of label/value/remarks items.
+    Image encoding and timing details are recorded in `metrics` when given.
+    """
+    if structured and mode != 'structured':
+        raise ValueError("format=structured requires the structured extraction mode")
+    info_extractor = get_mode_extractor(mode, model)
+    if is_paged_document(source):
+        info_extractor = PagedExtractor(info_extractor)
+    if result_cache is not None:
+        return result_cache.fetch(source, info_extractor, metrics=metrics, structured=structured)
+    if structured:
+        return info_extractor.extract_structured(source, metrics=metrics), False
+    return info_extractor.extract_info(source, metrics=metrics), False
+
+def stream_extraction(source, model, mode, state):
+    """
+    Yield result items for the progressive results page as soon as each is available.
+    Single images in 'ai' mode stream from the model; other modes and multi-page
+    documents yield their rows once extraction finishes. Errors and timings are
+    recorded in `state` since the response has already started.
+    """
+    metrics = state['metrics']
+    start = time.perf_counter()
+    try:
+        if mode == 'ai' and not is_paged_document(source):
+            info_extractor = get_extractor(model)
+            if result_cache is not None:
+                items = result_cache.fetch_stream(source, info_extractor, metrics=metrics)
+            else:
+                items = info_extractor.stream_info(source, metrics=metrics)
+        else:
+            items, metrics['cache_hit'] = run_extraction(source, model, metrics, mode=mode)
+
+        for item in items:
+            if state['rows'] == 0:
+                state['first_row_ms'] = round((time.perf_counter() - start) * 1000, 1)
+            state['rows'] += 1
+            yield item
+    except Exception as e:
+        error_msg = str(e)
+        print(f"Processing error: {error_msg}")
+        state['error'] = friendly_error(error_msg)
+    state['total_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    print(f"Streamed {state['rows']} rows, first after {state.get('first_row_ms')} ms, total {state['total_ms']} ms")
+
+def add_metrics_headers(response, metrics):
+    """Report the image encoding and stage timings of an extraction on the response"""
+    image = metrics.get('image')
+    if image:
+        encoding = f"format={image['format']}; size={image['size'][0]}x{image['size'][1]}; bytes={image['bytes']}"
+        if 'quality' in image:
+            encoding += f"; quality={image['quality']}"
+        if image.get('grayscale'):
+            encoding += "; grayscale"
+        if image.get('cropped'):
+            encoding += "; cropped"
+        encoding += f"; original={image['original_size'][0]}x{image['original_size'][1]}"
+        response.headers['X-Image-Encoding'] = encoding
+    if 'pages' in metrics:
+        response.headers['X-Document-Pages'] = str(metrics['pages'])
+    if metrics.get('tiles', 1) > 1:
+        response.headers['X-Document-Tiles'] = str(metrics['tiles'])
+    if 'tier' in metrics:
+        tier = metrics['tier']
+        if 'ocr_confidence' in metrics:
+            tier += f"; confidence={metrics['ocr_confidence']}"
+        if 'template_id' in metrics:
+            tier += f"; template={metrics['template_id']}; score={metrics['template_score']}"
+        response.headers['X-Extraction-Tier'] = tier
+    if 'template_observation' in metrics:
+        response.headers['X-Template-Observation'] = metrics['template_observation']
+    if 'duplicate' in metrics:
+        duplicate = metrics['duplicate']
+        response.headers['X-Near-Duplicate'] = (f"id={duplicate['id']}; distance={duplicate['distance']}; "
+                                                f"difference={duplicate['difference']}"
+                                                f"; {duplicate['action']}")
+    if 'model' in metrics:
+        response.headers['X-Model-Route'] = metrics['model'] + ('; hedged' if metrics.get('hedged') else '')
+    stages = (('ocr', 'ocr_ms'), ('template', 'template_ms'), ('tile_plan', 'tile_plan_ms'), ('encode', 'encode_ms'),
+              ('api', 'api_ms'), ('parse', 'parse_ms'), ('render', 'render_ms'))
+    timings = [f"{stage};dur={metrics[key]}" for stage, key in stages if key in metrics]
+    if timings:
+        response.headers['Server-Timing'] = ', '.join(timings)
+    return response
+
+def friendly_error(error_msg):
+    """Map an extraction error to a message suitable for the user"""
+    if "timeout" in error_msg.lower():
+        return 'Request timed out. Please try with a smaller image or try again later.'
+    elif "file is too large" in error_msg.lower():
+        return 'Image file is too large. Maximum size is 15MB.'
+    elif "invalid or corrupted" in error_msg.lower():
+        return 'The image file appears to be corrupted or in an unsupported format.'
+    elif "file not found" in error_msg.lower():
+        return 'The uploaded file could not be found. Please try uploading again.'
+    return f'Error processing document: {error_msg}'
+
+# Background extraction jobs (see JOB_* in .env.example)
+job_queue = JobQueue(
+    JobStore(os.getenv('JOB_STORE_PATH', os.path.join('jobs', 'jobs.db'))),
+    run_extraction,
+    max_workers=int(os.getenv('JOB_WORKERS', '2')),
+    max_pending=int(os.getenv('JOB_QUEUE_MAX', '20'))
+)
+
+# Stage timings, payload sizes and token usage, merged across workers for /metrics (see METRICS_* in .env.example)
+metrics_registry = get_registry()
+metrics_registry.gauge('extractor_job_queue_pending', lambda: {(): job_queue.stats()['pending']})
+
+@app.before_request
+def start_request():
+    g.request_id = new_request_id(request.headers.get('X-Request-ID'))
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def finish_request(response):
+    elapsed = time.perf_counter() - g.request_start
+    response.headers['X-Request-ID'] = g.request_id
+    metrics_registry.observe('extractor_http_request_seconds', elapsed,
+                             endpoint=request.endpoint or 'unknown', status=str(response.status_code))
+    if request.endpoint != 'prometheus_metrics':
+        print(f"[{g.request_id}] {request.method} {request.path} {response.status_code} {elapsed * 1000:.0f} ms")
+    return response
+
+def observe_upload(file):
+    """Record the size of an uploaded file's in-memory stream"""
+    position = file.stream.tell()
+    file.stream.seek(0, os.SEEK_END)
+    observe_bytes('upload', file.stream.tell())
+    file.stream.seek(position)
+
 @app.route('/', methods=['GET'])
 def index():
     return render_template('index.html')
@@ -38,57 +232,377 @@ def upload_file():
         flash('No selected file')
         return redirect(url_for('index'))
     
+    structured = structured_requested()
     if file and allowed_file(file.filename):
         try:
-            # Save the uploaded file
-            filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+            # Get selected model
+            model = request.form.get('model', app.config['DEFAULT_MODEL'])
+            mode = get_mode()
             
-            try:
-                # Get selected model
-                model = request.form.get('model', 'gpt4-vision')
-                
-                # Process the image using AI with selected model
-                info_extractor = AIInfoExtractor(model_choice=model)
-                extracted_info = info_extractor.extract_info(filepath)
-                
-                # Clean up the uploaded file
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-                
-                # Check if we got any results
-                if not extracted_info:
-                    flash('Could not extract any information from the document. Please ensure it is a clear image with readable text.')
-                    return redirect(url_for('index'))
-                
-                return render_template('results.html', results=extracted_info)
-                
-            except Exception as e:
-                # Clean up the uploaded file in case of processing error
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-                error_msg = str(e)
-                print(f"Processing error: {error_msg}")
-                if "timeout" in error_msg.lower():
-                    flash('Request timed out. Please try with a smaller image or try again later.')
-                elif "file is too large" in error_msg.lower():
-                    flash('Image file is too large. Maximum size is 15MB.')
-                elif "invalid or corrupted" in error_msg.lower():
-                    flash('The image file appears to be corrupted or in an unsupported format.')
-                elif "file not found" in error_msg.lower():
-                    flash('The uploaded file could not be found. Please try uploading again.')
-                else:
-                    flash(f'Error processing document: {error_msg}')
+            # Process the upload straight from its in-memory stream
+            observe_upload(file)
+            metrics = {}
+            extracted_info, cache_hit = run_extraction(file.stream, model, metrics, mode=mode, structured=structured)
+            
+            if structured:
+                # The typed result as JSON for API clients, see Document.to_dict
+                response = jsonify(extracted_info)
+                response.headers['X-Cache'] = 'HIT' if cache_hit else 'MISS'
+                return add_metrics_headers(response, metrics)
+            
+            # Check if we got any results
+            if not extracted_info:
+                flash('Could not extract any information from the document. Please ensure it is a clear image with readable text.')
                 return redirect(url_for('index'))
-                
+            
+            start = time.perf_counter()
+            with timer('render'):
+                response = make_response(render_template('results.html', results=extracted_info))
+            metrics['render_ms'] = round((time.perf_counter() - start) * 1000, 1)
+            response.headers['X-Cache'] = 'HIT' if cache_hit else 'MISS'
+            return add_metrics_headers(response, metrics)
+            
         except Exception as e:
-            print(f"Upload error: {str(e)}")
-            flash(f'Error uploading file: {str(e)}')
+            error_msg = str(e)
+            print(f"Processing error: {error_msg}")
+            if structured:
+                return jsonify({'error': friendly_error(error_msg)}), 400 if isinstance(e, ValueError) else 500
+            flash(friendly_error(error_msg))
             return redirect(url_for('index'))
     else:
-        flash('Invalid file type. Allowed types: PNG, JPG, JPEG, GIF, TIFF, BMP')
+        if structured:
+            return jsonify({'error': ALLOWED_TYPES_MESSAGE}), 400
+        flash(ALLOWED_TYPES_MESSAGE)
+        return redirect(url_for('index'))
+
+@app.route('/upload/stream', methods=['POST'])
+def upload_stream():
+    """Like /upload, but renders the results page progressively as rows arrive"""
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        flash('No selected file')
+        return redirect(url_for('index'))
+    if not allowed_file(file.filename):
+        flash(ALLOWED_TYPES_MESSAGE)
+        return redirect(url_for('index'))
+    try:
+        mode = get_mode()
+    except ValueError as e:
+        flash(str(e))
+        return redirect(url_for('index'))
+
+    observe_upload(file)
+    model = request.form.get('model', app.config['DEFAULT_MODEL'])
+    state = {'rows': 0, 'error': None, 'metrics': {}}
+    template = app.jinja_env.get_template('results_stream.html')
+    # Werkzeug closes upload streams when the request context is torn down, which happens
+    # before the response body is generated; detach the in-memory stream so it stays usable
+    source, file.stream = file.stream, io.BytesIO()
+    rows = stream_extraction(source, model, mode, state)
+    response = Response(stream_with_context(template.generate(results=rows, state=state)), mimetype='text/html')
+    response.headers['X-Accel-Buffering'] = 'no'  # Stop proxies from buffering the stream
+    return response
+
+def wants_html():
+    return request.accept_mimetypes.best_match(['application/json', 'text/html']) == 'text/html'
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue an upload for background extraction and return its job id immediately"""
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        error = 'No selected file'
+    elif not allowed_file(file.filename):
+        error = ALLOWED_TYPES_MESSAGE
+    else:
+        error = None
+    if error is None:
+        try:
+            mode = get_mode()
+        except ValueError as e:
+            error = str(e)
+    if error is None and structured_requested() and mode != 'structured':
+        error = 'format=structured requires the structured extraction mode'
+    if error:
+        if wants_html():
+            flash(error)
+            return redirect(url_for('index'))
+        return jsonify({'error': error}), 400
+
+    filename = secure_filename(file.filename)
+    # Prefix with a unique id so concurrent uploads with the same name don't collide
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}_{filename}")
+    with timer('save'):
+        file.save(filepath)
+    observe_bytes('upload', os.path.getsize(filepath))
+
+    try:
+        # Structured mode jobs keep the typed result; job views flatten it unless format=structured
+        job_id = job_queue.submit(filepath, request.form.get('model', app.config['DEFAULT_MODEL']), filename,
+                                  mode=mode, structured=mode == 'structured')
+    except QueueFullError as e:
+        os.remove(filepath)
+        if wants_html():
+            flash('The server is busy processing other documents. Please try again shortly.')
+            return redirect(url_for('index'))
+        response = jsonify({'error': str(e)})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+
+    if wants_html():
+        return redirect(url_for('job_results', job_id=job_id))
+    response = jsonify({
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': url_for('job_status', job_id=job_id, format='structured' if structured_requested() else None),
+        'results_url': url_for('job_results', job_id=job_id),
+    })
+    response.status_code = 202
+    response.headers['Location'] = url_for('job_status', job_id=job_id)
+    return response
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Job status and results; format=structured returns the typed result of structured mode jobs"""
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    structured = isinstance(job['result'], dict)
+    if structured_requested():
+        if job['status'] == DONE and not structured:
+            return jsonify({'error': 'Job was not extracted in structured mode'}), 400
+    elif structured:
+        job['result'] = document_items(job['result'])
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/results', methods=['GET'])
+def job_results(job_id):
+    """Render a job's results, or a self-refreshing progress page while it runs"""
+    job = job_queue.store.get(job_id)
+    if job is None:
+        flash('Job not found. It may have expired, please upload the document again.')
+        return redirect(url_for('index'))
+    if job['status'] == FAILED:
+        flash(friendly_error(job['error'] or 'Unknown error'))
         return redirect(url_for('index'))
+    if job['status'] == DONE:
+        if isinstance(job['result'], dict):
+            job['result'] = document_items(job['result'])
+        if not job['result']:
+            flash('Could not extract any information from the document. Please ensure it is a clear image with readable text.')
+            return redirect(url_for('index'))
+        with timer('render'):
+            response = make_response(render_template('results.html', results=job['result'], job=job))
+        response.headers['X-Cache'] = 'HIT' if job['cache_hit'] else 'MISS'
+        return add_metrics_headers(response, job['metrics'] or {})
+    return render_template('results.html', results=None, job=job)
+
+def export_response(records, name):
+    """
+    Stream records as the export `format` (csv, jsonl or parquet) and `table` (line_items
+    or documents) given in the query string or form
+    """
+    fmt = request.values.get('format', 'csv')
+    try:
+        chunks = export_chunks(records, fmt, request.values.get('table', 'line_items'))
+    except ImportError as e:
+        # A supported format this deployment lacks the optional package for
+        return jsonify({'error': str(e)}), 501
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+    response = Response(chunks, mimetype=CONTENT_TYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{name}.{fmt}"'
+    response.headers['X-Accel-Buffering'] = 'no'  # Stop proxies from buffering the stream
+    return response
+
+@app.route('/jobs/<job_id>/export', methods=['GET'])
+def job_export(job_id):
+    """Download a finished job's results as CSV, JSONL or Parquet"""
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] not in (DONE, FAILED):
+        return jsonify({'error': 'Job has not finished yet', 'status': job['status']}), 409
+    return export_response([record_from_job(job)], f"job_{job_id}")
+
+@app.route('/export', methods=['GET'])
+def export_jobs():
+    """
+    Stream the results of every job finished between `since` and `until` (Unix times,
+    optional) as CSV, JSONL or Parquet, reading the job store in batches
+    """
+    try:
+        since = float(request.args['since']) if request.args.get('since') else None
+        until = float(request.args['until']) if request.args.get('until') else None
+    except ValueError:
+        return jsonify({'error': 'since and until must be Unix timestamps'}), 400
+    records = (record_from_job(job) for job in job_queue.store.iter_finished(since, until))
+    return export_response(records, 'jobs')
+
+class BatchError(Exception):
+    """Raised when a batch upload cannot be accepted"""
+
+def save_batch_files(batch_dir):
+    """
+    Save the files and ZIP archive members of a batch upload into batch_dir.
+    Returns (documents, skipped) where documents is a list of (name, path).
+    """
+    documents = []
+    skipped = []
+
+    def add_document(name, source):
+        if len(documents) >= app.config['BATCH_MAX_FILES']:
+            raise BatchError(f"Too many files in batch (max {app.config['BATCH_MAX_FILES']})")
+        path = os.path.join(batch_dir, f"{len(documents):05d}_{secure_filename(os.path.basename(name)) or 'document'}")
+        with timer('save'), open(path, 'wb') as out:
+            shutil.copyfileobj(source, out)
+        observe_bytes('upload', os.path.getsize(path))
+        documents.append((name, path))
+
+    for file in request.files.getlist('files'):
+        if not file.filename:
+            continue
+        if allowed_file(file.filename):
+            add_document(file.filename, file.stream)
+        else:
+            skipped.append((file.filename, 'Invalid file type'))
+
+    for archive_file in request.files.getlist('archive'):
+        if not archive_file.filename:
+            continue
+        try:
+            with zipfile.ZipFile(archive_file.stream) as archive:
+                for member in archive.infolist():
+                    if member.is_dir():
+                        continue
+                    if not allowed_file(member.filename):
+                        skipped.append((member.filename, 'Invalid file type'))
+                    elif member.file_size > 15 * 1024 * 1024:
+                        skipped.append((member.filename, 'Image file is too large (max 15MB)'))
+                    else:
+                        with archive.open(member) as source:
+                            add_document(member.filename, source)
+        except zipfile.BadZipFile:
+            raise BatchError(f"{archive_file.filename} is not a valid ZIP archive")
+
+    return documents, skipped
+
+def process_batch_document(index, name, path, model, mode='ai'):
+    """Run one batch document through the pipeline, returning its NDJSON record"""
+    start = time.time()
+    record = {'index': index, 'filename': name}
+    try:
+        metrics = {}
+        results, cache_hit = run_extraction(path, model, metrics, mode=mode, structured=mode == 'structured')
+        if mode == 'structured':
+            # Keep the typed result next to the flattened items, exports read it directly
+            record['structured'], results = results, document_items(results)
+        record.update(status='done', results=results, cache_hit=cache_hit, metrics=metrics)
+    except Exception as e:
+        print(f"[{get_request_id()}] Batch document {name} failed: {str(e)}")
+        record.update(status='failed', error=friendly_error(str(e)))
+    record['elapsed_s'] = round(time.time() - start, 3)
+    return record
+
+@app.route('/batch', methods=['POST'])
+def batch_upload():
+    """
+    Extract a batch of documents (multi-file field 'files' and/or ZIP field 'archive')
+    concurrently, streaming one NDJSON record per document as each completes.
+    With a `format` field (csv, jsonl or parquet) the results are streamed as an export
+    of the `table` field instead (see export_response).
+    """
+    model = request.form.get('model', app.config['DEFAULT_MODEL'])
+    try:
+        mode = get_mode()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        concurrency = int(request.form.get('concurrency', app.config['BATCH_CONCURRENCY']))
+    except ValueError:
+        return jsonify({'error': 'concurrency must be an integer'}), 400
+    concurrency = max(1, min(concurrency, app.config['BATCH_MAX_CONCURRENCY']))
+
+    batch_dir = os.path.join(app.config['UPLOAD_FOLDER'], f"batch_{uuid.uuid4().hex}")
+    os.makedirs(batch_dir)
+    try:
+        documents, skipped = save_batch_files(batch_dir)
+    except BatchError as e:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        return jsonify({'error': str(e)}), 400
+    if not documents:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        return jsonify({'error': 'No valid files in batch', 'skipped': [name for name, _ in skipped]}), 400
+
+    def records():
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='batch-worker')
+        try:
+            futures = [
+                executor.submit(bind_context(process_batch_document), index, name, path, model, mode)
+                for index, (name, path) in enumerate(documents)
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # Also runs when the client disconnects mid-batch
+            executor.shutdown(wait=False, cancel_futures=True)
+            shutil.rmtree(batch_dir, ignore_errors=True)
+
+    if request.form.get('format'):
+        response = export_response(({'document': record['filename'], **record} for record in records()), 'batch')
+        if isinstance(response, tuple):
+            # Rejected before any document was extracted
+            shutil.rmtree(batch_dir, ignore_errors=True)
+            return response
+        response.headers['X-Batch-Size'] = str(len(documents))
+        return response
+
+    def generate():
+        start = time.time()
+        counts = {'done': 0, 'failed': 0, 'skipped': len(skipped)}
+        for name, reason in skipped:
+            yield json.dumps({'filename': name, 'status': 'skipped', 'error': reason}) + '\n'
+        for record in records():
+            counts[record['status']] += 1
+            yield json.dumps(record) + '\n'
+        yield json.dumps({'summary': dict(counts, elapsed_s=round(time.time() - start, 3))}) + '\n'
+
+    response = Response(generate(), mimetype='application/x-ndjson')
+    response.headers['X-Batch-Size'] = str(len(documents))
+    response.headers['X-Accel-Buffering'] = 'no'  # Stop proxies from buffering the stream
+    return response
+
+@app.route('/templates/observations/<observation_id>/confirm', methods=['POST'])
+def confirm_template_observation(observation_id):
+    """
+    Confirm a template-mode extraction (X-Template-Observation) as correct, or send the
+    corrected items as JSON {"results": [{"label", "value", "remarks"}, ...]}, so the
+    layout index learns from it
+    """
+    from modules.template_index import get_template_index
+
+    results = (request.get_json(silent=True) or {}).get('results')
+    if results is not None and not (isinstance(results, list) and all(isinstance(item, dict) for item in results)):
+        return jsonify({'error': 'results must be a list of label/value/remarks objects'}), 400
+    try:
+        template_id = get_template_index().confirm(observation_id, results)
+    except KeyError:
+        return jsonify({'error': 'Observation not found or expired'}), 404
+    return jsonify({'template_id': template_id})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus metrics of all workers: stage latency histograms, payload sizes, tokens, cache and jobs"""
+    jobs = {(('status', status),): count for status, count in job_queue.store.counts().items()}
+    body = metrics_registry.render(extra_gauges={'extractor_jobs': jobs})
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    if result_cache is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(result_cache.stats(), enabled=True))
 
 if __name__ == '__main__':
     print("Starting Flask application...")
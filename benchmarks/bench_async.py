@@ -0,0 +1,91 @@
+"""
+Compare the sync AIInfoExtractor (one thread per in-flight request) with
+AsyncAIInfoExtractor (one event loop) on N images against the local mock
+OpenRouter server, reporting throughput and p50/p95/p99 latency.
+
+Run from the repository root:
+    python -m benchmarks.bench_async --images 200 --concurrency 10 50 200
+"""
+import os
+import io
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('OPENROUTER_API_KEY', 'benchmark-key')
+os.environ['METRICS_DIR'] = ''  # Keep metrics in process, no snapshot files
+
+from PIL import Image
+from modules.info_extractor import AIInfoExtractor
+from modules.http_session import create_session
+from modules.async_extractor import AsyncAIInfoExtractor
+from benchmarks.common import summarize_latencies, print_table
+from benchmarks.mock_openrouter import start_mock_server
+
+
+def run_sync(image_path, url, total, concurrency):
+    extractor = AIInfoExtractor('gpt4-mini', session=create_session(pool_size=concurrency))
+    extractor.api_url = url
+
+    def one_call(_):
+        start = time.perf_counter()
+        extractor.extract_info(image_path)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(one_call, range(total)))
+    return summarize_latencies(latencies, time.perf_counter() - start)
+
+
+async def run_async(image_path, url, total, concurrency):
+    async with AsyncAIInfoExtractor('gpt4-mini', max_concurrency=concurrency) as extractor:
+        extractor.api_url = url
+
+        # Time each call from when it gets a slot, as the thread pool does for the sync client
+        slots = asyncio.Semaphore(concurrency)
+
+        async def one_call():
+            async with slots:
+                start = time.perf_counter()
+                await extractor.extract_info_async(image_path)
+                return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(one_call() for _ in range(total)))
+        return summarize_latencies(list(latencies), time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--latency', type=float, default=0.5, help='Mock API latency in seconds')
+    args = parser.parse_args()
+
+    server, url = start_mock_server(latency=args.latency)
+    with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as f:
+        Image.new('RGB', (400, 300), 'white').save(f, format='PNG')
+        image_path = f.name
+
+    rows = []
+    try:
+        for concurrency in args.concurrency:
+            with contextlib.redirect_stdout(io.StringIO()):
+                sync_result = run_sync(image_path, url, args.images, concurrency)
+                async_result = asyncio.run(run_async(image_path, url, args.images, concurrency))
+            rows.append(dict(sync_result, client='sync', concurrency=concurrency))
+            rows.append(dict(async_result, client='async', concurrency=concurrency))
+    finally:
+        server.shutdown()
+        os.remove(image_path)
+
+    print_table(rows, ['client', 'concurrency', 'requests', 'throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms'])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Measure /batch throughput for a batch of images at increasing concurrency
+against the local mock OpenRouter server.
+
+Run from the repository root:
+    python -m benchmarks.bench_batch --images 100 --concurrency 1 2 4 8 16
+"""
+import os
+import io
+import sys
+import time
+import argparse
+import contextlib
+
+os.environ.setdefault('OPENROUTER_API_KEY', 'benchmark-key')
+os.environ['RESULT_CACHE_BACKEND'] = 'none'  # Every image must reach the mock API
+os.environ['METRICS_DIR'] = ''  # Keep metrics in process, no snapshot files
+
+from PIL import Image
+from benchmarks.common import print_table
+from benchmarks.mock_openrouter import start_mock_server
+
+
+def make_images(count):
+    images = []
+    for i in range(count):
+        buf = io.BytesIO()
+        Image.new('RGB', (400, 300), (i % 256, (i * 7) % 256, (i * 13) % 256)).save(buf, format='PNG')
+        images.append(buf.getvalue())
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--latency', type=float, default=0.2, help='Mock API latency in seconds')
+    args = parser.parse_args()
+
+    import app as app_module
+    from modules.info_extractor import get_extractor
+
+    server, url = start_mock_server(latency=args.latency)
+    get_extractor('gpt4-mini').api_url = url
+    app_module.app.config['BATCH_MAX_CONCURRENCY'] = max(args.concurrency)
+    client = app_module.app.test_client()
+    images = make_images(args.images)
+
+    rows = []
+    try:
+        for concurrency in args.concurrency:
+            files = [(io.BytesIO(data), f"invoice_{i}.png") for i, data in enumerate(images)]
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                response = client.post('/batch', data={
+                    'model': 'gpt4-mini',
+                    'concurrency': str(concurrency),
+                    'files': files,
+                }, content_type='multipart/form-data')
+                records = sum(1 for _ in response.response)
+            elapsed = time.perf_counter() - start
+            rows.append({
+                'concurrency': concurrency,
+                'documents': records - 1,  # Last record is the summary
+                'elapsed_s': round(elapsed, 2),
+                'docs_per_s': round(args.images / elapsed, 2),
+                'speedup': round(rows[0]['elapsed_s'] / elapsed, 2) if rows else 1.0,
+            })
+    finally:
+        server.shutdown()
+
+    print_table(rows, ['concurrency', 'documents', 'elapsed_s', 'docs_per_s', 'speedup'])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
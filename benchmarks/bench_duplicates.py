@@ -0,0 +1,111 @@
+"""
+Measure the near-duplicate index: lookup latency, memory and recall of the in-memory
+hash index as it grows, and how well fingerprints tell re-scans of an invoice apart from
+other invoices on the same layout.
+
+Run from the repository root:
+    python -m benchmarks.bench_duplicates --entries 100000 1000000 --documents 20
+"""
+import io
+import sys
+import time
+import random
+import argparse
+
+from PIL import Image
+from benchmarks.common import percentile, print_table
+from create_test_image import draw_invoice_pages, invoice_items
+from modules.duplicate_index import MultiIndexHash, image_fingerprint, signature_difference, hamming
+
+
+def index_rows(sizes, queries, radius, seed):
+    rng = random.Random(seed)
+    rows = []
+    for size in sizes:
+        keys = [rng.getrandbits(64) for _ in range(size)]
+        index = MultiIndexHash(capacity=size)
+        start = time.perf_counter()
+        index.add_many(keys, list(range(size)), [time.time()] * size)
+        load_s = time.perf_counter() - start
+
+        latencies, found = [], 0
+        for _ in range(queries):
+            target = rng.randrange(size)
+            query = keys[target]
+            for bit in rng.sample(range(64), rng.randint(0, radius)):
+                query ^= 1 << bit
+            start = time.perf_counter()
+            results = index.search(query, radius)
+            latencies.append(time.perf_counter() - start)
+            found += any(value == target for _, value in results)
+        rows.append({
+            'entries': size,
+            'memory_mb': round(index.nbytes / 1e6, 1),
+            'load_s': round(load_s, 2),
+            'p50_us': round(percentile(latencies, 50) * 1e6),
+            'p99_us': round(percentile(latencies, 99) * 1e6),
+            'recall': round(found / queries, 3),
+        })
+    return rows
+
+
+def scan(page, dpi, rescan_dpi=None, angle=0.0, jpeg_quality=None):
+    """A page as it comes back from another scan: resolution, rotation and JPEG compression"""
+    if rescan_dpi:
+        page = page.resize((page.width * rescan_dpi // dpi, page.height * rescan_dpi // dpi), Image.BILINEAR)
+    if angle:
+        page = page.rotate(angle, fillcolor='white')
+    if jpeg_quality:
+        buffer = io.BytesIO()
+        page.save(buffer, format='JPEG', quality=jpeg_quality)
+        page = Image.open(buffer)
+    page.thumbnail((1024, 1024))  # Roughly what encode_image keeps
+    return page
+
+
+def detection_rows(documents, max_distance, max_difference):
+    originals = []
+    for seed in range(documents):
+        rows, _ = invoice_items(8, seed)
+        originals.append(draw_invoice_pages(rows, seed=seed, dpi=150)[0])
+    fingerprints = [image_fingerprint(scan(page, 150)) for page in originals]
+
+    def matches(a, b):
+        return hamming(a[0], b[0]) <= max_distance and signature_difference(a[1], b[1]) <= max_difference
+
+    rows = []
+    variants = (('300 dpi', {'rescan_dpi': 300}), ('rotated 1.5', {'angle': 1.5}),
+                ('jpeg q40', {'jpeg_quality': 40}), ('200 dpi, rotated, jpeg', {'rescan_dpi': 200, 'angle': -1.0, 'jpeg_quality': 60}))
+    for name, options in variants:
+        pages = [scan(page, 150, **options) for page in originals]
+        start = time.perf_counter()
+        rescans = [image_fingerprint(page) for page in pages]
+        fingerprint_ms = (time.perf_counter() - start) * 1000 / documents
+        same = sum(matches(rescan, original) for rescan, original in zip(rescans, fingerprints))
+        other = sum(matches(rescan, original) for i, rescan in enumerate(rescans)
+                    for j, original in enumerate(fingerprints) if i != j)
+        rows.append({'rescan': name, 'found': f"{same}/{documents}",
+                     'false_matches': f"{other}/{documents * (documents - 1)}",
+                     'fingerprint_ms': round(fingerprint_ms, 1)})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--radius', type=int, default=6, help='Hamming radius (DEDUP_MAX_DISTANCE)')
+    parser.add_argument('--max-difference', type=float, default=24.0, help='DEDUP_MAX_DIFFERENCE')
+    parser.add_argument('--documents', type=int, default=20, help='Invoices for the detection test')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print_table(index_rows(args.entries, args.queries, args.radius, args.seed),
+                ['entries', 'memory_mb', 'load_s', 'p50_us', 'p99_us', 'recall'])
+    print()
+    print_table(detection_rows(args.documents, args.radius, args.max_difference),
+                ['rescan', 'found', 'false_matches', 'fingerprint_ms'])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+Measure encode time and peak RSS per request for the previous save-to-disk
+upload path against the in-memory streaming path.
+
+Each case runs in a fresh process so peak RSS is not polluted by earlier runs.
+Run from the repository root:
+    python -m benchmarks.bench_encode --repeat 3
+"""
+import os
+import io
+import sys
+import json
+import time
+import base64
+import importlib
+import resource
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+
+os.environ.setdefault('OPENROUTER_API_KEY', 'benchmark-key')
+os.environ['METRICS_DIR'] = ''  # Keep metrics in process, no snapshot files
+
+from PIL import Image
+from benchmarks.common import print_table
+
+
+def make_inputs(directory):
+    """Write the benchmark images and return {name: path}"""
+    inputs = {}
+    # Phone photo of an invoice: large JPEG, must be downscaled
+    photo = Image.linear_gradient('L').resize((4000, 3000)).convert('RGB')
+    inputs['photo-4000x3000.jpg'] = (photo, 'JPEG')
+    # Scanner output already within the size cap
+    scan = Image.linear_gradient('L').resize((1600, 2000)).convert('RGB')
+    inputs['scan-1600x2000.jpg'] = (scan, 'JPEG')
+    # A4 page at 300 dpi as PNG
+    page = Image.new('RGB', (2480, 3508), 'white')
+    page.paste(Image.linear_gradient('L').resize((2000, 400)).convert('RGB'), (240, 400))
+    inputs['page-2480x3508.png'] = (page, 'PNG')
+
+    paths = {}
+    for name, (img, fmt) in inputs.items():
+        path = os.path.join(directory, name)
+        img.save(path, format=fmt, quality=90)
+        paths[name] = path
+    return paths
+
+
+def legacy_request_body(upload_bytes, directory):
+    """The previous pipeline: save upload to disk, reopen, re-encode, base64 str, JSON"""
+    from modules.prompts import EXTRACTION_PROMPT
+    filepath = os.path.join(directory, 'upload')
+    with open(filepath, 'wb') as f:  # file.save(filepath)
+        f.write(upload_bytes)
+
+    with Image.open(filepath) as img:
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        max_size = 2048
+        if img.width > max_size or img.height > max_size:
+            ratio = min(max_size/img.width, max_size/img.height)
+            img = img.resize((int(img.width * ratio), int(img.height * ratio)), Image.LANCZOS)
+        buffered = io.BytesIO()
+        img.save(buffered, format="JPEG")
+        base64_image = base64.b64encode(buffered.getvalue()).decode('utf-8')
+
+    data = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": [
+        {"type": "text", "text": EXTRACTION_PROMPT},
+        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}},
+    ]}]}
+    print(f"\nSending request with data: {json.dumps(data, indent=2)}")  # Debug print in the old code
+    body = json.dumps(data).encode('utf-8')  # What requests does with json=
+    os.remove(filepath)
+    return len(body)
+
+
+def streaming_request_body(upload_bytes, directory):
+    """The current pipeline: encode straight from the upload stream into the body"""
+    from modules.info_extractor import AIInfoExtractor
+    extractor = AIInfoExtractor('gpt4-mini')
+    stream = io.BytesIO(upload_bytes)  # Werkzeug keeps single uploads in memory
+    encoded, image_info = extractor.prepare_image(stream)
+    body = extractor.build_request_body(encoded, image_info['mime'])
+    return body.getbuffer().nbytes
+
+
+def peak_rss_kb():
+    """Peak RSS of this process in KB"""
+    # VmHWM is reset by exec, unlike ru_maxrss which keeps the forking parent's peak
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_case(mode, path, repeat, queue):
+    # Load the extractor modules up front so the baseline includes their memory
+    importlib.import_module('modules.info_extractor')
+    with open(path, 'rb') as f:
+        upload_bytes = f.read()
+    baseline_kb = peak_rss_kb()
+    func = legacy_request_body if mode == 'legacy' else streaming_request_body
+
+    timings = []
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                body_bytes = func(upload_bytes, directory)
+            timings.append(time.perf_counter() - start)
+    peak_kb = peak_rss_kb()
+    queue.put({
+        'encode_ms': round(min(timings) * 1000, 1),
+        'peak_rss_mb': round((peak_kb - baseline_kb) / 1024, 1),
+        'body_kb': round(body_bytes / 1024, 1),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name, path in make_inputs(directory).items():
+            for mode in ('legacy', 'streaming'):
+                queue = context.Queue()
+                process = context.Process(target=run_case, args=(mode, path, args.repeat, queue))
+                process.start()
+                result = queue.get()
+                process.join()
+                rows.append(dict(result, image=name, mode=mode, input_kb=round(os.path.getsize(path) / 1024, 1)))
+
+    print("peak_rss_mb is the growth in peak RSS over the process baseline after loading the upload")
+    print_table(rows, ['image', 'mode', 'input_kb', 'body_kb', 'encode_ms', 'peak_rss_mb'])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
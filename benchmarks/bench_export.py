@@ -0,0 +1,97 @@
+"""
+Measure result exports: time, output size and peak memory of exporting many documents
+as CSV, JSONL and Parquet, for the line item and document tables, from a job store
+filled with synthetic results.
+
+Run from the repository root:
+    python -m benchmarks.bench_export --documents 100000 --line-items 10
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+
+os.environ['METRICS_DIR'] = ''  # Keep metrics in process, no snapshot files
+
+from benchmarks.common import print_table
+from create_test_image import invoice_items
+from modules.exporters import EXPORT_FORMATS, export_chunks, record_from_job
+from modules.job_queue import JobStore
+
+
+class PeakRSS:
+    """Highest resident set size seen while the block runs, sampled from /proc"""
+
+    def __enter__(self):
+        self.peak = self.base = self._rss()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+
+    def _sample(self):
+        while not self._done.wait(0.01):
+            self.peak = max(self.peak, self._rss())
+
+    @staticmethod
+    def _rss():
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def fill_store(store, documents, line_items):
+    """Finished jobs with the results of a few distinct invoices, inserted in one transaction"""
+    variants = [json.dumps(invoice_items(line_items, seed)[1]) for seed in range(16)]
+    now = time.time()
+    conn = store._connection()
+    conn.executemany(
+        "INSERT INTO jobs (id, status, model, filename, result, cache_hit, worker_pid, created_at, finished_at) "
+        "VALUES (?, 'done', 'gpt-4o-mini', ?, ?, 0, 0, ?, ?)",
+        ((f"job{n:08d}", f"invoice_{n:08d}.png", variants[n % len(variants)], now, now + n / 1000)
+         for n in range(documents)))
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=100000)
+    parser.add_argument('--line-items', type=int, default=10)
+    parser.add_argument('--formats', nargs='+', choices=EXPORT_FORMATS, default=list(EXPORT_FORMATS))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = JobStore(os.path.join(directory, 'jobs.db'))
+        start = time.perf_counter()
+        fill_store(store, args.documents, args.line_items)
+        print(f"Job store with {args.documents} documents written in {time.perf_counter() - start:.1f}s")
+
+        rows = []
+        for fmt in args.formats:
+            for table in ('line_items', 'documents'):
+                path = os.path.join(directory, f"export.{fmt}")
+                records = (record_from_job(job) for job in store.iter_finished())
+                with PeakRSS() as rss, open(path, 'wb') as out:
+                    start = time.perf_counter()
+                    try:
+                        for chunk in export_chunks(records, fmt, table):
+                            out.write(chunk)
+                    except Exception as e:
+                        print(f"{fmt} export skipped: {str(e)}")
+                        break
+                    elapsed = time.perf_counter() - start
+                rows.append({'format': fmt, 'table': table, 'seconds': round(elapsed, 2),
+                             'docs_per_s': round(args.documents / elapsed),
+                             'output_mb': round(os.path.getsize(path) / 1e6, 1),
+                             'peak_mb': round((rss.peak - rss.base) / 1e6, 1)})
+        print_table(rows, ['format', 'table', 'seconds', 'docs_per_s', 'output_mb', 'peak_mb'])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+Compare per-request extractor construction with module-level requests.post
+against the shared, pooled extractors from get_extractor().
+
+Run from the repository root:
+    python -m benchmarks.bench_http_pool --requests 90 --threads 9
+"""
+import os
+import io
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from PIL import Image
+
+os.environ.setdefault('OPENROUTER_API_KEY', 'benchmark-key')
+os.environ['METRICS_DIR'] = ''  # Keep metrics in process, no snapshot files
+
+from modules.info_extractor import AIInfoExtractor, get_extractor
+from benchmarks.common import summarize_latencies, print_table
+from benchmarks.mock_openrouter import start_mock_server
+
+
+def run(make_extractor, image_path, url, total, threads):
+    def one_call(_):
+        extractor = make_extractor()
+        extractor.api_url = url
+        start = time.perf_counter()
+        extractor.extract_info(image_path)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(one_call, range(total)))
+    return summarize_latencies(latencies, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=90)
+    parser.add_argument('--threads', type=int, default=9, help='Concurrent callers (workers x threads)')
+    parser.add_argument('--latency', type=float, default=0.05, help='Mock API latency in seconds')
+    args = parser.parse_args()
+
+    server, url = start_mock_server(latency=args.latency)
+    with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as f:
+        Image.new('RGB', (400, 300), 'white').save(f, format='PNG')
+        image_path = f.name
+
+    # The module-level requests API opens a new connection for every call,
+    # which is what the app did before extractors shared a pooled session
+    modes = [
+        ('per-request', lambda: AIInfoExtractor('gpt4-mini', session=requests)),
+        ('pooled', lambda: get_extractor('gpt4-mini')),
+    ]
+    rows = []
+    try:
+        for name, make_extractor in modes:
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = run(make_extractor, image_path, url, args.requests, args.threads)
+            result['mode'] = name
+            rows.append(result)
+    finally:
+        server.shutdown()
+        os.remove(image_path)
+
+    print_table(rows, ['mode', 'requests', 'throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Measure OCR preprocessing with and without reused buffers for several pipelines,
+then the throughput of OCRProcessor.process_batch as worker processes are added.
+
+Recognition is included when Tesseract is available (tesserocr or the tesseract CLI);
+otherwise the scaling run covers loading and preprocessing only.
+Run from the repository root:
+    python -m benchmarks.bench_ocr --images 64 --dpi 200 --workers 1 2 4 8
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+os.environ['METRICS_DIR'] = ''  # Keep metrics in process, no snapshot files
+
+import pytesseract
+from benchmarks.common import print_table
+from create_test_image import create_invoice
+from modules.ocr_processor import OCRProcessor, PreprocessBuffers
+
+
+def make_corpus(directory, images, dpi):
+    paths = []
+    for n in range(images):
+        path = os.path.join(directory, f"scan_{n:04d}.png")
+        # Every other page scanned slightly crooked and blurred
+        create_invoice(path, line_items=10, dpi=dpi, seed=n, noise=1.5 if n % 2 else 0.0)
+        paths.append(path)
+    return paths
+
+
+def tesseract_available(processor):
+    if processor.engine == 'tesserocr':
+        return True
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=64)
+    parser.add_argument('--dpi', type=int, default=200)
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument('--pipelines', nargs='+', default=['threshold,dilate,median', 'deskew,threshold,dilate,median'],
+                        help='Comma separated preprocessing stages per pipeline')
+    parser.add_argument('--chunksize', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = make_corpus(directory, args.images, args.dpi)
+
+        rows = []
+        for pipeline in args.pipelines:
+            processor = OCRProcessor(pipeline=pipeline.split(','))
+            images = [processor.load_image(path) for path in paths[:16]]
+            for name, buffers in (('allocate', None), ('reuse', PreprocessBuffers())):
+                start = time.perf_counter()
+                for image in images:
+                    processor.preprocess_image(image, buffers)
+                elapsed = time.perf_counter() - start
+                rows.append({'pipeline': pipeline, 'buffers': name,
+                             'ms_per_image': round(elapsed * 1000 / len(images), 2)})
+        print_table(rows, ['pipeline', 'buffers', 'ms_per_image'])
+
+        processor = OCRProcessor()
+        recognize = tesseract_available(processor)
+        print(f"\nBatch run on {os.cpu_count()} CPUs, engine {processor.engine}, "
+              f"{'with' if recognize else 'WITHOUT (Tesseract not found)'} recognition")
+        rows = []
+        baseline = None
+        for workers in args.workers:
+            start = time.perf_counter()
+            results = list(processor.process_batch(paths, workers=workers, chunksize=args.chunksize,
+                                                   recognize=recognize))
+            elapsed = time.perf_counter() - start
+            rate = len(paths) / elapsed
+            baseline = baseline or rate
+            rows.append({'workers': workers, 'images': len(results),
+                         'failed': sum(1 for result in results if result['error']),
+                         'images_per_s': round(rate, 2), 'speedup': round(rate / baseline, 2)})
+        print_table(rows, ['workers', 'images', 'failed', 'images_per_s', 'speedup'])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
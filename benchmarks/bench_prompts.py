@@ -0,0 +1,99 @@
+"""
+Compare the prompt profiles (PROMPT_PROFILE full, compact and terse) against the mock API:
+prompt, cached and completion tokens per document, latency and whether the results read
+back match the expected items.
+
+The mock reports usage at about 4 characters of text per token plus a fixed cost per image,
+counts prompt parts marked for caching as cached once seen (if they reach the providers'
+1024-token minimum), takes --prompt-delay seconds per 1000 uncached prompt tokens and
+generates 64 completion characters every --chunk-delay seconds, so shorter prompts and
+outputs answer sooner. Run from the repository root:
+    python -m benchmarks.bench_prompts --line-items 10 50 --model gemini-flash
+
+With --live the requests go to the real API instead (OPENROUTER_API_KEY must be set and
+each request is billed), so cached_tokens is what the provider actually read from its
+prompt cache:
+    python -m benchmarks.bench_prompts --live --line-items 10 --repeat 2
+"""
+import os
+import sys
+import time
+import argparse
+import contextlib
+import io
+
+os.environ.setdefault('OPENROUTER_API_KEY', 'benchmark-key')
+os.environ.setdefault('DEDUP_MODE', 'off')
+os.environ['METRICS_DIR'] = ''  # Keep metrics in process, no snapshot files
+
+import numpy as np
+from benchmarks.common import print_table
+from benchmarks.mock_openrouter import start_mock_server
+from create_test_image import draw_invoice_pages, invoice_items
+from modules.info_extractor import AIInfoExtractor
+from modules.prompts import PROMPT_PROFILES, get_profile
+
+
+def matches(results, expected):
+    """Expected label/value pairs returned, out of all expected"""
+    returned = {(item['label'], item['value']) for item in results}
+    return f"{sum(1 for item in expected if (item['label'], item['value']) in returned)}/{len(expected)}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='gemini-flash', choices=list(AIInfoExtractor.MODELS))
+    parser.add_argument('--profiles', nargs='+', choices=PROMPT_PROFILES, default=list(PROMPT_PROFILES))
+    parser.add_argument('--line-items', type=int, nargs='+', default=[10, 50])
+    parser.add_argument('--remarks', action='store_true', help='Ask the terse profile for remarks')
+    parser.add_argument('--latency', type=float, default=0.2, help='Mock time to first token in seconds')
+    parser.add_argument('--prompt-delay', type=float, default=0.05, help='Mock seconds per 1000 uncached prompt tokens')
+    parser.add_argument('--chunk-delay', type=float, default=0.02, help='Mock seconds per 64 completion characters')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--live', action='store_true', help='Send the requests to the real API (billed)')
+    args = parser.parse_args()
+    if args.live and os.environ['OPENROUTER_API_KEY'] == 'benchmark-key':
+        print("--live needs a real OPENROUTER_API_KEY", file=sys.stderr)
+        return 2
+
+    rows = []
+    for count in args.line_items:
+        items, expected = invoice_items(count, args.seed)
+        image = draw_invoice_pages(items, seed=args.seed, dpi=150)[0]
+        server = url = None
+        if not args.live:
+            server, url = start_mock_server(latency=args.latency, items=expected, chunk_delay=args.chunk_delay,
+                                            prompt_delay=args.prompt_delay)
+        try:
+            for name in args.profiles:
+                extractor = AIInfoExtractor(args.model, profile=get_profile(name, args.remarks))
+                extractor.api_url = url or extractor.api_url
+                seconds, usage = [], []
+                for _ in range(args.repeat):
+                    metrics = {}
+                    start = time.perf_counter()
+                    with contextlib.redirect_stdout(io.StringIO()):  # Extractor logs
+                        results = extractor.extract_info(image, metrics=metrics)
+                    seconds.append(time.perf_counter() - start)
+                    usage.append(metrics)
+                # The first request fills the prompt cache; report a warm one
+                warm = usage[-1]
+                profile = extractor.profile
+                rows.append({'line_items': count,
+                             'profile': profile.name + ('+remarks' if profile.terse and profile.remarks else ''),
+                             'prompt_chars': len(profile.prompt),
+                             'prompt_tokens': warm.get('prompt_tokens'),
+                             'cached_tokens': warm.get('cached_tokens', 0),
+                             'completion_tokens': warm.get('completion_tokens'),
+                             'median_s': round(float(np.median(seconds)), 2),
+                             'found': matches(results, expected)})
+        finally:
+            if server is not None:
+                server.shutdown()
+    print_table(rows, ['line_items', 'profile', 'prompt_chars', 'prompt_tokens', 'cached_tokens',
+                       'completion_tokens', 'median_s', 'found'])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Compare a single model with the model router (hedged requests, fallback and circuit
+breaking) against two local mock providers with a long latency tail, with and
+without one provider failing part of its requests.
+
+Run from the repository root:
+    python -m benchmarks.bench_router --requests 200 --threads 8 --slow-rate 0.05 --slow-latency 3
+"""
+import os
+import io
+import sys
+import time
+import argparse
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('OPENROUTER_API_KEY', 'benchmark-key')
+os.environ.setdefault('HTTP_MAX_RETRIES', '0')
+os.environ['METRICS_DIR'] = ''  # Keep metrics in process, no snapshot files
+
+from PIL import Image
+from modules.info_extractor import get_extractor
+from modules.model_router import ModelRouter
+from benchmarks.common import print_table, summarize_latencies
+from benchmarks.mock_openrouter import start_mock_server
+
+
+def run(extract, image_bytes, requests, threads):
+    def one(_):
+        start = time.perf_counter()
+        try:
+            extract(io.BytesIO(image_bytes))
+            return time.perf_counter() - start, True
+        except Exception:
+            return time.perf_counter() - start, False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        outcomes = list(executor.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    row = summarize_latencies([latency for latency, ok in outcomes if ok], elapsed)
+    row['failed'] = sum(1 for _, ok in outcomes if not ok)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.1, help='Mock base latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.2, help='Mock extra uniform delay in seconds')
+    parser.add_argument('--slow-rate', type=float, default=0.05, help='Share of requests stalling')
+    parser.add_argument('--slow-latency', type=float, default=3.0, help='Extra delay of a stalled request')
+    parser.add_argument('--error-rate', type=float, default=0.3, help='Failure rate of the degraded provider')
+    parser.add_argument('--hedge-max-ms', type=float, default=1000.0, help='Longest wait before hedging')
+    args = parser.parse_args()
+
+    buf = io.BytesIO()
+    Image.new('RGB', (400, 300), 'white').save(buf, format='PNG')
+    image_bytes = buf.getvalue()
+
+    primary = get_extractor('gemini-flash')
+    alternate = get_extractor('gpt4-mini')
+    servers = []
+    rows = []
+    try:
+        for scenario, error_rate in (('healthy', 0.0), ('degraded', args.error_rate)):
+            tail = {'latency': args.latency, 'jitter': args.jitter,
+                    'slow_rate': args.slow_rate, 'slow_latency': args.slow_latency}
+            primary_server, primary_url = start_mock_server(error_rate=error_rate, **tail)
+            alternate_server, alternate_url = start_mock_server(**tail)
+            servers += [primary_server, alternate_server]
+            primary.api_url, alternate.api_url = primary_url, alternate_url
+
+            router = ModelRouter(models=['gemini-flash', 'gpt4-mini'], hedge_min_ms=0, hedge_default_ms=1000,
+                                 hedge_max_ms=args.hedge_max_ms)
+            for name, extract in (('single model', primary.extract_info), ('router', router.extract_info)):
+                # Extractor logs would interleave with the table, including those of hedges
+                # cancelled after their request returned, so wait for those inside the redirect
+                with contextlib.redirect_stdout(io.StringIO()):
+                    row = run(extract, image_bytes, args.requests, args.threads)
+                    if extract == router.extract_info:
+                        router.close()
+                # Streams of losing hedges closed before the end
+                aborted = sum(server.config['aborted'] for server in (primary_server, alternate_server))
+                for server in (primary_server, alternate_server):
+                    server.config['aborted'] = 0
+                rows.append(dict(row, scenario=scenario, client=name, aborted=aborted))
+    finally:
+        for server in servers:
+            server.shutdown()
+
+    print_table(rows, ['scenario', 'client', 'failed', 'aborted', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
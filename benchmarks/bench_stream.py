@@ -0,0 +1,104 @@
+"""
+Compare time-to-first-row and total time of the buffered extract_info call
+with the streaming stream_info call for invoices of increasing length,
+against the local mock OpenRouter server generating tokens at a fixed rate.
+
+Run from the repository root:
+    python -m benchmarks.bench_stream --line-items 10 50 150 --chunk-delay 0.01
+"""
+import os
+import io
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+
+os.environ.setdefault('OPENROUTER_API_KEY', 'benchmark-key')
+os.environ['METRICS_DIR'] = ''  # Keep metrics in process, no snapshot files
+
+from PIL import Image
+from modules.info_extractor import AIInfoExtractor
+from modules.json_stream import JSONArrayStreamParser
+from benchmarks.common import print_table
+from benchmarks.mock_openrouter import start_mock_server, CANNED_ITEMS
+
+
+def make_items(line_items):
+    items = list(CANNED_ITEMS[:2])
+    for n in range(1, line_items + 1):
+        items += [
+            {"label": f"Line Item {n} - Product", "value": f"Product {n}", "remarks": ""},
+            {"label": f"Line Item {n} - Quantity", "value": str(n), "remarks": ""},
+            {"label": f"Line Item {n} - Rate", "value": "120.00", "remarks": ""},
+            {"label": f"Line Item {n} - Amount", "value": f"{n * 120}.00", "remarks": ""},
+        ]
+    return items + list(CANNED_ITEMS[-1:])
+
+
+def run_buffered(extractor, image_path):
+    start = time.perf_counter()
+    rows = extractor.extract_info(image_path)
+    elapsed = (time.perf_counter() - start) * 1000
+    return {'rows': len(rows), 'first_row_ms': round(elapsed, 1), 'total_ms': round(elapsed, 1)}
+
+
+def run_streaming(extractor, image_path):
+    start = time.perf_counter()
+    first = None
+    rows = 0
+    for _ in extractor.stream_info(image_path):
+        rows += 1
+        if first is None:
+            first = (time.perf_counter() - start) * 1000
+    return {'rows': rows, 'first_row_ms': round(first or 0, 1),
+            'total_ms': round((time.perf_counter() - start) * 1000, 1)}
+
+
+def parser_throughput(items):
+    """MB/s of the incremental parser on a completion fed in 64 character chunks"""
+    import json
+    content = json.dumps(items)
+    chunks = [content[i:i + 64] for i in range(0, len(content), 64)]
+    start = time.perf_counter()
+    for _ in range(20):
+        parser = JSONArrayStreamParser()
+        for chunk in chunks:
+            parser.feed(chunk)
+    return round(20 * len(content) / (time.perf_counter() - start) / 1e6, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--line-items', type=int, nargs='+', default=[10, 50, 150])
+    parser.add_argument('--latency', type=float, default=0.3, help='Mock time before the first token in seconds')
+    parser.add_argument('--chunk-delay', type=float, default=0.01, help='Mock seconds per 64 characters generated')
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as f:
+        Image.new('RGB', (400, 300), 'white').save(f, format='PNG')
+        image_path = f.name
+
+    rows = []
+    try:
+        for line_items in args.line_items:
+            items = make_items(line_items)
+            server, url = start_mock_server(latency=args.latency, items=items, chunk_delay=args.chunk_delay)
+            extractor = AIInfoExtractor('gpt4-mini')
+            extractor.api_url = url
+            try:
+                for mode, run in (('buffered', run_buffered), ('streaming', run_streaming)):
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        result = run(extractor, image_path)
+                    rows.append(dict(result, line_items=line_items, mode=mode))
+            finally:
+                server.shutdown()
+            rows[-1]['parse_mb_s'] = parser_throughput(items)
+    finally:
+        os.remove(image_path)
+
+    print_table(rows, ['line_items', 'mode', 'rows', 'first_row_ms', 'total_ms', 'parse_mb_s'])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
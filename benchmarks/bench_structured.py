@@ -0,0 +1,89 @@
+"""
+Compare decoding a completion and reading its line items through the existing
+free-text path (parse_response, then re-parsing "Line Item N - X" labels) with
+the structured path (json.loads, validate_document, then attribute access).
+
+Run from the repository root:
+    python -m benchmarks.bench_structured --line-items 10 50 150
+"""
+import os
+import io
+import re
+import sys
+import json
+import time
+import argparse
+import contextlib
+
+os.environ.setdefault('OPENROUTER_API_KEY', 'benchmark-key')
+os.environ['METRICS_DIR'] = ''  # Keep metrics in process, no snapshot files
+
+from modules.info_extractor import AIInfoExtractor
+from modules.structured_output import validate_document
+from benchmarks.common import print_table
+from benchmarks.mock_openrouter import CANNED_DOCUMENT
+
+_LINE_ITEM_LABEL = re.compile(r'^Line Item (\d+) - (.+)$')
+
+
+def make_document(line_items):
+    template = CANNED_DOCUMENT['line_items'][0]
+    document = dict(CANNED_DOCUMENT, line_items=[])
+    for n in range(1, line_items + 1):
+        document['line_items'].append(dict(template, description=f"Product {n}", quantity=str(n),
+                                           amount=f"{n * 120}.00"))
+    return document
+
+
+def free_text_path(extractor, result):
+    """Legacy flow: scrape the JSON array out of the content, then pivot the labels"""
+    rows = {}
+    for item in extractor.parse_response(result):
+        match = _LINE_ITEM_LABEL.match(item['label'])
+        if match:
+            rows.setdefault(int(match.group(1)), {})[match.group(2)] = item['value']
+    return sum(float(row.get('Amount', '0').replace(',', '')) for row in rows.values())
+
+
+def structured_path(result):
+    document = validate_document(json.loads(result['choices'][0]['message']['content']))
+    return sum(float(item.amount.replace(',', '')) for item in document.line_items)
+
+
+def time_ms(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--line-items', type=int, nargs='+', default=[10, 50, 150])
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    extractor = AIInfoExtractor('gpt4-mini')
+    rows = []
+    for line_items in args.line_items:
+        document = make_document(line_items)
+        structured = {'choices': [{'message': {'content': json.dumps(document)}}]}
+        free_text = {'choices': [{'message': {
+            'content': "```json\n" + json.dumps(validate_document(document).to_items(), indent=2) + "\n```"}}]}
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert free_text_path(extractor, free_text) == structured_path(structured)
+            legacy_ms = time_ms(lambda: free_text_path(extractor, free_text), args.repeat)
+        structured_ms = time_ms(lambda: structured_path(structured), args.repeat)
+        rows.append({
+            'line_items': line_items,
+            'free_text_ms': round(legacy_ms, 3),
+            'structured_ms': round(structured_ms, 3),
+            'speedup': round(legacy_ms / structured_ms, 1),
+        })
+
+    print_table(rows, ['line_items', 'free_text_ms', 'structured_ms', 'speedup'])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
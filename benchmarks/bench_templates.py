@@ -0,0 +1,69 @@
+"""
+Measure template lookup time in the LSH index against a linear scan
+as the number of stored layouts grows.
+
+Layouts are simulated as random 256-bit layout hashes; each query is a
+noisy copy of a stored layout (a rescan of a known supplier's invoice).
+Run from the repository root:
+    python -m benchmarks.bench_templates --templates 1000 10000 50000
+"""
+import sys
+import time
+import random
+import argparse
+
+from benchmarks.common import print_table
+from modules.template_index import LSHIndex, hamming
+
+
+def flip_bits(value, count, bits, rng):
+    for position in rng.sample(range(bits), count):
+        value ^= 1 << position
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--templates', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--radius', type=int, default=32)
+    parser.add_argument('--noise', type=int, default=12, help='bits flipped between a layout and its rescans')
+    args = parser.parse_args()
+
+    bits = 256
+    rng = random.Random(42)
+    rows = []
+    for count in args.templates:
+        hashes = [rng.getrandbits(bits) for _ in range(count)]
+        index = LSHIndex()
+        start = time.perf_counter()
+        for template_id, value in enumerate(hashes):
+            index.add(value, template_id)
+        build_s = time.perf_counter() - start
+
+        queries = [(i, flip_bits(hashes[i], args.noise, bits, rng)) for i in rng.sample(range(count), args.queries)]
+
+        start = time.perf_counter()
+        lsh_hits = sum(1 for expected, query in queries
+                        if any(value == expected for _, value in index.search(query, args.radius)))
+        lsh_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        start = time.perf_counter()
+        for _, query in queries:
+            [i for i, value in enumerate(hashes) if hamming(query, value) <= args.radius]
+        linear_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        rows.append({
+            'templates': count,
+            'build_s': round(build_s, 2),
+            'lsh_ms': round(lsh_ms, 3),
+            'linear_ms': round(linear_ms, 3),
+            'speedup': round(linear_ms / lsh_ms, 1) if lsh_ms else '',
+            'recall': round(lsh_hits / len(queries), 3),
+        })
+
+    print_table(rows, ['templates', 'build_s', 'lsh_ms', 'linear_ms', 'speedup', 'recall'])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
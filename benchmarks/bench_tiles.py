@@ -0,0 +1,105 @@
+"""
+Compare extracting dense pages in one request against region tiling (EXTRACTION_MODE=tiled)
+against the mock API: how large the text reaches the model, wall-clock time and whether
+stitching the bands returns every expected item exactly once.
+
+The mock generates chunk_size characters of completion every --chunk-delay seconds, so a
+page with many line items takes long to answer in one request; bands generate their
+shares in parallel. Run from the repository root:
+    python -m benchmarks.bench_tiles --line-items 30 --chunk-delay 0.02 --repeat 3
+"""
+import os
+import sys
+import time
+import argparse
+import contextlib
+import io
+
+os.environ.setdefault('OPENROUTER_API_KEY', 'benchmark-key')
+os.environ.setdefault('DEDUP_MODE', 'off')
+os.environ['METRICS_DIR'] = ''  # Keep metrics in process, no snapshot files
+
+import numpy as np
+from PIL import Image
+from benchmarks.common import print_table
+from benchmarks.mock_openrouter import start_mock_server
+from create_test_image import draw_invoice_pages, invoice_items
+from modules.info_extractor import get_extractor
+from modules.tiled_extractor import TiledExtractor
+
+
+def statement(rows, seed, dpi):
+    """A continuous statement: the invoice pages stacked into one tall image"""
+    pages = draw_invoice_pages(rows, seed=seed, dpi=dpi)
+    image = Image.new('RGB', (pages[0].width, sum(page.height for page in pages)), 'white')
+    for n, page in enumerate(pages):
+        image.paste(page, (0, n * pages[0].height))
+    return image
+
+
+def text_px(tiled, image, tiles):
+    """Median text line height in pixels as sent to the model, in one request and in bands"""
+    lines = tiled.ocr_processor.find_text_lines(np.asarray(image.convert('L')))
+    line_height = float(np.median([bottom - top for top, bottom in lines if bottom - top >= 4]))
+    policy = tiled.encoding_policy
+    single = policy.target_size(image.width, image.height)[0] / image.width
+    banded = min(policy.target_size(image.width, bottom - top)[0] for top, bottom in tiles) / image.width
+    return round(line_height * single, 1), round(line_height * banded, 1)
+
+
+def completeness(results, expected):
+    """Expected items returned exactly once, and items returned that were not expected"""
+    returned = [(item['label'], item['value']) for item in results]
+    wanted = [(item['label'], item['value']) for item in expected]
+    found = sum(1 for pair in wanted if returned.count(pair) == 1)
+    return f"{found}/{len(wanted)}", len([pair for pair in returned if pair not in wanted])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='gpt4-mini')
+    parser.add_argument('--line-items', type=int, default=30)
+    parser.add_argument('--dpi', type=int, nargs='+', default=[150, 200, 300])
+    parser.add_argument('--latency', type=float, default=0.3, help='Mock time to first token in seconds')
+    parser.add_argument('--chunk-delay', type=float, default=0.02, help='Mock seconds per 64 completion characters')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    extractor = get_extractor(args.model)
+    tiled = TiledExtractor(extractor)
+    rows = []
+    for dpi in args.dpi:
+        for layout in ('page', 'statement'):
+            # A page holds about 30 rows; the statement runs over several pages
+            count = min(args.line_items, 30) if layout == 'page' else args.line_items * 3
+            items, expected = invoice_items(count, args.seed)
+            image = (draw_invoice_pages(items, seed=args.seed, dpi=dpi)[0] if layout == 'page'
+                     else statement(items, args.seed, dpi))
+            server, extractor.api_url = start_mock_server(latency=args.latency, items=expected,
+                                                          chunk_delay=args.chunk_delay)
+            try:
+                tiles = tiled.plan(image)
+                single_s, tiled_s = [], []
+                for _ in range(args.repeat):
+                    with contextlib.redirect_stdout(io.StringIO()):  # Extractor logs
+                        start = time.perf_counter()
+                        extractor.extract_info(image)
+                        single_s.append(time.perf_counter() - start)
+                        start = time.perf_counter()
+                        results = tiled.extract_info(image)
+                        tiled_s.append(time.perf_counter() - start)
+            finally:
+                server.shutdown()
+            found, extra = completeness(results, expected)
+            single_px, tiled_px = text_px(tiled, image, tiles)
+            rows.append({'document': f"{layout} {dpi} dpi", 'size': f"{image.width}x{image.height}",
+                         'tiles': len(tiles), 'text_px_single': single_px, 'text_px_tiled': tiled_px,
+                         'single_s': round(float(np.median(single_s)), 2),
+                         'tiled_s': round(float(np.median(tiled_s)), 2), 'found': found, 'extra': extra})
+    print_table(rows, ['document', 'size', 'tiles', 'text_px_single', 'text_px_tiled',
+                       'single_s', 'tiled_s', 'found', 'extra'])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
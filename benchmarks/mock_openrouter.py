@@ -0,0 +1,313 @@
+"""
+Local stand-in for the OpenRouter chat completions API.
+Returns a canned extraction after a configurable delay so the
+client side of the pipeline can be benchmarked without an API key.
+Requests with "stream": true get server-sent events, with the content
+split into chunks emitted chunk_delay seconds apart like generated tokens.
+Requests with a json_schema response_format get a structured document.
+Requests for one band of a tiled document ("part N of M") get that band's share
+of the line items, overlapping the previous band by one row.
+Requests with the terse prompt profile get short keys and line item labels, without
+remarks unless the prompt asks for them. Usage counts about 4 characters of text per
+token plus a fixed cost per image; text parts marked with cache_control count as cached
+once seen if they reach MIN_CACHE_TOKENS, like at the providers, and only uncached prompt tokens take prompt_delay to read. Streams the client
+closes early stop generating and are counted in config['aborted'].
+
+Latency follows a configurable distribution (uniform, lognormal or exponential,
+plus an optional stalled-request tail); failures are drawn from a list of
+status codes, or the connection is dropped without a response.
+"""
+import re
+import math
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_ITEMS = [
+    {"label": "Document Type", "value": "Tax Invoice", "remarks": "Determined from document header"},
+    {"label": "Invoice Number", "value": "INV-2024-001", "remarks": ""},
+    {"label": "Line Item 1 - Product", "value": "Web Development Services", "remarks": "First product line item"},
+    {"label": "Line Item 1 - Amount", "value": "1,500.00", "remarks": ""},
+    {"label": "Total Amount", "value": "1,650.00", "remarks": "Including tax"},
+]
+
+CANNED_DOCUMENT = {
+    "document_type": "Tax Invoice",
+    "fields": [{"label": "Invoice Number", "value": "INV-2024-001", "remarks": ""}],
+    "parties": [{"role": "seller", "name": "Acme Supplies", "address": "12 Market Road",
+                 "gstin": "27AAPFU0939F1ZV", "pan": "AAPFU0939F", "contact": ""}],
+    "line_items": [{"description": "Web Development Services", "hsn_sac": "998314", "quantity": "1",
+                    "unit": "", "rate": "1,500.00", "amount": "1,500.00", "taxable_value": "1,500.00",
+                    "taxes": [{"name": "IGST", "rate": "10", "amount": "150.00"}], "other": []}],
+    "tax_summary": [],
+    "totals": [{"label": "Total Amount", "value": "1,650.00", "remarks": "Including tax"}],
+}
+
+
+LATENCY_DISTRIBUTIONS = ('uniform', 'lognormal', 'exponential')
+
+# Band note of modules.tiled_extractor.tile_prompt
+TILE_PART = re.compile(rb'part (\d+) of (\d+) of one tall document')
+LINE_ITEM = re.compile(r'^(line\s*item\s*)(\d+)', re.I)
+# Output format of the terse prompt profile (modules.prompts.TERSE_OUTPUT)
+TERSE_OUTPUT = re.compile(rb'short keys \\"l\\" \(label\)')
+TERSE_REMARKS = re.compile(rb'\\"r\\" \(remarks\)')
+TERSE_LINE_ITEM = re.compile(r'^line\s*item\s*(\d+)\s*-\s*', re.I)
+# Prompt tokens of an image, like a high-detail image tiled by the OpenAI API
+IMAGE_TOKENS = 765
+# Shortest prompt part providers cache (Gemini and OpenAI: 1024 tokens)
+MIN_CACHE_TOKENS = 1024
+
+
+def tile_items(items, index, count):
+    """
+    The items band `index` of `count` would return: fields before the first line item
+    in the first band, fields after the last in the last band, and an even share of the
+    line items (renumbered from 1) starting with the last row of the previous share
+    """
+    groups, before, after = {}, [], []
+    for item in items:
+        match = LINE_ITEM.match(item['label'])
+        if match:
+            groups.setdefault(match.group(2), []).append(item)
+        else:
+            (after if groups else before).append(item)
+    groups = list(groups.values())
+    start = max(0, len(groups) * (index - 1) // count - 1) if index > 1 else 0
+    share = groups[start:len(groups) * index // count]
+    band = before if index == 1 else []
+    for number, group in enumerate(share, 1):
+        for item in group:
+            match = LINE_ITEM.match(item['label'])
+            band.append(dict(item, label=f"{match.group(1)}{number}{item['label'][match.end():]}"))
+    return band + (after if index == count else [])
+
+
+def terse_items(items, remarks):
+    """Items as the terse profile has the model write them: {"l", "v"} and "r" only when asked"""
+    encoded = []
+    for item in items:
+        match = TERSE_LINE_ITEM.match(item['label'])
+        label = f"L{match.group(1)} {item['label'][match.end():]}" if match else item['label']
+        entry = {'l': label, 'v': item['value']}
+        if remarks and item.get('remarks'):
+            entry['r'] = item['remarks']
+        encoded.append(entry)
+    return encoded
+
+
+def prompt_usage(body, config):
+    """(prompt tokens, of which cached) of a request: text at ~4 characters a token plus images"""
+    try:
+        content = json.loads(body)['messages'][0]['content']
+    except (ValueError, KeyError, IndexError, TypeError):
+        return len(body) // 4, 0
+    if isinstance(content, str):
+        return len(content) // 4, 0
+    tokens = cached = 0
+    for part in content:
+        if part.get('type') == 'image_url':
+            tokens += IMAGE_TOKENS
+            continue
+        text_tokens = len(part.get('text', '')) // 4
+        tokens += text_tokens
+        if 'cache_control' in part and text_tokens >= MIN_CACHE_TOKENS:
+            with config['lock']:
+                if part['text'] in config['cached_prompts']:
+                    cached += text_tokens
+                else:
+                    config['cached_prompts'].add(part['text'])
+    return tokens, cached
+
+
+def sample_latency(config):
+    """
+    Seconds before the mock answers. uniform: latency plus up to jitter; lognormal: median
+    latency with jitter as sigma (a long right tail, like real model APIs); exponential:
+    latency plus an exponential delay with mean jitter. slow_rate adds slow_latency on top.
+    """
+    distribution, latency, jitter = config['distribution'], config['latency'], config['jitter']
+    if distribution == 'lognormal':
+        delay = random.lognormvariate(math.log(latency), jitter) if latency > 0 else 0.0
+    elif distribution == 'exponential':
+        delay = latency + (random.expovariate(1 / jitter) if jitter > 0 else 0.0)
+    else:
+        delay = latency + random.uniform(0, jitter)
+    if random.random() < config['slow_rate']:
+        delay += config['slow_latency']  # Occasional stalled request: the latency tail
+    return delay
+
+
+class MockOpenRouterHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+    # Headers and body are written separately; without this, Nagle plus delayed
+    # ACKs add ~40 ms to every response on a reused connection
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+
+        config = self.server.config
+        prompt_tokens, cached_tokens = prompt_usage(body, config)
+        time.sleep(sample_latency(config) + config['prompt_delay'] * (prompt_tokens - cached_tokens) / 1000)
+
+        if random.random() < config['drop_rate']:
+            self.close_connection = True  # Upstream reset: no status line at all
+            return
+        if random.random() < config['error_rate']:
+            self._send_json(random.choice(config['error_statuses']), {"error": {"message": "Mock upstream error"}})
+            return
+
+        part = TILE_PART.search(body)
+        if b'"json_schema"' in body:
+            content = json.dumps(config['document'])
+        else:
+            items = tile_items(config['items'], int(part.group(1)), int(part.group(2))) if part else config['items']
+            if TERSE_OUTPUT.search(body):
+                items = terse_items(items, TERSE_REMARKS.search(body) is not None)
+            content = json.dumps(items)
+        # Rough token counts reported like the real API's usage
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        if cached_tokens:
+            usage["prompt_tokens_details"] = {"cached_tokens": cached_tokens}
+        if b'"stream": true' in body:
+            self._send_stream(content, usage)
+            return
+        # A non-streamed completion arrives only once every token has been generated
+        time.sleep(config['chunk_delay'] * self._chunk_count(content))
+        self._send_json(200, {
+            "id": "mock-completion",
+            "model": "mock",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+            "usage": usage,
+        })
+
+    def _chunk_count(self, content):
+        size = self.server.config['chunk_size']
+        return (len(content) + size - 1) // size
+
+    def _send_stream(self, content, usage):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def write_event(data):
+            payload = data.encode('utf-8')
+            self.wfile.write(f"{len(payload):x}\r\n".encode('ascii') + payload + b"\r\n")
+            self.wfile.flush()
+
+        config = self.server.config
+        size = config['chunk_size']
+        delay = config['chunk_delay']
+        try:
+            write_event(": OPENROUTER PROCESSING\n\n")
+            start = time.perf_counter()
+            for n, i in enumerate(range(0, len(content), size), 1):
+                # Sleep to an absolute schedule so per-call sleep overhead does not accumulate
+                time.sleep(max(0.0, start + n * delay - time.perf_counter()))
+                chunk = {"id": "mock-completion", "model": "mock",
+                         "choices": [{"index": 0, "delta": {"content": content[i:i + size]}}]}
+                write_event(f"data: {json.dumps(chunk)}\n\n")
+            # Usage arrives in a final chunk with no choices
+            write_event(f"data: {json.dumps({'id': 'mock-completion', 'model': 'mock', 'choices': [], 'usage': usage})}\n\n")
+            write_event("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream (e.g. a cancelled hedge): generation stops here
+            self.close_connection = True
+            with config['lock']:
+                config['aborted'] += 1
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class MockOpenRouterServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # The socketserver default of 5 drops connections under load
+
+
+def start_mock_server(host='127.0.0.1', port=0, latency=0.05, jitter=0.0,
+                      error_rate=0.0, error_status=503, items=None, chunk_size=64, chunk_delay=0.0,
+                      document=None, slow_rate=0.0, slow_latency=0.0, distribution='uniform',
+                      error_statuses=None, drop_rate=0.0, prompt_delay=0.0):
+    """
+    Start the mock server in a daemon thread and return (server, completions_url).
+    chunk_delay is the time to generate each chunk_size characters of the completion.
+    A slow_rate share of requests takes slow_latency seconds longer (see sample_latency).
+    Failing requests answer with one of error_statuses (default [error_status]);
+    a drop_rate share closes the connection without answering.
+    prompt_delay is the time to read each 1000 uncached prompt tokens.
+    """
+    if distribution not in LATENCY_DISTRIBUTIONS:
+        raise ValueError(f"Invalid latency distribution. Available: {', '.join(LATENCY_DISTRIBUTIONS)}")
+    server = MockOpenRouterServer((host, port), MockOpenRouterHandler)
+    server.config = {
+        'latency': latency,
+        'jitter': jitter,
+        'error_rate': error_rate,
+        'error_statuses': list(error_statuses or [error_status]),
+        'drop_rate': drop_rate,
+        'distribution': distribution,
+        'items': items if items is not None else CANNED_ITEMS,
+        'document': document if document is not None else CANNED_DOCUMENT,
+        'chunk_size': chunk_size,
+        'chunk_delay': chunk_delay,
+        'slow_rate': slow_rate,
+        'slow_latency': slow_latency,
+        'prompt_delay': prompt_delay,
+        'cached_prompts': set(),
+        'aborted': 0,  # Streams closed by the client before the end
+        'lock': threading.Lock(),
+    }
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://{host}:{server.server_address[1]}/api/v1/chat/completions"
+    return server, url
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.5, help='Base response delay in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='Spread of the delay in seconds (sigma for lognormal)')
+    parser.add_argument('--distribution', choices=LATENCY_DISTRIBUTIONS, default='uniform')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='Share of requests stalling')
+    parser.add_argument('--slow-latency', type=float, default=0.0, help='Extra delay of a stalled request')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-statuses', type=int, nargs='+', default=[503])
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='Share of connections dropped unanswered')
+    parser.add_argument('--items', help='JSON file with the label/value/remarks items to return')
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help='Seconds per 64 streamed characters')
+    args = parser.parse_args()
+
+    items = None
+    if args.items:
+        with open(args.items) as f:
+            items = json.load(f)
+    server, url = start_mock_server(port=args.port, latency=args.latency, jitter=args.jitter,
+                                    distribution=args.distribution, slow_rate=args.slow_rate,
+                                    slow_latency=args.slow_latency, error_rate=args.error_rate,
+                                    error_statuses=args.error_statuses, drop_rate=args.drop_rate,
+                                    items=items, chunk_delay=args.chunk_delay)
+    print(f"Mock OpenRouter listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,353 @@
+"""
+Reproducible offline benchmark suite.
+
+Generates (or reuses) a synthetic invoice corpus with create_test_image.generate_corpus,
+starts the mock OpenRouter server and runs:
+  stages     each pipeline stage (decode/render pages, encode, parse, render results)
+             on every document: wall time, CPU time and peak RSS growth
+  extractor  the extractor called directly from worker threads
+  app        the Flask app's /upload endpoint from worker threads
+Load scenarios report throughput, latency percentiles, CPU per document, peak RSS and
+mean wall time per stage from the metrics registry. Each scenario runs in a fresh process
+so memory figures are not polluted by earlier ones. Results are written as JSON;
+--compare checks them against an earlier run and exits with status 1 on a regression.
+
+Run from the repository root:
+    python -m benchmarks.run_suite --output results.json
+    python -m benchmarks.run_suite --output new.json --compare results.json
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import threading
+import contextlib
+import subprocess
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('OPENROUTER_API_KEY', 'benchmark-key')
+os.environ['RESULT_CACHE_BACKEND'] = 'none'  # Every document must reach the mock API
+os.environ['METRICS_DIR'] = ''  # Keep metrics in process, no snapshot files
+
+from benchmarks.common import percentile, print_table, summarize_latencies
+from benchmarks.mock_openrouter import LATENCY_DISTRIBUTIONS, start_mock_server
+from create_test_image import generate_corpus, invoice_items
+
+RESULTS_VERSION = 1
+
+# (metric, True when higher is better) compared by --compare
+LOAD_METRICS = (('throughput_rps', True), ('p50_ms', False), ('p95_ms', False), ('p99_ms', False),
+                ('cpu_per_doc_ms', False), ('max_rss_mb', False), ('failed', False))
+STAGE_METRICS = (('wall_p50_ms', False), ('cpu_mean_ms', False), ('peak_rss_mb', False))
+
+
+class PeakRSS:
+    """Samples the process RSS from a background thread; peak growth over the start in MB (Linux)"""
+
+    def __init__(self, interval: float = 0.002):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    @staticmethod
+    def rss() -> int:
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError):
+            return 0
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.start = self.peak = self.rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.rss())
+
+    @property
+    def growth_mb(self) -> float:
+        return round((self.peak - self.start) / 1e6, 2)
+
+
+def setup_child(url, model):
+    """Point the extractor at the mock server inside a scenario process"""
+    from modules.info_extractor import get_extractor
+    get_extractor(model).api_url = url
+
+
+def profile_stages(documents, model, url):
+    """Wall time, CPU time and peak RSS growth of each pipeline stage, document by document"""
+    setup_child(url, model)
+    import app as app_module
+    from flask import render_template
+    from modules.info_extractor import get_extractor
+    from modules.document_pages import is_paged_document, iter_pages
+    from PIL import Image
+
+    extractor = get_extractor(model)
+    samples = {}
+
+    def measure(stage, fn):
+        with PeakRSS() as memory:
+            wall, cpu = time.perf_counter(), time.process_time()
+            result = fn()
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        samples.setdefault(stage, []).append((wall * 1000, cpu * 1000, memory.growth_mb))
+        return result
+
+    def decode(path):
+        if is_paged_document(path):
+            return list(iter_pages(path))
+        with Image.open(path) as img:
+            img.load()
+            return [path]  # Single images are encoded straight from the file, as in the app
+
+    def encode(page):
+        encoded, info = extractor.prepare_image(page)
+        try:
+            return extractor.build_request_body(encoded, info['mime'])
+        finally:
+            if encoded is not page:
+                encoded.close()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for document in documents:
+            pages = measure('decode', lambda: decode(document['path']))
+            for page in pages:
+                measure('encode', lambda: encode(page))
+            response = {'choices': [{'message': {'content': json.dumps(document['expected'], indent=2)}}]}
+            results = measure('parse', lambda: extractor.parse_response(response))
+            with app_module.app.test_request_context():
+                measure('render', lambda: render_template('results.html', results=results))
+
+    rows = []
+    for stage, values in samples.items():
+        walls = [wall for wall, _, _ in values]
+        rows.append({
+            'stage': stage,
+            'samples': len(values),
+            'wall_p50_ms': round(percentile(walls, 50), 2),
+            'wall_p95_ms': round(percentile(walls, 95), 2),
+            'cpu_mean_ms': round(sum(cpu for _, cpu, _ in values) / len(values), 2),
+            'peak_rss_mb': max(growth for _, _, growth in values),
+        })
+    return rows
+
+
+def run_load(target, documents, model, url, threads, repeat):
+    """Extract every document `repeat` times from `threads` threads through the extractor or the app"""
+    setup_child(url, model)
+    from modules.metrics import get_registry
+    from modules.info_extractor import get_extractor
+    from modules.document_pages import PagedExtractor, is_paged_document
+
+    if target == 'app':
+        import app as app_module
+        local = threading.local()
+
+        def extract(path):
+            if not hasattr(local, 'client'):
+                local.client = app_module.app.test_client()
+            with open(path, 'rb') as f:
+                response = local.client.post('/upload', data={'model': model, 'mode': 'ai',
+                                                              'file': (f, os.path.basename(path))})
+            if response.status_code != 200:  # Errors redirect back to the form
+                raise Exception(f"Upload failed with status {response.status_code}")
+    else:
+        def extract(path):
+            extractor = get_extractor(model)
+            if is_paged_document(path):
+                extractor = PagedExtractor(extractor)
+            extractor.extract_info(path)
+
+    def one(path):
+        start = time.perf_counter()
+        try:
+            extract(path)
+            return time.perf_counter() - start, True
+        except Exception:
+            return time.perf_counter() - start, False
+
+    registry = get_registry()
+    registry.reset()
+    paths = [document['path'] for document in documents] * repeat
+    cpu = time.process_time()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=threads) as executor:
+        outcomes = list(executor.map(one, paths))
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+
+    result = summarize_latencies([latency for latency, ok in outcomes if ok], elapsed)
+    result.update(
+        failed=sum(1 for _, ok in outcomes if not ok),
+        cpu_s=round(cpu, 2),
+        cpu_per_doc_ms=round(cpu * 1000 / len(paths), 2),
+        max_rss_mb=round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),  # KiB on Linux
+    )
+    stages = {}
+    for labels, histogram in registry.series('extractor_stage_seconds'):
+        count, total = stages.get(labels['stage'], (0, 0.0))
+        stages[labels['stage']] = (count + histogram['count'], total + histogram['sum'])
+    result['stages_mean_ms'] = {stage: round(total * 1000 / count, 2) for stage, (count, total) in stages.items()}
+    return result
+
+
+def in_fresh_process(fn, *args):
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        return pool.apply(fn, args)
+
+
+def load_corpus(directory, count, seed):
+    """Reuse the corpus in `directory` when it matches count and seed, otherwise generate it"""
+    manifest_path = os.path.join(directory, 'manifest.json')
+    meta = {'count': count, 'seed': seed}
+    meta_path = os.path.join(directory, 'corpus.json')
+    if os.path.exists(manifest_path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f) == meta:
+                with open(manifest_path) as f:
+                    return json.load(f)
+    print(f"Generating corpus of {count} documents in {directory}...")
+    manifest = generate_corpus(directory, count=count, seed=seed)
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+    return manifest
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Rows comparing results with a baseline run; a row regresses when worse by more than tolerance %"""
+    rows = []
+
+    def check(scenario, metric, higher_is_better, new, old):
+        if new is None or old is None:
+            return
+        change = (new - old) / old * 100 if old else (0.0 if new == old else 100.0)
+        worse = -change if higher_is_better else change
+        # Differences under a millisecond (or a failure count of zero) are noise
+        regressed = worse > tolerance and abs(new - old) >= 1
+        rows.append({'scenario': scenario, 'metric': metric, 'baseline': old, 'current': new,
+                     'change_pct': round(change, 1), 'status': 'REGRESSED' if regressed else 'ok'})
+
+    for scenario in ('extractor', 'app'):
+        new, old = results['results'].get(scenario), baseline['results'].get(scenario)
+        if new and old:
+            for metric, higher_is_better in LOAD_METRICS:
+                check(scenario, metric, higher_is_better, new.get(metric), old.get(metric))
+    old_stages = {row['stage']: row for row in baseline['results'].get('stages', [])}
+    for row in results['results'].get('stages', []):
+        if row['stage'] in old_stages:
+            for metric, higher_is_better in STAGE_METRICS:
+                check(f"stage:{row['stage']}", metric, higher_is_better, row[metric], old_stages[row['stage']][metric])
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default=os.path.join('benchmarks', 'corpus'), help='Corpus directory')
+    parser.add_argument('--count', type=int, default=24, help='Documents in the corpus')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scenarios', nargs='+', choices=['stages', 'extractor', 'app'],
+                        default=['stages', 'extractor', 'app'])
+    parser.add_argument('--model', default='gpt4-mini')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=1, help='Passes over the corpus per load scenario')
+    parser.add_argument('--distribution', choices=LATENCY_DISTRIBUTIONS, default='lognormal')
+    parser.add_argument('--latency', type=float, default=0.2, help='Mock latency (median for lognormal)')
+    parser.add_argument('--jitter', type=float, default=0.5, help='Mock latency spread (sigma for lognormal)')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-statuses', type=int, nargs='+', default=[429, 500, 503])
+    parser.add_argument('--response-line-items', type=int, default=10,
+                        help='Line items in the canned model response')
+    parser.add_argument('--output', help='Write results to this JSON file')
+    parser.add_argument('--compare', help='Baseline results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=10.0, help='Allowed slowdown in percent')
+    args = parser.parse_args()
+
+    documents = load_corpus(args.corpus, args.count, args.seed)
+    random.seed(args.seed)
+    mock = {'distribution': args.distribution, 'latency': args.latency, 'jitter': args.jitter,
+            'error_rate': args.error_rate, 'error_statuses': args.error_statuses}
+    server, url = start_mock_server(items=invoice_items(args.response_line_items)[1], **mock)
+
+    results = {}
+    try:
+        for scenario in args.scenarios:
+            print(f"Running {scenario}...")
+            if scenario == 'stages':
+                results[scenario] = in_fresh_process(profile_stages, documents, args.model, url)
+            else:
+                results[scenario] = in_fresh_process(run_load, scenario, documents, args.model, url,
+                                                     args.threads, args.repeat)
+    finally:
+        server.shutdown()
+
+    report = {
+        'version': RESULTS_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': dict(vars(args), mock=mock),
+        'corpus': {
+            'documents': len(documents),
+            'pages': sum(document['pages'] for document in documents),
+            'bytes': sum(document['bytes'] for document in documents),
+            'formats': sorted({document['format'] for document in documents}),
+        },
+        'results': results,
+    }
+
+    if 'stages' in results:
+        print_table(results['stages'], ['stage', 'samples', 'wall_p50_ms', 'wall_p95_ms', 'cpu_mean_ms', 'peak_rss_mb'])
+    load_rows = [dict(results[s], scenario=s) for s in ('extractor', 'app') if s in results]
+    if load_rows:
+        print()
+        print_table(load_rows, ['scenario', 'requests', 'failed', 'throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms',
+                                'cpu_per_doc_ms', 'max_rss_mb'])
+        for row in load_rows:
+            print(f"{row['scenario']} stage means (ms): {row['stages_mean_ms']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(report, baseline, args.tolerance)
+        print()
+        print_table(rows, ['scenario', 'metric', 'baseline', 'current', 'change_pct', 'status'])
+        if any(row['status'] == 'REGRESSED' for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,8 @@
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
 import os
+import json
+import random
+import argparse
 
 def create_sample_invoice():
     # Create a white image
@@ -44,5 +47,159 @@ def create_sample_invoice():
     print(f"Test image created: {image_path}")
     return image_path
 
+# A4 portrait in inches
+PAGE_INCHES = (8.27, 11.69)
+
+PRODUCTS = ["Web Development Services", "Cotton Fabric Roll", "Steel Fasteners M8", "Printer Cartridge",
+            "Annual Support Contract", "LED Panel 40W", "Packaging Boxes", "Consulting Hours",
+            "Copper Wire 2.5mm", "Office Chairs"]
+
+# Formats the app accepts; multi-page documents are written as PDF or TIFF
+FORMATS = {'png': 'PNG', 'jpg': 'JPEG', 'tiff': 'TIFF', 'bmp': 'BMP', 'gif': 'GIF', 'pdf': 'PDF'}
+
+def _font(size):
+    try:
+        return ImageFont.truetype("arial.ttf", size)
+    except OSError:
+        try:
+            return ImageFont.load_default(size=size)  # Scalable default font, Pillow 10.1+
+        except TypeError:
+            return ImageFont.load_default()
+
+def invoice_items(line_items, seed=0):
+    """Line items of a synthetic invoice and the label/value/remarks items a model would return"""
+    rng = random.Random(seed)
+    rows = []
+    for n in range(1, line_items + 1):
+        quantity = rng.randint(1, 50)
+        rate = rng.randint(100, 50000) / 100
+        rows.append({'product': rng.choice(PRODUCTS), 'hsn': str(rng.randint(100000, 999999)),
+                     'quantity': quantity, 'rate': rate, 'amount': round(quantity * rate, 2)})
+    subtotal = round(sum(row['amount'] for row in rows), 2)
+    tax = round(subtotal * 0.18, 2)
+
+    expected = [
+        {"label": "Document Type", "value": "Tax Invoice", "remarks": "Determined from document header"},
+        {"label": "Invoice Number", "value": f"INV-{seed:06d}", "remarks": ""},
+        {"label": "Invoice Date", "value": "01/02/2024", "remarks": ""},
+    ]
+    for n, row in enumerate(rows, 1):
+        expected += [
+            {"label": f"Line Item {n} - Product", "value": row['product'], "remarks": ""},
+            {"label": f"Line Item {n} - HSN/SAC", "value": row['hsn'], "remarks": ""},
+            {"label": f"Line Item {n} - Quantity", "value": str(row['quantity']), "remarks": ""},
+            {"label": f"Line Item {n} - Rate", "value": f"{row['rate']:,.2f}", "remarks": ""},
+            {"label": f"Line Item {n} - Amount", "value": f"{row['amount']:,.2f}", "remarks": ""},
+        ]
+    expected += [
+        {"label": "Sub Total", "value": f"{subtotal:,.2f}", "remarks": ""},
+        {"label": "IGST Amount", "value": f"{tax:,.2f}", "remarks": "IGST at 18%"},
+        {"label": "Total Amount", "value": f"{subtotal + tax:,.2f}", "remarks": "Including tax"},
+    ]
+    return rows, expected
+
+def draw_invoice_pages(rows, seed=0, dpi=150, grayscale=False, noise=0.0):
+    """Render invoice rows onto A4 pages at the given resolution, continuing the table across pages"""
+    width, height = int(PAGE_INCHES[0] * dpi), int(PAGE_INCHES[1] * dpi)
+    unit = dpi / 100  # Layout is designed at 100 dpi
+    font, small = _font(int(16 * unit)), _font(int(12 * unit))
+    row_height = int(24 * unit)
+    pages = []
+    index = 0
+    while True:
+        image = Image.new('RGB', (width, height), 'white')
+        draw = ImageDraw.Draw(image)
+        y = int(40 * unit)
+        if not pages:
+            header = ["TAX INVOICE", f"Invoice #: INV-{seed:06d}", "Date: 01/02/2024",
+                      "Seller: Acme Supplies, 12 Market Road", "GSTIN: 27AAPFU0939F1ZV",
+                      "Bill To: John Smith, 123 Main Street"]
+            for line in header:
+                draw.text((int(50 * unit), y), line, fill='black', font=font)
+                y += int(28 * unit)
+            y += int(20 * unit)
+        columns = [50, 80, 420, 520, 590, 680]
+        for x, title in zip(columns, ["#", "Description", "HSN/SAC", "Qty", "Rate", "Amount"]):
+            draw.text((int(x * unit), y), title, fill='black', font=small)
+        y += row_height
+        draw.line([(int(45 * unit), y - 4), (width - int(45 * unit), y - 4)], fill='black', width=max(1, int(unit)))
+
+        while index < len(rows) and y < height - int(160 * unit):
+            row = rows[index]
+            index += 1
+            values = [str(index), row['product'], row['hsn'], str(row['quantity']),
+                      f"{row['rate']:,.2f}", f"{row['amount']:,.2f}"]
+            for x, value in zip(columns, values):
+                draw.text((int(x * unit), y), value, fill='black', font=small)
+            y += row_height
+
+        if index >= len(rows):
+            subtotal = sum(row['amount'] for row in rows)
+            y += int(20 * unit)
+            for line in (f"Sub Total: {subtotal:,.2f}", f"IGST (18%): {subtotal * 0.18:,.2f}",
+                         f"Total: {subtotal * 1.18:,.2f}"):
+                draw.text((int(480 * unit), y), line, fill='black', font=font)
+                y += int(28 * unit)
+        draw.text((width // 2, height - int(40 * unit)), f"Page {len(pages) + 1}", fill='black', font=small)
+
+        if noise:
+            # Scanner look: slight blur and rotation
+            image = image.filter(ImageFilter.GaussianBlur(noise)).rotate(noise, expand=False, fillcolor='white')
+        pages.append(image.convert('L') if grayscale else image)
+        if index >= len(rows):
+            return pages
+
+def create_invoice(path, line_items=5, dpi=150, seed=0, grayscale=False, noise=0.0, fmt=None):
+    """
+    Write a synthetic invoice to `path` (format from the extension unless `fmt` is given).
+    Long tables continue on further pages; PDF and TIFF keep every page, other formats
+    only the first. Returns the number of pages written and the expected extraction items.
+    """
+    rows, expected = invoice_items(line_items, seed)
+    pages = draw_invoice_pages(rows, seed=seed, dpi=dpi, grayscale=grayscale, noise=noise)
+    fmt = fmt or FORMATS[os.path.splitext(path)[1].lstrip('.').lower()]
+    if fmt in ('PDF', 'TIFF'):
+        pages[0].save(path, format=fmt, save_all=True, append_images=pages[1:], resolution=dpi)
+    else:
+        options = {'quality': 85} if fmt == 'JPEG' else {}
+        pages[0].save(path, format=fmt, **options)
+        pages = pages[:1]
+    return len(pages), expected
+
+def generate_corpus(output_dir, count=40, seed=0):
+    """
+    Write `count` varied synthetic invoices to output_dir and a manifest.json describing
+    each one (format, resolution, pages, line items, bytes, expected items). The same seed
+    always produces the same corpus.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    rng = random.Random(seed)
+    manifest = []
+    for n in range(count):
+        fmt = rng.choice(['png', 'jpg', 'jpg', 'tiff', 'bmp', 'gif', 'pdf', 'pdf'])
+        # Uncompressed BMPs above 150 dpi exceed the 15MB upload limit
+        dpi = rng.choice([100, 150, 200, 300] if fmt != 'bmp' else [100, 150])
+        # Multi-page tables only for formats that can hold them
+        line_items = rng.choice([1, 5, 10, 20]) if fmt not in ('pdf', 'tiff') else rng.choice([5, 20, 40, 80])
+        options = {'dpi': dpi, 'seed': seed * 100000 + n, 'grayscale': rng.random() < 0.3,
+                   'noise': rng.choice([0.0, 0.0, 0.5, 1.0])}
+        path = os.path.join(output_dir, f"invoice_{n:04d}.{fmt}")
+        pages, expected = create_invoice(path, line_items=line_items, **options)
+        manifest.append({'path': path, 'format': fmt, 'dpi': dpi, 'pages': pages, 'line_items': line_items,
+                         'grayscale': options['grayscale'], 'noise': options['noise'],
+                         'bytes': os.path.getsize(path), 'expected': expected})
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
 if __name__ == "__main__":
-    create_sample_invoice()
+    parser = argparse.ArgumentParser(description="Create test invoices")
+    parser.add_argument('--corpus', help='Write a synthetic benchmark corpus to this directory')
+    parser.add_argument('--count', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if args.corpus:
+        corpus = generate_corpus(args.corpus, count=args.count, seed=args.seed)
+        print(f"Corpus of {len(corpus)} documents ({sum(d['pages'] for d in corpus)} pages) written to {args.corpus}")
+    else:
+        create_sample_invoice()
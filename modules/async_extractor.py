@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import asyncio
+from typing import Dict, Any, List, Optional, Sequence, Union
+import aiohttp
+import PIL
+from modules.info_extractor import AIInfoExtractor
+from modules.duplicate_index import get_duplicate_index
+from modules.http_session import RETRY_STATUS_CODES
+from modules.rate_limit import TokenBucket, AsyncTokenBucket
+from modules.metrics import observe_stage, record_usage
+
+
+class AsyncAIInfoExtractor(AIInfoExtractor):
+    """
+    asyncio counterpart of AIInfoExtractor for driving many requests from one process.
+    Shares the MODELS table, prompt, response post-processing and metrics of the sync
+    client. The coroutines have their own names (extract_info_async, extract_many), so the
+    inherited synchronous extract_info still works wherever an AIInfoExtractor is expected.
+    Use as an async context manager:
+
+        async with AsyncAIInfoExtractor("gpt4-mini", max_concurrency=50) as extractor:
+            results = await extractor.extract_many(paths)
+    """
+
+    def __init__(self, model_choice="gpt4-mini", max_concurrency: int = 20,
+                 rate_limit: Optional[float] = None, timeout=None, max_retries: Optional[int] = None,
+                 backoff_factor: Optional[float] = None, profile: Optional[str] = None):
+        super().__init__(model_choice=model_choice, timeout=timeout, profile=profile)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('HTTP_MAX_RETRIES', '2'))
+        self.backoff_factor = backoff_factor if backoff_factor is not None else float(os.getenv('HTTP_RETRY_BACKOFF', '1.0'))
+
+        # An explicit rate gets its own bucket; otherwise share the provider budget of the sync clients
+        bucket = TokenBucket(rate_limit) if rate_limit else self.rate_limiter
+        self.async_rate_limiter = AsyncTokenBucket(bucket) if bucket is not None else None
+
+        self._client = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self) -> None:
+        # Created inside the running loop; asyncio primitives bind to it on Python 3.9
+        if self._client is None:
+            connect_timeout, read_timeout = self.timeout
+            self._client = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+                timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+            self._semaphore = None
+
+    async def _post(self, body: memoryview) -> Dict[str, Any]:
+        """POST with retry-with-backoff for 429/5xx, mirroring the sync session; each attempt is recorded"""
+        headers = self.build_headers()
+        for attempt in range(self.max_retries + 1):
+            if self.async_rate_limiter is not None:
+                await self.async_rate_limiter.acquire()
+            start = time.perf_counter()
+            try:
+                async with self._client.post(self.api_url, headers=headers, data=body) as response:
+                    payload = await response.read()
+            except asyncio.TimeoutError:
+                self._record_request('timeout')
+                raise
+            except aiohttp.ClientError:
+                self._record_request('error')
+                raise
+            self._record_request(str(response.status), (time.perf_counter() - start) * 1000, len(payload))
+            if response.status in RETRY_STATUS_CODES and attempt < self.max_retries:
+                retry_after = response.headers.get('Retry-After')
+                delay = float(retry_after) if retry_after and retry_after.isdigit() else self.backoff_factor * (2 ** attempt)
+                print(f"API returned {response.status}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            if response.status != 200:
+                self.check_error_response(response.status, payload.decode('utf-8', 'replace'))
+                response.raise_for_status()
+            return json.loads(payload)
+
+    async def extract_info_async(self, image_path: str, timeout: Optional[float] = None,
+                                 metrics: Optional[Dict[str, Any]] = None) -> List[Dict[str, str]]:
+        """
+        Extract information from a document image.
+        `timeout` bounds the whole call including queueing for a concurrency slot;
+        cancelling the awaiting task aborts the in-flight request.
+        Records the same stage, payload and token metrics as the sync extract_info,
+        and in `metrics` when given.
+        """
+        if self._client is None:
+            raise RuntimeError("AsyncAIInfoExtractor must be opened before use (async with ...)")
+        try:
+            return await asyncio.wait_for(self._extract(image_path, metrics), timeout)
+        except asyncio.TimeoutError:
+            print("API request timed out")
+            raise Exception("Request timed out - please try again")
+        except aiohttp.ClientError as e:
+            print(f"API request failed: {str(e)}")
+            raise Exception(f"API request failed: {str(e)}")
+        except PIL.UnidentifiedImageError:
+            print("Could not identify image file")
+            raise Exception("Invalid or corrupted image file")
+
+    async def _extract(self, image_path: str, metrics: Optional[Dict[str, Any]]) -> List[Dict[str, str]]:
+        async with self._semaphore:
+            # PIL work is CPU bound, keep it off the event loop
+            start = time.perf_counter()
+            body, reused, remember = await asyncio.to_thread(self._prepare_body, image_path, metrics)
+            encode_ms = (time.perf_counter() - start) * 1000
+            if metrics is not None:
+                metrics['encode_ms'] = round(encode_ms, 1)
+            if reused is not None:
+                return self._parse(reused, metrics)
+            self._record_encoding(encode_ms, body)
+            start = time.perf_counter()
+            result = await self._post(body.getbuffer())
+            if metrics is not None:
+                metrics['api_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        record_usage(self.model, result, metrics, profile=self.profile.name)
+        if remember is not None and result.get('choices'):
+            await asyncio.to_thread(remember, {'choices': result['choices']})
+        return self._parse(result, metrics)
+
+    def _parse(self, result: Dict[str, Any], metrics: Optional[Dict[str, Any]]) -> List[Dict[str, str]]:
+        start = time.perf_counter()
+        items = self.parse_response(result)
+        parse_ms = (time.perf_counter() - start) * 1000
+        observe_stage('parse', parse_ms / 1000, model=self.model, profile=self.profile.name)
+        if metrics is not None:
+            metrics['parse_ms'] = round(parse_ms, 1)
+        return items
+
+    def _prepare_body(self, image_path: str, metrics: Optional[Dict[str, Any]] = None):
+        """
+        Request body for an image, plus the earlier response of a near-duplicate in reuse
+        mode (no body then) and a callback storing the new response when DEDUP_MODE is set
+        """
+        duplicates = get_duplicate_index()
+        encoded, image_info = self.prepare_image(image_path, fingerprint=duplicates is not None)
+        fingerprint = image_info.pop('fingerprint', None)
+        if metrics is not None:
+            metrics['image'] = image_info
+        with encoded:
+            if duplicates is None:
+                return self.build_request_body(encoded, image_info['mime']), None, None
+            request_key = duplicates.request_key(self.model, self.PROMPT_VERSION)
+            reused = duplicates.check(fingerprint, request_key, metrics, page=encoded)
+            if reused is not None:
+                return None, reused, None
+            remember = lambda response: duplicates.remember(fingerprint, request_key, response)
+            return self.build_request_body(encoded, image_info['mime']), None, remember
+
+    async def extract_many(self, image_paths: Sequence[str],
+                           timeout: Optional[float] = None) -> List[Union[List[Dict[str, str]], Exception]]:
+        """Extract several documents concurrently; failures are returned in place of results"""
+        return await asyncio.gather(
+            *(self.extract_info_async(path, timeout=timeout) for path in image_paths),
+            return_exceptions=True
+        )
@@ -0,0 +1,189 @@
+"""
+Command line tools: extract documents without the web app, and export extraction results.
+
+    python -m modules.cli extract invoices/ --workers 8 --output results.ndjson
+    python -m modules.cli export --jobs jobs/jobs.db --format parquet --output results.parquet
+    python -m modules.cli export batch.ndjson --format csv --table documents > documents.csv
+
+Modules are imported by the command that needs them, so startup stays fast.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from contextlib import contextmanager, redirect_stdout
+from typing import Any, Dict, Iterator, List, Optional
+
+
+@contextmanager
+def _open_output(path: Optional[str]):
+    """Binary output file, or stdout for '-' or no path"""
+    if not path or path == '-':
+        yield sys.stdout.buffer
+        sys.stdout.buffer.flush()
+        return
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    # Written under a temporary name so an interrupted export never looks complete
+    try:
+        with open(path + '.tmp', 'wb') as f:
+            yield f
+    except BaseException:
+        os.remove(path + '.tmp')
+        raise
+    os.replace(path + '.tmp', path)
+
+
+def _export_records(args) -> Iterator[Dict[str, Any]]:
+    from modules.exporters import iter_ndjson_records, record_from_job
+
+    if args.jobs:
+        from modules.job_queue import JobStore
+        if not os.path.exists(args.jobs):
+            raise Exception(f"Job store not found: {args.jobs}")
+        for job in JobStore(args.jobs).iter_finished(args.since, args.until):
+            yield record_from_job(job)
+    for path in args.inputs:
+        if path == '-':
+            yield from iter_ndjson_records(sys.stdin)
+            continue
+        with open(path, encoding='utf-8') as f:
+            yield from iter_ndjson_records(f)
+
+
+def _load_env() -> None:
+    """Read .env like the web app, when python-dotenv is installed"""
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
+    load_dotenv()
+
+
+def extract_command(args) -> int:
+    from modules.runner import Checkpoint, extract_documents, iter_documents
+
+    if args.workers < 1:
+        raise Exception("--workers must be at least 1")
+    to_file = args.output and args.output != '-'
+    checkpoint_path = args.checkpoint or (args.output + '.checkpoint' if to_file else None)
+    checkpoint = Checkpoint(checkpoint_path) if checkpoint_path else None
+    # Extractors log with print; keep stdout for the records
+    log = open(os.devnull, 'w') if args.quiet else sys.stderr
+    out = open(args.output, 'a', encoding='utf-8') if to_file else sys.stdout
+    counts = {'done': 0, 'failed': 0}
+    start = time.time()
+    try:
+        with redirect_stdout(log):
+            records = extract_documents(iter_documents(args.inputs), mode=args.mode, model=args.model,
+                                        workers=args.workers, checkpoint=checkpoint,
+                                        retry_failed=not args.skip_failed, use_cache=not args.no_cache)
+            try:
+                for record in records:
+                    out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    out.flush()
+                    counts[record['status']] += 1
+                    if not args.quiet:
+                        print(f"[{sum(counts.values())}] {record['status']} {record['document']} "
+                              f"({record['elapsed_s']}s)", file=sys.stderr)
+            finally:
+                # Waits for the documents in progress while their logs still go to stderr
+                records.close()
+    except KeyboardInterrupt:
+        if checkpoint is not None:
+            print(f"Interrupted; rerun the same command to resume from {checkpoint_path}", file=sys.stderr)
+        raise
+    finally:
+        if to_file:
+            out.close()
+        if checkpoint is not None:
+            checkpoint.close()
+        if args.quiet:
+            log.close()
+    elapsed = time.time() - start
+    skipped = checkpoint.skipped if checkpoint is not None else 0
+    print(f"{counts['done']} done, {counts['failed']} failed, {skipped} already processed "
+          f"in {elapsed:.1f}s", file=sys.stderr)
+    return 1 if counts['failed'] else 0
+
+
+def export_command(args) -> int:
+    from modules.exporters import export_chunks
+
+    if not args.jobs and not args.inputs:
+        raise Exception("Nothing to export: give NDJSON files (or - for stdin) or --jobs")
+    columns = [column.strip() for column in args.columns.split(',') if column.strip()] if args.columns else None
+    chunks = export_chunks(_export_records(args), args.format, args.table, columns=columns,
+                           sample=args.sample, row_group_size=args.row_group_size)
+    with _open_output(args.output) as out:
+        for chunk in chunks:
+            out.write(chunk)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='python -m modules.cli', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    extract = commands.add_parser(
+        'extract', help='Extract documents without the web app, as NDJSON',
+        description="Extract every document in the given files, directories (walked recursively) "
+                    "and manifests (.txt with one path per line, .json or .jsonl with paths or objects "
+                    "with a \"path\") and write one JSON record per document as it finishes. "
+                    "With --output, finished documents are recorded in a checkpoint, so rerunning "
+                    "an interrupted command carries on where it stopped.")
+    extract.add_argument('inputs', nargs='+', help='Documents, directories or manifests')
+    extract.add_argument('--mode', choices=('ai', 'tiered', 'template', 'structured', 'tiled', 'ocr'),
+                         default=os.getenv('EXTRACTION_MODE', 'ai'),
+                         help="Extraction mode as in the web app; 'ocr' uses only local Tesseract and "
+                              "rules, without an API key (default EXTRACTION_MODE or ai)")
+    extract.add_argument('--model', help='Model name (default DEFAULT_MODEL or auto)')
+    extract.add_argument('--workers', type=int, default=int(os.getenv('EXTRACT_WORKERS', '4')),
+                         help='Documents in flight at once (default EXTRACT_WORKERS or 4)')
+    extract.add_argument('--output', '-o', help='NDJSON file to append records to (default stdout)')
+    extract.add_argument('--checkpoint', help='Checkpoint file (default <output>.checkpoint)')
+    extract.add_argument('--skip-failed', action='store_true', help='On resume, skip documents that failed too')
+    extract.add_argument('--no-cache', action='store_true', help='Do not use the result cache')
+    extract.add_argument('--quiet', '-q', action='store_true', help='No progress or extractor logs on stderr')
+    extract.set_defaults(func=extract_command)
+
+    export = commands.add_parser(
+        'export', help='Write extraction results as CSV, JSONL or Parquet',
+        description="Stream extraction results into one table: a row per line item, with the "
+                    "columns pivoted from the \"Line Item N - Column\" labels, or a row per document "
+                    "with its fields. Reads NDJSON from /batch or the extract command, and/or the "
+                    "finished jobs of a job store.")
+    export.add_argument('inputs', nargs='*', help="NDJSON result files, '-' for stdin")
+    export.add_argument('--jobs', help='Job store to export finished jobs from (JOB_STORE_PATH, e.g. jobs/jobs.db)')
+    export.add_argument('--since', type=float, help='Only jobs finished at or after this Unix time')
+    export.add_argument('--until', type=float, help='Only jobs finished before this Unix time')
+    export.add_argument('--format', choices=('csv', 'jsonl', 'parquet'), default='csv')
+    export.add_argument('--table', choices=('line_items', 'documents'), default='line_items')
+    export.add_argument('--columns', help='Comma separated label columns, instead of choosing them from the first rows')
+    export.add_argument('--sample', type=int, default=1000, help='Rows read to choose the columns')
+    export.add_argument('--row-group-size', type=int, default=50000, help='Rows per Parquet row group')
+    export.add_argument('--output', '-o', help='Output file (default stdout)')
+    export.set_defaults(func=export_command)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    _load_env()  # Before parsing, since option defaults come from the environment
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except KeyboardInterrupt:
+        return 130
+    except BrokenPipeError:
+        # The reader went away (e.g. piped into head); stop without a traceback at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
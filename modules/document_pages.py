@@ -0,0 +1,228 @@
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Any, Iterator, List, BinaryIO, Optional, Tuple, Union
+from PIL import Image, ImageSequence
+from modules.metrics import bind_context
+from modules.structured_output import merge_documents
+
+_LINE_ITEM_LABEL = re.compile(r'^(line\s*item\s*)(\d+)', re.I)
+
+# Extraction tiers from cheapest to most expensive
+_TIER_COST = ['ocr', 'template', 'template_prompt', 'ai']
+
+
+def _read_header(source: Union[str, BinaryIO], size: int = 8) -> bytes:
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            return f.read(size)
+    position = source.tell()
+    source.seek(0)
+    header = source.read(size)
+    source.seek(position)
+    return header
+
+
+def is_pdf(source: Union[str, BinaryIO]) -> bool:
+    return _read_header(source).startswith(b'%PDF-')
+
+
+def is_paged_document(source: Union[str, BinaryIO]) -> bool:
+    """True for PDFs and multi-frame TIFFs, which are extracted page by page"""
+    if isinstance(source, Image.Image):
+        return False
+    if is_pdf(source):
+        return True
+    if _read_header(source, 4) not in (b'II*\x00', b'MM\x00*'):
+        return False
+    try:
+        with Image.open(source) as img:
+            return getattr(img, 'n_frames', 1) > 1
+    except Exception:
+        return False  # Let the extractor report the broken file
+    finally:
+        if not isinstance(source, str):
+            source.seek(0)
+
+
+def iter_pages(source: Union[str, BinaryIO], dpi: Optional[int] = None,
+               max_pages: Optional[int] = None) -> Iterator[Image.Image]:
+    """
+    Yield the pages of a PDF or multi-frame TIFF as images, one at a time.
+    Pages are rendered or decoded only when requested, so memory holds the
+    pages in flight rather than the whole document.
+    """
+    dpi = dpi or int(os.getenv('PDF_RENDER_DPI', '200'))
+    max_pages = max_pages or int(os.getenv('DOCUMENT_MAX_PAGES', '50'))
+
+    if is_pdf(source):
+        try:
+            import pypdfium2
+        except ImportError:
+            raise Exception("PDF support requires the pypdfium2 package")
+        if isinstance(source, str):
+            data = source
+        else:
+            source.seek(0)
+            data = source.read()
+            source.seek(0)
+        try:
+            pdf = pypdfium2.PdfDocument(data)
+        except pypdfium2.PdfiumError:
+            raise Exception("Invalid or corrupted PDF file")
+        try:
+            if len(pdf) > max_pages:
+                raise Exception(f"Document has too many pages (max {max_pages})")
+            for index in range(len(pdf)):
+                page = pdf[index]
+                try:
+                    yield page.render(scale=dpi / 72).to_pil()
+                finally:
+                    page.close()
+        finally:
+            pdf.close()
+    else:
+        with Image.open(source) as img:
+            if getattr(img, 'n_frames', 1) > max_pages:
+                raise Exception(f"Document has too many pages (max {max_pages})")
+            for frame in ImageSequence.Iterator(img):
+                # Fax TIFFs are usually 1-bit; copy detaches the frame from the sequence
+                yield frame.convert('L') if frame.mode == '1' else frame.copy()
+        if not isinstance(source, str):
+            source.seek(0)
+
+
+def merge_page_results(page_results: List[List[Dict[str, str]]]) -> List[Dict[str, str]]:
+    """
+    Merge per-page extractions into one result list.
+    Line items are renumbered in page order so "Line Item N" labels never collide,
+    and header fields repeated on every page (same label and value) are kept once.
+    """
+    merged = []
+    seen = set()
+    next_line_item = 1
+    multi_page = len(page_results) > 1
+
+    for page_number, items in enumerate(page_results, 1):
+        numbering = {}
+        for item in items:
+            label = item['label']
+            match = _LINE_ITEM_LABEL.match(label)
+            if match:
+                # Pages number their items from 1; map them onto the running sequence
+                local_number = match.group(2)
+                if local_number not in numbering:
+                    numbering[local_number] = next_line_item
+                    next_line_item += 1
+                label = f"{match.group(1)}{numbering[local_number]}{label[match.end():]}"
+            else:
+                key = (label.lower(), item['value'])
+                if key in seen:
+                    continue
+                seen.add(key)
+
+            remarks = item['remarks']
+            if multi_page:
+                remarks = f"Page {page_number}" + (f"; {remarks}" if remarks else "")
+            merged.append({'label': label, 'value': item['value'], 'remarks': remarks})
+
+    return merged
+
+
+def _aggregate_metrics(page_metrics: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine per-page metrics into document level metrics"""
+    metrics = {'page_metrics': page_metrics}
+    if page_metrics and 'image' in page_metrics[0]:
+        metrics['image'] = page_metrics[0]['image']
+    for key in ('ocr_ms', 'template_ms', 'encode_ms', 'api_ms', 'parse_ms'):
+        values = [m[key] for m in page_metrics if key in m]
+        if values:
+            metrics[key] = round(sum(values), 1)
+    # The document is reported at the most expensive tier any of its pages needed
+    tiers = [m['tier'] for m in page_metrics if 'tier' in m]
+    if tiers:
+        metrics['tier'] = max(tiers, key=_TIER_COST.index)
+    # Bands of pages extracted in tiled mode
+    tiles = [m['tiles'] for m in page_metrics if 'tiles' in m]
+    if tiles:
+        metrics['tiles'] = sum(tiles)
+    confidences = [m['ocr_confidence'] for m in page_metrics if 'ocr_confidence' in m]
+    if confidences:
+        metrics['ocr_confidence'] = min(confidences)
+    return metrics
+
+
+class PagedExtractor:
+    """
+    Extracts PDFs and multi-frame TIFFs page by page through another extractor.
+    Pages are rendered lazily and extracted concurrently, with at most
+    max_workers pages rendered but not yet extracted at any time.
+    Exposes the extractor interface so it works with the result cache.
+    """
+
+    # Bump whenever page splitting or merging changes so cached results are invalidated
+    VERSION = "1"
+
+    def __init__(self, extractor, max_workers: Optional[int] = None):
+        self.extractor = extractor
+        self.max_workers = max_workers or int(os.getenv('PAGE_CONCURRENCY', '4'))
+        self.model = extractor.model
+        self.PROMPT_VERSION = f"{extractor.PROMPT_VERSION}.p{self.VERSION}"
+        # Typed results (extract_structured) when the page extractor has them
+        self.structured = getattr(extractor, 'structured', False)
+
+    def _extract_page(self, page: Image.Image, extract) -> Tuple[Any, Dict[str, Any]]:
+        page_metrics = {}
+        return extract(page, metrics=page_metrics), page_metrics
+
+    def extract_info(self, source: Union[str, BinaryIO],
+                     metrics: Optional[Dict[str, Any]] = None) -> List[Dict[str, str]]:
+        return merge_page_results(self._extract_pages(source, metrics, self.extractor.extract_info))
+
+    def extract_structured(self, source: Union[str, BinaryIO],
+                           metrics: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Typed results of the pages merged into one document (structured extractors only)"""
+        return merge_documents(self._extract_pages(source, metrics, self.extractor.extract_structured))
+
+    def to_items(self, result: Dict[str, Any]) -> List[Dict[str, str]]:
+        return self.extractor.to_items(result)
+
+    def _extract_pages(self, source: Union[str, BinaryIO], metrics: Optional[Dict[str, Any]], extract) -> List[Any]:
+        """Results of extract for each page, in page order"""
+        start = time.perf_counter()
+        results = {}
+
+        def collect(futures):
+            for future in futures:
+                results[pending.pop(future)] = future.result()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='page-worker') as executor:
+            pending = {}
+            try:
+                pages = iter_pages(source)
+                index = 0
+                while True:
+                    if len(pending) >= self.max_workers:
+                        # Render the next page only once a worker is free
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    page = next(pages, None)
+                    if page is None:
+                        break
+                    pending[executor.submit(bind_context(self._extract_page), page, extract)] = index
+                    index += 1
+                    del page
+                collect(list(pending))
+            except Exception:
+                for future in pending:
+                    future.cancel()
+                raise
+
+        page_count = len(results)
+        print(f"Extracted {page_count} pages in {time.perf_counter() - start:.2f}s")
+        ordered = [results[index] for index in range(page_count)]
+        if metrics is not None:
+            metrics.update(_aggregate_metrics([page_metrics for _, page_metrics in ordered]))
+            metrics.update(pages=page_count, pages_ms=round((time.perf_counter() - start) * 1000, 1))
+        return [result for result, _ in ordered]
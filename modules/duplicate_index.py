@@ -0,0 +1,473 @@
+import os
+import re
+import json
+import math
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Any, BinaryIO, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+from modules.metrics import get_registry
+
+# Size of the normalized thumbnail compared to verify a near-duplicate (A4 aspect ratio)
+SIGNATURE_SIZE = (96, 136)
+
+DEDUP_MODES = ('off', 'flag', 'reuse')
+
+# Labels of the fields a response must agree on with a page before it is reused for it:
+# document number and date, GSTINs and totals
+KEY_LABEL = re.compile(r'\b(invoice|bill|document|order|receipt)\s*(no|number|#)|\bgstin\b|\bgst\s*(no|number)\b|'
+                       r'\b(invoice|bill|document)\s*date\b|\bgrand\s*total\b|\btotal\s*amount\b|'
+                       r'\bamount\s*payable\b', re.I)
+_LINE_ITEM_LABEL = re.compile(r'^\s*(line\s*item\s*|l)\d', re.I)
+MAX_KEY_VALUES = 8
+
+
+def image_fingerprint(img: Image.Image) -> Tuple[int, bytes]:
+    """
+    Fingerprint of a page for near-duplicate detection: a 64-bit perceptual hash (DCT)
+    and a small grayscale signature. Both are taken after straightening the page and
+    cropping it to its content, so re-scans at another resolution, angle or margin of the
+    same document come out alike.
+    """
+    import cv2
+    from modules.ocr_processor import OCRProcessor
+
+    gray = img.convert('L')
+    gray.thumbnail((512, 512))
+    gray = np.asarray(gray)
+    processor = OCRProcessor(pipeline=(), engine='pytesseract')
+    angle = processor.estimate_skew(gray)
+    if abs(angle) >= 0.2:
+        height, width = gray.shape
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+        gray = cv2.warpAffine(gray, matrix, (width, height), flags=cv2.INTER_LINEAR,
+                              borderMode=cv2.BORDER_CONSTANT, borderValue=255)
+    bounds = processor.find_content_bounds(gray, margin=0)
+    if bounds is not None:
+        x, y, w, h = bounds
+        gray = gray[y:y + h, x:x + w]
+    signature = cv2.resize(gray, SIGNATURE_SIZE, interpolation=cv2.INTER_AREA)
+
+    # pHash: signs of the lowest 8x8 frequencies against their median (DC term excluded)
+    coefficients = cv2.dct(cv2.resize(signature, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32))
+    low = coefficients[:8, :8].flatten()
+    bits = low > np.median(low[1:])
+    return int(''.join('1' if bit else '0' for bit in bits), 2), signature.tobytes()
+
+
+def signature_difference(a: bytes, b: bytes) -> float:
+    """
+    Largest local difference (0-255) between two signatures, averaged over 2x2 cells.
+    Re-scans differ a little everywhere; different documents on the same form differ
+    a lot where their text differs, which a global average would dilute.
+    """
+    import cv2
+
+    shape = (SIGNATURE_SIZE[1], SIGNATURE_SIZE[0])
+    first = np.frombuffer(a, np.uint8).reshape(shape).astype(np.float32)
+    second = np.frombuffer(b, np.uint8).reshape(shape).astype(np.float32)
+    return float(cv2.blur(np.abs(first - second), (2, 2)).max())
+
+
+def key_values(response: Dict[str, Any]) -> List[str]:
+    """
+    Values of the identifying fields (see KEY_LABEL) in a stored model response, a
+    label/value array or a structured document
+    """
+    try:
+        content = response['choices'][0]['message']['content'] or ''
+    except (KeyError, IndexError, TypeError):
+        return []
+    try:
+        data = json.loads(content)
+    except ValueError:
+        # Free-text responses may wrap the array in prose or markdown
+        try:
+            data = json.loads(content[content.find('['):content.rfind(']') + 1])
+        except ValueError:
+            return []
+
+    values = []
+    if isinstance(data, dict):
+        entries = list(data.get('fields') or []) + list(data.get('totals') or [])
+        values += [party.get('gstin') for party in data.get('parties') or [] if isinstance(party, dict)]
+    else:
+        entries = data if isinstance(data, list) else []
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        label = entry.get('label', entry.get('l'))  # Full or terse prompt profile
+        if isinstance(label, str) and KEY_LABEL.search(label) and not _LINE_ITEM_LABEL.match(label):
+            values.append(entry.get('value', entry.get('v')))
+    unique = []
+    for value in values:
+        if isinstance(value, (str, int, float)) and _compact(str(value)) and str(value) not in unique:
+            unique.append(str(value))
+    return unique[:MAX_KEY_VALUES]
+
+
+def _compact(text: str) -> str:
+    # Letters and digits only, so "1,650.00" matches "1650.00" and "12/03/2024" matches "12-03-2024"
+    return re.sub(r'[^0-9a-z]', '', text.lower())
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+_POPCOUNT_TABLE = np.array([bin(n).count('1') for n in range(256)], np.int64)
+
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    """Set bits of each uint64 (numpy's bitwise_count needs numpy 2)"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values).astype(np.int64)
+    return _POPCOUNT_TABLE[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class MultiIndexHash:
+    """
+    Fixed-capacity index of 64-bit hashes for Hamming range search (multi-index hashing).
+    Each hash is split into `tables` substrings; a hash within radius r of the query is
+    within r // tables bits of it on at least one substring, so each table is probed only
+    at the substring values in that small ball. Entries live in a ring buffer of numpy
+    arrays chained per substring bucket, newest first: memory is fixed by the capacity
+    (about 75 bytes per entry at a million) and the oldest entries are overwritten once full.
+    """
+
+    def __init__(self, capacity: int = 1000000, bits: int = 64):
+        self.capacity = capacity
+        # Substrings of at least log2(capacity) bits keep buckets short when the index is full
+        substring_bits = max(8, min(24, int(round(math.log2(max(2, capacity))))))
+        tables = max(1, bits // substring_bits)
+        self._ranges = []
+        shift = 0
+        for index in range(tables):
+            size = bits // tables + (1 if index < bits % tables else 0)
+            self._ranges.append((shift, size))
+            shift += size
+        self.keys = np.zeros(capacity, np.uint64)
+        self.values = np.zeros(capacity, np.int64)
+        self.times = np.zeros(capacity, np.float64)
+        self._seq = np.full(capacity, -1, np.int64)
+        self._next = np.full((tables, capacity), -1, np.int32)
+        self._heads = [np.full(1 << size, -1, np.int32) for _, size in self._ranges]
+        self._flips = {}
+        self._count = 0
+
+    def add(self, key: int, value: int, timestamp: Optional[float] = None) -> None:
+        self.add_many([key], [value], [time.time() if timestamp is None else timestamp])
+
+    def add_many(self, keys, values, timestamps) -> None:
+        """Add entries in order (oldest first); vectorized, for loading an index in bulk"""
+        keys = np.asarray(keys, np.uint64)[-self.capacity:]
+        values = np.asarray(values, np.int64)[-self.capacity:]
+        timestamps = np.asarray(timestamps, np.float64)[-self.capacity:]
+        if not len(keys):
+            return
+        seq = np.arange(self._count, self._count + len(keys), dtype=np.int64)
+        slots = (seq % self.capacity).astype(np.int32)
+        self._count += len(keys)
+        self.keys[slots], self.values[slots], self.times[slots], self._seq[slots] = keys, values, timestamps, seq
+
+        for table, (shift, size) in enumerate(self._ranges):
+            heads, chain = self._heads[table], self._next[table]
+            substrings = ((keys >> np.uint64(shift)) & np.uint64((1 << size) - 1)).astype(np.int64)
+            # Group the batch by bucket, keeping insertion order inside each bucket
+            order = np.argsort(substrings, kind='stable')
+            grouped, grouped_slots = substrings[order], slots[order]
+            same = grouped[1:] == grouped[:-1]
+            chain[grouped_slots[1:][same]] = grouped_slots[:-1][same]
+            first = np.concatenate(([True], ~same))
+            chain[grouped_slots[first]] = heads[grouped[first]]
+            last = np.concatenate((~same, [True]))
+            heads[grouped[last]] = grouped_slots[last]
+
+    def _flip_masks(self, size: int, radius: int) -> np.ndarray:
+        """All substring masks with at most `radius` bits set"""
+        masks = self._flips.get((size, radius))
+        if masks is None:
+            found = [0]
+            frontier = [0]
+            for _ in range(radius):
+                frontier = sorted({mask | (1 << bit) for mask in frontier for bit in range(size)
+                                   if not mask & (1 << bit) and mask < (1 << bit)})
+                found += frontier
+            masks = self._flips[(size, radius)] = np.asarray(found, np.int64)
+        return masks
+
+    def search(self, key: int, radius: int, since: Optional[float] = None,
+               limit: int = 64) -> List[Tuple[int, int]]:
+        """
+        Values within radius of key as (distance, value), closest then newest first.
+        Only entries added at or after `since` count; each bucket is followed for at
+        most `limit` entries, newest first, to bound the cost of crowded buckets.
+        """
+        # Probed buckets of every table, walked one chain link per step for all of them at once
+        table_radius = radius // len(self._ranges)
+        tables, buckets, slots, shifts, masks = [], [], [], [], []
+        for table, (shift, size) in enumerate(self._ranges):
+            probes = ((key >> shift) & ((1 << size) - 1)) ^ self._flip_masks(size, table_radius)
+            heads = self._heads[table][probes]
+            occupied = heads >= 0
+            count = int(occupied.sum())
+            tables.append(np.full(count, table, np.int64))
+            buckets.append(probes[occupied].astype(np.uint64))
+            slots.append(heads[occupied].astype(np.int64))
+            shifts.append(np.full(count, shift, np.uint64))
+            masks.append(np.full(count, (1 << size) - 1, np.uint64))
+        tables, buckets, slots, shifts, masks = (np.concatenate(values) for values in
+                                                 (tables, buckets, slots, shifts, masks))
+        previous = np.full(len(slots), np.iinfo(np.int64).max, np.int64)
+        query = np.uint64(key)
+        found_slots, found_distances = [], []
+
+        for _ in range(limit):
+            if not len(slots):
+                break
+            seq = self._seq[slots]
+            stored = self.keys[slots]
+            # A slot overwritten since it was chained belongs to another bucket or is newer
+            valid = (((stored >> shifts) & masks) == buckets) & (seq < previous)
+            if since is not None:
+                valid &= self.times[slots] >= since
+            tables, buckets, slots, shifts, masks = tables[valid], buckets[valid], slots[valid], shifts[valid], masks[valid]
+            previous = seq[valid]
+            distances = _popcount(stored[valid] ^ query)
+            hit = distances <= radius
+            found_slots.append(slots[hit])
+            found_distances.append(distances[hit])
+            slots = self._next[tables, slots].astype(np.int64)
+            linked = slots >= 0
+            tables, buckets, slots, shifts, masks, previous = (tables[linked], buckets[linked], slots[linked],
+                                                               shifts[linked], masks[linked], previous[linked])
+
+        if not found_slots:
+            return []
+        found, first = np.unique(np.concatenate(found_slots), return_index=True)
+        distances = np.concatenate(found_distances)[first]
+        order = np.lexsort((-self._seq[found], distances))
+        return [(int(distances[i]), int(self.values[found[i]])) for i in order]
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.keys, self.values, self.times, self._seq, self._next] + self._heads
+        return sum(array.nbytes for array in arrays)
+
+    def __len__(self) -> int:
+        return min(self._count, self.capacity)
+
+
+class DuplicateIndex:
+    """
+    Persistent index of recent model responses by page fingerprint.
+    Responses, fingerprints and signatures live in SQLite so every worker process shares
+    them; each process keeps a MultiIndexHash of the perceptual hashes and picks up rows
+    added by other workers incrementally. A match needs a hash within max_distance bits
+    and a signature within max_difference, for the same model and prompt, within `window`
+    seconds. Rows beyond `capacity` or older than the window are deleted.
+    In reuse mode a match is only answered with the earlier response once the page's OCR
+    text contains that response's key field values (see verify).
+    """
+
+    def __init__(self, path: str, mode: str = 'flag', max_distance: int = 6, max_difference: float = 24.0,
+                 window: float = 7 * 86400, capacity: int = 1000000, max_candidates: int = 16):
+        if mode not in DEDUP_MODES:
+            raise ValueError(f"Invalid DEDUP_MODE '{mode}'. Available modes: {', '.join(DEDUP_MODES)}")
+        self.path = path
+        self.mode = mode
+        self.max_distance = max_distance
+        self.max_difference = max_difference
+        self.window = window
+        self.capacity = capacity
+        self.max_candidates = max_candidates
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._hashes = MultiIndexHash(capacity)
+        self._last_id = 0
+        self._inserts = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS duplicates ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, phash TEXT NOT NULL, request_key TEXT NOT NULL, "
+            "signature BLOB NOT NULL, response TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        conn.commit()
+        self.refresh()
+
+    @property
+    def reuse(self) -> bool:
+        return self.mode == 'reuse'
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def request_key(model: str, prompt_version: str, prompt: Optional[str] = None,
+                    response_format: Optional[Dict[str, Any]] = None) -> str:
+        """Identity of a request apart from the image: responses are only reused for the same one"""
+        payload = json.dumps([model, prompt_version, prompt, response_format], sort_keys=True)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def refresh(self) -> None:
+        """Add rows stored since the last refresh (by any process) to the hash index"""
+        since = time.time() - self.window
+        rows = self._connection().execute(
+            "SELECT id, phash, created_at FROM duplicates WHERE id > ? AND created_at >= ? ORDER BY id DESC LIMIT ?",
+            (self._last_id, since, self.capacity)
+        ).fetchall()
+        if not rows:
+            return
+        rows.reverse()
+        with self._lock:
+            rows = [row for row in rows if row[0] > self._last_id]
+            if rows:
+                self._hashes.add_many([int(row[1], 16) for row in rows], [row[0] for row in rows],
+                                      [row[2] for row in rows])
+                self._last_id = rows[-1][0]
+
+    def match(self, fingerprint: Tuple[int, bytes], request_key: str) -> Optional[Dict[str, Any]]:
+        """
+        Most similar earlier response for a page fingerprint and request, or None.
+        Returns a dict with id, distance, difference and the stored response.
+        """
+        self.refresh()
+        hash_value, signature = fingerprint
+        with self._lock:
+            candidates = self._hashes.search(hash_value, self.max_distance, since=time.time() - self.window,
+                                             limit=self.max_candidates)
+
+        conn = self._connection()
+        best = None
+        for distance, row_id in candidates[:self.max_candidates]:
+            row = conn.execute(
+                "SELECT request_key, signature, response FROM duplicates WHERE id = ?", (row_id,)
+            ).fetchone()
+            if row is None or row[0] != request_key:
+                continue
+            difference = signature_difference(signature, zlib.decompress(row[1]))
+            if difference <= self.max_difference and (best is None or difference < best['difference']):
+                best = {'id': row_id, 'distance': distance, 'difference': round(difference, 1),
+                        'response': json.loads(row[2])}
+        return best
+
+    def add(self, fingerprint: Tuple[int, bytes], request_key: str, response: Dict[str, Any]) -> int:
+        """Store a model response under the page fingerprint; returns the row id"""
+        hash_value, signature = fingerprint
+        conn = self._connection()
+        now = time.time()
+        cursor = conn.execute(
+            "INSERT INTO duplicates (phash, request_key, signature, response, created_at) VALUES (?, ?, ?, ?, ?)",
+            (format(hash_value, 'x'), request_key, zlib.compress(signature), json.dumps(response), now)
+        )
+        conn.commit()
+        self._inserts += 1
+        if self._inserts % 1000 == 0:
+            conn.execute("DELETE FROM duplicates WHERE id <= ? OR created_at < ?",
+                         (cursor.lastrowid - self.capacity, now - self.window))
+            conn.commit()
+        self.refresh()
+        return cursor.lastrowid
+
+    def verify(self, response: Dict[str, Any], page: Optional[BinaryIO]) -> bool:
+        """
+        Whether every key field value of an earlier response is printed on the page, read
+        with Tesseract. A response without key fields, a missing page or an OCR failure
+        never verifies, so the page goes to the model.
+        """
+        values = key_values(response)
+        if not values or page is None:
+            return False
+        try:
+            from modules.ocr_processor import OCRProcessor
+            text = _compact(OCRProcessor().process_image(page))
+        except Exception as e:
+            print(f"Near-duplicate verification failed: {str(e)}")
+            return False
+        missing = [value for value in values if _compact(value) not in text]
+        if missing:
+            print(f"Near-duplicate not reused, key fields not on the page: {', '.join(missing)}")
+        return not missing
+
+    def check(self, fingerprint: Optional[Tuple[int, bytes]], request_key: str,
+              metrics: Optional[Dict[str, Any]] = None, page: Optional[BinaryIO] = None) -> Optional[Dict[str, Any]]:
+        """
+        Look a page up before a model request. A match is recorded in metrics['duplicate']
+        (with action flagged, reused or rejected) and counted. In reuse mode the stored
+        response is returned if verify() confirms it against `page`, the image to be sent.
+        """
+        if fingerprint is None:
+            return None
+        start = time.perf_counter()
+        try:
+            match = self.match(fingerprint, request_key)
+        except Exception as e:
+            print(f"Near-duplicate lookup failed: {str(e)}")
+            return None
+        if match is None:
+            get_registry().observe('extractor_stage_seconds', time.perf_counter() - start, stage='dedup')
+            return None
+        print(f"Near-duplicate of response {match['id']} (distance {match['distance']}, "
+              f"difference {match['difference']})")
+        reused = self.reuse and self.verify(match['response'], page)
+        action = 'reused' if reused else 'rejected' if self.reuse else 'flagged'
+        get_registry().observe('extractor_stage_seconds', time.perf_counter() - start, stage='dedup')
+        get_registry().inc('extractor_duplicates_total', action=action)
+        if metrics is not None:
+            metrics['duplicate'] = {'id': match['id'], 'distance': match['distance'],
+                                    'difference': match['difference'], 'action': action, 'reused': reused}
+        return match['response'] if reused else None
+
+    def remember(self, fingerprint: Optional[Tuple[int, bytes]], request_key: str, response: Dict[str, Any]) -> None:
+        """Store a model response after a request; failures only log"""
+        if fingerprint is None:
+            return
+        try:
+            self.add(fingerprint, request_key, response)
+        except Exception as e:
+            print(f"Near-duplicate store failed: {str(e)}")
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM duplicates").fetchone()[0]
+
+
+_duplicate_index = None
+_duplicate_lock = threading.Lock()
+
+
+def get_duplicate_index() -> Optional[DuplicateIndex]:
+    """
+    Return the process-wide near-duplicate index, or None with DEDUP_MODE=off (default).
+    Configured by DEDUP_MODE (off, flag, reuse), DEDUP_INDEX_PATH, DEDUP_MAX_DISTANCE,
+    DEDUP_MAX_DIFFERENCE, DEDUP_WINDOW (seconds) and DEDUP_MAX_ENTRIES.
+    """
+    global _duplicate_index
+    mode = os.getenv('DEDUP_MODE', 'off').lower()
+    if mode == 'off':
+        return None
+    if _duplicate_index is None:
+        with _duplicate_lock:
+            if _duplicate_index is None:
+                _duplicate_index = DuplicateIndex(
+                    os.getenv('DEDUP_INDEX_PATH', os.path.join('cache', 'duplicates.db')),
+                    mode=mode,
+                    max_distance=int(os.getenv('DEDUP_MAX_DISTANCE', '6')),
+                    max_difference=float(os.getenv('DEDUP_MAX_DIFFERENCE', '24')),
+                    window=float(os.getenv('DEDUP_WINDOW', str(7 * 86400))),
+                    capacity=int(os.getenv('DEDUP_MAX_ENTRIES', '1000000'))
+                )
+    return _duplicate_index
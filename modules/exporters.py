@@ -0,0 +1,301 @@
+import io
+import re
+import csv
+import json
+import importlib.util
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+from modules.structured_output import Document, document_items
+
+# Output formats, their content types and the tables an export can contain
+EXPORT_FORMATS = ('csv', 'jsonl', 'parquet')
+CONTENT_TYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson', 'parquet': 'application/vnd.apache.parquet'}
+EXPORT_TABLES = ('line_items', 'documents')
+
+# Leading columns of each table; the remaining ones come from the extracted labels
+TABLE_COLUMNS = {
+    'line_items': ('document', 'line'),
+    'documents': ('document', 'status', 'error', 'line_items'),
+}
+# Columns holding counts rather than text
+INTEGER_COLUMNS = ('line', 'line_items')
+# Column for the values of labels first seen after the columns were chosen, as a JSON object
+EXTRA_COLUMN = 'extra'
+
+_json_encode = json.JSONEncoder(ensure_ascii=False).encode
+
+_LINE_ITEM_LABEL = re.compile(r'^line\s*item\s*(\d+)\s*[-:]?\s*', re.I)
+
+# Parsed labels: (line item number or None, column). Documents repeat the same few hundred
+# labels, so parsing each once keeps pivoting cheap; cleared when it grows past the limit.
+_parsed_labels = {}
+_PARSED_LABELS_LIMIT = 100000
+
+
+def _parse_label(label: str) -> Tuple[Optional[str], str]:
+    match = _LINE_ITEM_LABEL.match(label)
+    if match:
+        parsed = (match.group(1), label[match.end():].strip() or 'Value')
+    else:
+        parsed = (None, label.strip())
+    if len(_parsed_labels) >= _PARSED_LABELS_LIMIT:
+        _parsed_labels.clear()
+    _parsed_labels[label] = parsed
+    return parsed
+
+
+def _put(columns: Dict[str, str], column: str, value: str) -> None:
+    # A label repeated with another value (e.g. the GSTIN of each party) gets a " (2)" suffix
+    if column in columns and columns[column] != value:
+        n = 2
+        while f"{column} ({n})" in columns and columns[f"{column} ({n})"] != value:
+            n += 1
+        column = f"{column} ({n})"
+    columns[column] = value
+
+
+def pivot_results(results: List[Dict[str, str]]) -> Tuple[Dict[str, str], List[Dict[str, str]]]:
+    """
+    Split extracted items into document fields (label -> value) and line items, one
+    dict (column -> value) per "Line Item N - Column" number in the order they appear.
+    """
+    fields = {}
+    line_items = {}
+    for item in results or []:
+        label = item.get('label') or ''
+        number, column = _parsed_labels.get(label) or _parse_label(label)
+        columns = fields if number is None else line_items.get(number)
+        if columns is None:
+            columns = line_items[number] = {}
+        value = item.get('value')
+        if not isinstance(value, str):
+            value = '' if value is None else str(value)
+        _put(columns, column, value)
+    return fields, list(line_items.values())
+
+
+def pivot_document(document: Dict[str, Any]) -> Tuple[Dict[str, str], List[Dict[str, str]]]:
+    """
+    pivot_results for a structured result (Document.to_dict): fields and line items are
+    read from the typed document, so no labels are parsed and rows can't be mixed up
+    """
+    field_pairs, rows = Document.from_dict(document).to_rows()
+    fields = {}
+    for label, value in field_pairs:
+        _put(fields, label, value)
+    line_items = []
+    for row in rows:
+        columns = {}
+        for column, value in row:
+            _put(columns, column, value)
+        line_items.append(columns)
+    return fields, line_items
+
+
+def record_from_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Export record of a finished job from the job store"""
+    record = {'document': job.get('filename') or job['id'], 'id': job['id'], 'status': job['status'],
+              'error': job.get('error'), 'results': job.get('result') or []}
+    if isinstance(record['results'], dict):
+        # Structured mode jobs store the typed result
+        record['structured'] = record['results']
+        record['results'] = document_items(record['structured'])
+    return record
+
+
+def iter_ndjson_records(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Export records from the NDJSON written by /batch or `python -m modules.cli extract`,
+    one document per line; summary and skipped-file lines are passed over
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        if 'summary' in record or record.get('status') == 'skipped':
+            continue
+        yield {'document': record.get('document') or record.get('filename') or str(record.get('index', '')),
+               'status': record.get('status', 'done'), 'error': record.get('error'),
+               'results': record.get('results') or [], 'structured': record.get('structured')}
+
+
+def iter_rows(records: Iterable[Dict[str, Any]], table: str = 'line_items') -> Iterator[Dict[str, Any]]:
+    """
+    Flat rows of an export table: one per line item (document, line and its columns) or
+    one per document (document, status, error, number of line items and its fields).
+    Records of structured mode carry the typed result in 'structured', which is used
+    instead of the flattened results.
+    """
+    for record in records:
+        if record.get('structured'):
+            fields, line_items = pivot_document(record['structured'])
+        else:
+            fields, line_items = pivot_results(record.get('results'))
+        if table == 'documents':
+            leading = {'document': record['document'], 'status': record.get('status', 'done'),
+                       'error': record.get('error') or '', 'line_items': len(line_items)}
+            row = dict(leading)
+            row.update(fields)
+            row.update(leading)  # Leading columns win over labels with the same name
+            yield row
+            continue
+        for line, columns in enumerate(line_items, 1):
+            row = {'document': record['document'], 'line': line}
+            row.update(columns)
+            row['document'], row['line'] = record['document'], line
+            yield row
+
+
+class ColumnSet:
+    """
+    Fixed columns for a streamed table. The columns are chosen from the first `sample`
+    rows; values of labels first seen later go into EXTRA_COLUMN as a JSON object, so
+    the header never has to change once written and memory stays bounded.
+    """
+
+    def __init__(self, leading: Tuple[str, ...], sample_rows: List[Dict[str, Any]],
+                 columns: Optional[List[str]] = None):
+        names = list(leading)
+        if columns:
+            names += [column for column in columns if column not in names]
+        else:
+            seen = set(names)
+            for row in sample_rows:
+                for column in row:
+                    if column not in seen:
+                        seen.add(column)
+                        names.append(column)
+        self.names = names + [EXTRA_COLUMN]
+        self._known = set(names)
+
+    def values(self, row: Dict[str, Any]) -> List[Any]:
+        get = row.get
+        values = [get(column, '') for column in self.names[:-1]]
+        if self._known.issuperset(row):
+            values.append('')
+        else:
+            extra = {column: value for column, value in row.items() if column not in self._known}
+            values.append(json.dumps(extra, ensure_ascii=False))
+        return values
+
+
+def _sampled(rows: Iterator[Dict[str, Any]], sample: int) -> Tuple[List[Dict[str, Any]], Iterator[Dict[str, Any]]]:
+    head = []
+    for row in rows:
+        head.append(row)
+        if len(head) >= sample:
+            break
+    return head, rows
+
+
+def _csv_chunks(rows: Iterator[Dict[str, Any]], leading: Tuple[str, ...], columns: Optional[List[str]],
+                sample: int, chunk_size: int) -> Iterator[bytes]:
+    head, rest = _sampled(rows, sample)
+    column_set = ColumnSet(leading, head, columns)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(column_set.names)
+    for source in (head, rest):
+        for row in source:
+            writer.writerow(column_set.values(row))
+            if buffer.tell() >= chunk_size:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def _jsonl_chunks(rows: Iterator[Dict[str, Any]], chunk_size: int) -> Iterator[bytes]:
+    lines = []
+    size = 0
+    for row in rows:
+        line = _json_encode(row)
+        lines.append(line)
+        size += len(line) + 1
+        if size >= chunk_size:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines, size = [], 0
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file collecting what pyarrow writes, handed out chunk by chunk"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _parquet_chunks(rows: Iterator[Dict[str, Any]], leading: Tuple[str, ...], columns: Optional[List[str]],
+                    sample: int, row_group_size: int) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    head, rest = _sampled(rows, sample)
+    column_set = ColumnSet(leading, head, columns)
+    schema = pa.schema([(name, pa.int32() if name in INTEGER_COLUMNS else pa.string())
+                        for name in column_set.names])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+
+    def write_group(group):
+        table_columns = list(zip(*[column_set.values(row) for row in group]))
+        arrays = [pa.array([value if value != '' else None for value in values], type=field.type)
+                  for field, values in zip(schema, table_columns)]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema), row_group_size=row_group_size)
+
+    group = []
+    for source in (head, rest):
+        for row in source:
+            group.append(row)
+            if len(group) >= row_group_size:
+                write_group(group)
+                group = []
+                yield sink.drain()
+    if group:
+        write_group(group)
+    writer.close()
+    yield sink.drain()
+
+
+def export_chunks(records: Iterable[Dict[str, Any]], fmt: str = 'csv', table: str = 'line_items',
+                  columns: Optional[List[str]] = None, sample: int = 1000,
+                  chunk_size: int = 64 * 1024, row_group_size: int = 50000) -> Iterator[bytes]:
+    """
+    Export records ({'document', 'status', 'error', 'results' and optionally 'structured'}) as
+    a stream of encoded chunks of a CSV, JSONL or Parquet file, for a streamed HTTP response
+    or a file.
+    Records are pulled as needed: memory holds the first `sample` rows (used to choose the
+    columns unless `columns` is given), one output chunk and at most one Parquet row group.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Invalid export format. Available formats: {', '.join(EXPORT_FORMATS)}")
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Invalid export table. Available tables: {', '.join(EXPORT_TABLES)}")
+    rows = iter_rows(records, table)
+    if fmt == 'jsonl':
+        return _jsonl_chunks(rows, chunk_size)
+    if fmt == 'parquet':
+        # Checked up front so a streamed response does not fail after it started
+        if importlib.util.find_spec('pyarrow') is None:
+            raise ImportError("Parquet export requires the pyarrow package (pip install pyarrow)")
+        return _parquet_chunks(rows, TABLE_COLUMNS[table], columns, sample, row_group_size)
+    return _csv_chunks(rows, TABLE_COLUMNS[table], columns, sample, chunk_size)
@@ -0,0 +1,86 @@
+import os
+import threading
+from typing import Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Status codes worth retrying: rate limiting and transient upstream failures
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_sessions = {}  # status_retries -> session of this process
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_pool_size() -> int:
+    """
+    Connection pool size. It must cover the concurrent model requests of a process, so it
+    defaults to the larger of the gunicorn thread count and the /batch fan-out
+    """
+    pool_size = os.getenv('HTTP_POOL_SIZE')
+    if pool_size:
+        return int(pool_size)
+    return max(int(os.getenv('WEB_THREADS', '3')), int(os.getenv('BATCH_MAX_CONCURRENCY', '16')))
+
+
+def get_timeouts() -> Tuple[float, float]:
+    """(connect, read) timeouts in seconds for model API requests"""
+    connect_timeout = float(os.getenv('OPENROUTER_CONNECT_TIMEOUT', '10'))
+    read_timeout = float(os.getenv('OPENROUTER_READ_TIMEOUT', '60'))
+    return connect_timeout, read_timeout
+
+
+def create_session(pool_size: Optional[int] = None,
+                   max_retries: Optional[int] = None,
+                   backoff_factor: Optional[float] = None,
+                   status_retries: bool = True) -> requests.Session:
+    """
+    Create a keep-alive session with a connection pool sized for concurrent
+    request threads and retry-with-backoff for 429/5xx responses
+    (connection failures only when status_retries is False)
+    """
+    if pool_size is None:
+        pool_size = get_pool_size()
+    if max_retries is None:
+        max_retries = int(os.getenv('HTTP_MAX_RETRIES', '2'))
+    if backoff_factor is None:
+        backoff_factor = float(os.getenv('HTTP_RETRY_BACKOFF', '1.0'))
+
+    retry = Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=0,  # A read timeout means the model is slow, retrying only doubles the wait
+        status=max_retries if status_retries else 0,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES if status_retries else (),
+        allowed_methods=frozenset(['GET', 'POST']),
+        respect_retry_after_header=True,
+        raise_on_status=False  # Hand the final error response back to the caller
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(status_retries: bool = True) -> requests.Session:
+    """
+    Return the process-wide session, creating fresh ones after a fork. Without
+    status_retries, 429/5xx responses are returned at once, e.g. to the model router,
+    which falls back to another model and counts them towards the circuit breaker.
+    """
+    global _session_pid
+    pid = os.getpid()
+    session = _sessions.get(status_retries) if _session_pid == pid else None
+    if session is None:
+        with _session_lock:
+            if _session_pid != pid:
+                _sessions.clear()
+                _session_pid = pid
+            session = _sessions.get(status_retries)
+            if session is None:
+                session = _sessions[status_retries] = create_session(status_retries=status_retries)
+    return session
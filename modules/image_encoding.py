@@ -0,0 +1,197 @@
+import os
+import io
+from typing import Dict, Any, Optional, Tuple
+from PIL import Image, features
+
+# Saturation (0-255) above which a pixel counts as coloured
+_SATURATION_THRESHOLD = 40
+
+
+def _env_flag(name: str, default: Optional[bool]) -> Optional[bool]:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+class EncodingPolicy:
+    """
+    How images are prepared for a model: resolution limits, byte budget,
+    JPEG quality range and content-aware options.
+    """
+
+    def __init__(self, max_side: int = 2048, max_short_side: Optional[int] = None,
+                 max_bytes: Optional[int] = None, quality: int = 75, min_quality: int = 35,
+                 grayscale: bool = True, line_art_format: Optional[str] = 'PNG',
+                 autocrop: bool = False):
+        self.max_side = max_side
+        self.max_short_side = max_short_side
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.min_quality = min_quality
+        self.grayscale = grayscale
+        self.line_art_format = line_art_format.upper() if line_art_format else None
+        self.autocrop = autocrop
+
+    @classmethod
+    def from_model_config(cls, model_config: Dict[str, Any]) -> 'EncodingPolicy':
+        """
+        Build the policy for a MODELS entry. Settings in its "encoding" dict
+        override the defaults, and IMAGE_* environment variables override both.
+        """
+        settings = dict(model_config.get('encoding', {}))
+        for key, env in (('max_side', 'IMAGE_MAX_SIDE'), ('max_bytes', 'IMAGE_MAX_BYTES'),
+                         ('quality', 'IMAGE_QUALITY'), ('min_quality', 'IMAGE_MIN_QUALITY')):
+            if os.getenv(env):
+                settings[key] = int(os.getenv(env))
+        for key, env in (('grayscale', 'IMAGE_GRAYSCALE'), ('autocrop', 'IMAGE_AUTOCROP')):
+            flag = _env_flag(env, None)
+            if flag is not None:
+                settings[key] = flag
+        if os.getenv('IMAGE_LINE_ART_FORMAT') is not None:
+            settings['line_art_format'] = os.getenv('IMAGE_LINE_ART_FORMAT') or None
+        return cls(**settings)
+
+    def target_size(self, width: int, height: int) -> Tuple[int, int]:
+        """Largest size within the resolution limits, never upscaling"""
+        ratio = min(1.0, self.max_side / max(width, height))
+        if self.max_short_side:
+            ratio = min(ratio, self.max_short_side / min(width, height))
+        return max(1, int(width * ratio)), max(1, int(height * ratio))
+
+    def fits(self, width: int, height: int, num_bytes: int) -> bool:
+        """Whether an already-encoded JPEG can be sent as is"""
+        return (self.target_size(width, height) == (width, height)
+                and (self.max_bytes is None or num_bytes <= self.max_bytes)
+                and not self.autocrop)
+
+
+def is_monochrome(img: Image.Image) -> bool:
+    """True when almost no pixels carry colour, e.g. a black and white scan saved as RGB"""
+    sample = img.convert('RGB')
+    sample.thumbnail((256, 256))
+    saturation = sample.convert('HSV').getchannel('S')
+    histogram = saturation.histogram()
+    coloured = sum(histogram[_SATURATION_THRESHOLD:])
+    return coloured <= 0.002 * sample.width * sample.height
+
+
+def is_line_art(img: Image.Image, dominant_colors: int = 4, coverage: float = 0.95) -> bool:
+    """
+    True for digitally rendered documents, which compress best losslessly: a few flat
+    colours (paper, ink) cover nearly every pixel. Scans and photos spread the paper
+    over many noisy shades instead.
+    """
+    sample = img.copy()
+    # Nearest without a reducing pass keeps exact colours, no blended edges
+    sample.thumbnail((512, 512), Image.NEAREST, reducing_gap=None)
+    colors = sample.convert('RGB').getcolors(maxcolors=4096)
+    if colors is None:
+        return False
+    top = sorted((count for count, _ in colors), reverse=True)[:dominant_colors]
+    return sum(top) >= coverage * sample.width * sample.height
+
+
+def crop_margins(img: Image.Image, margin: int = 16) -> Image.Image:
+    """Crop blank page margins using the OCR processor's content detection"""
+    import numpy as np
+    from modules.ocr_processor import OCRProcessor
+
+    bounds = OCRProcessor().find_content_bounds(np.asarray(img.convert('L')), margin=margin)
+    if bounds is None:
+        return img
+    x, y, w, h = bounds
+    # Only worth it when it removes a noticeable amount of the page
+    if w * h > 0.9 * img.width * img.height:
+        return img
+    return img.crop((x, y, x + w, y + h))
+
+
+def _save(img: Image.Image, fmt: str, quality: int) -> io.BytesIO:
+    buffered = io.BytesIO()
+    if fmt == 'JPEG':
+        img.save(buffered, format='JPEG', quality=quality, optimize=True)
+    elif fmt == 'WEBP':
+        img.save(buffered, format='WEBP', lossless=True)
+    else:
+        img.save(buffered, format=fmt, optimize=True)
+    buffered.seek(0)
+    return buffered
+
+
+def encode_for_model(img: Image.Image, policy: EncodingPolicy,
+                     fingerprint: bool = False) -> Tuple[io.BytesIO, Dict[str, Any]]:
+    """
+    Encode a decoded image according to the policy.
+    Returns the encoded bytes as a stream and a dict describing the choices made.
+    With fingerprint, the dict also holds the near-duplicate fingerprint of the
+    downscaled image under 'fingerprint' (see modules/duplicate_index.py).
+    """
+    info = {'original_size': list(img.size)}
+
+    if policy.autocrop:
+        cropped = crop_margins(img)
+        if cropped.size != img.size:
+            info['cropped'] = True
+            img = cropped
+
+    fmt = 'JPEG'
+    size = policy.target_size(img.width, img.height)
+    if size != img.size:
+        img = img.convert('RGB') if img.mode not in ('RGB', 'L') else img
+        img = img.resize(size, Image.LANCZOS, reducing_gap=3.0)
+    elif policy.line_art_format and is_line_art(img):
+        # Only at native resolution: resampling blends edges into many colours,
+        # which loses the lossless size advantage
+        fmt = policy.line_art_format
+        if fmt == 'WEBP' and not features.check('webp'):
+            fmt = 'PNG'
+
+    if fingerprint:
+        from modules.duplicate_index import image_fingerprint
+        info['fingerprint'] = image_fingerprint(img)
+
+    if policy.grayscale and is_monochrome(img):
+        img = img.convert('L')
+        info['grayscale'] = True
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    quality = policy.quality
+    buffered = _save(img, fmt, quality)
+
+    # Lossless output over budget falls back to JPEG
+    if policy.max_bytes and fmt != 'JPEG' and buffered.getbuffer().nbytes > policy.max_bytes:
+        fmt = 'JPEG'
+        buffered = _save(img, fmt, quality)
+
+    # Binary search the highest JPEG quality within the byte budget, then shrink if even the floor is too big
+    if policy.max_bytes and fmt == 'JPEG' and buffered.getbuffer().nbytes > policy.max_bytes:
+        while True:
+            low, high, best = policy.min_quality, quality - 1, None
+            while low <= high:
+                mid = (low + high) // 2
+                candidate = _save(img, fmt, mid)
+                if candidate.getbuffer().nbytes <= policy.max_bytes:
+                    best, quality, low = candidate, mid, mid + 1
+                else:
+                    high = mid - 1
+            if best is not None:
+                buffered = best
+                break
+            if max(img.size) <= 512:
+                quality = policy.min_quality
+                buffered = _save(img, fmt, quality)
+                break
+            img = img.resize((int(img.width * 0.8), int(img.height * 0.8)), Image.LANCZOS)
+            quality = policy.quality
+
+    info.update({
+        'size': list(img.size),
+        'format': fmt.lower(),
+        'mime': Image.MIME[fmt],
+        'bytes': buffered.getbuffer().nbytes,
+    })
+    if fmt == 'JPEG':
+        info['quality'] = quality
+    return buffered, info
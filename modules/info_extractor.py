@@ -1,288 +1,606 @@
 import os
 import base64
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterator, List, BinaryIO, Optional, Tuple, Union
 import json
+import time
+import threading
 import requests
+from concurrent.futures import CancelledError
 from PIL import Image, UnidentifiedImageError
 import io
 import PIL
+from modules.http_session import get_session, get_timeouts
+from modules.rate_limit import get_rate_limiter
+from modules.image_encoding import EncodingPolicy, encode_for_model
+from modules.duplicate_index import get_duplicate_index, image_fingerprint
+from modules.json_stream import JSONArrayStreamParser
+from modules.metrics import get_registry, observe_bytes, observe_stage, record_usage
+from modules.prompts import PromptProfile, get_profile
+
+# Bytes of image read per base64 step when building the request body (multiple of 3)
+BASE64_CHUNK_SIZE = 3 * 256 * 1024
+
+# Model choice that routes each request to the fastest healthy model (see modules/model_router.py)
+ROUTER_MODEL = "auto"
+
+# Request body templates kept per extractor (prompt, MIME type and streaming vary)
+_BODY_TEMPLATES_LIMIT = 64
 
 class AIInfoExtractor:
+    # Bump whenever the prompt or post-processing changes so cached results are invalidated.
+    # Extractors append the version of their prompt profile.
+    PROMPT_VERSION = "1"
+
+
     MODELS = {
         "gemini-flash": {
             "name": "google/gemini-flash-1.5",  # Updated model name
             "url": "https://openrouter.ai/api/v1/chat/completions",
-            "needs_key": "OPENROUTER_API_KEY"
+            "needs_key": "OPENROUTER_API_KEY",
+            "provider": "openrouter",
+            "structured_output": True,  # Accepts response_format json_schema
+            "encoding": {"max_side": 2048}
         },
         "gpt4-mini": {
             "name": "gpt-4o-mini",
             "url": "https://openrouter.ai/api/v1/chat/completions",
-            "needs_key": "OPENROUTER_API_KEY"
+            "needs_key": "OPENROUTER_API_KEY",
+            "provider": "openrouter",
+            "structured_output": True,
+            # OpenAI scales high-detail images to fit 2048 px and then 768 px on the short side
+            "encoding": {"max_side": 2048, "max_short_side": 768}
         },
     }
 
-    def __init__(self, model_choice="gpt4-mini"):
+    def __init__(self, model_choice="gpt4-mini", session=None, timeout=None,
+                 profile: Optional[Union[str, PromptProfile]] = None):
         if model_choice not in self.MODELS:
             raise ValueError(f"Invalid model choice. Available models: {', '.join(self.MODELS.keys())}")
             
         model_config = self.MODELS[model_choice]
         self.model = model_config["name"]
         self.api_url = model_config["url"]
+        self.structured_output = model_config.get("structured_output", False)
         
         # Get API key
         self.api_key = os.getenv(model_config["needs_key"])
         if not self.api_key:
             raise ValueError(f"{model_config['needs_key']} environment variable is required")
-        
-    def encode_image(self, image_path: str) -> str:
-        """Convert image to base64 string"""
-        if not os.path.exists(image_path):
-            raise Exception("Image file not found")
-            
-        file_size = os.path.getsize(image_path)
+
+        # Pooled keep-alive session shared by every extractor in the process
+        self._session = session
+        self.timeout = timeout if timeout is not None else get_timeouts()
+
+        # Requests per second are limited per provider across all models and threads
+        self.rate_limiter = get_rate_limiter(model_config["provider"])
+
+        # Resolution, byte budget and format choices for images sent to this model
+        self.encoding_policy = EncodingPolicy.from_model_config(model_config)
+
+        # Prompt variant (PROMPT_PROFILE by default); cached results are kept per profile
+        self.profile = profile if isinstance(profile, PromptProfile) else get_profile(profile)
+        self.PROMPT_VERSION = f"{self.PROMPT_VERSION}{self.profile.version}"
+        self._body_templates = {}
+
+    @property
+    def session(self) -> requests.Session:
+        # Resolved per call so extractors created before a fork use the child's pool
+        return self._session if self._session is not None else get_session()
+
+    def prepare_image(self, source: Union[str, BinaryIO, Image.Image],
+                      fingerprint: bool = False) -> Tuple[BinaryIO, Dict[str, Any]]:
+        """
+        Encode an image for the model according to its encoding policy.
+        `source` is a file path, a seekable binary stream (e.g. an upload's stream)
+        or an already decoded image such as a rendered document page.
+        Returns a binary stream of the encoded image and a dict describing the encoding.
+        JPEGs the policy accepts as they are are passed through without decoding;
+        oversized JPEGs are decoded at reduced scale.
+        With `fingerprint`, the dict also holds the near-duplicate fingerprint under 'fingerprint'.
+        """
+        if isinstance(source, Image.Image):
+            encoded, info = encode_for_model(source, self.encoding_policy, fingerprint=fingerprint)
+            print(f"Encoded page image: {dict((k, v) for k, v in info.items() if k != 'fingerprint')}")
+            return encoded, info
+
+        if isinstance(source, str):
+            if not os.path.exists(source):
+                raise Exception("Image file not found")
+            file_size = os.path.getsize(source)
+        else:
+            source.seek(0, os.SEEK_END)
+            file_size = source.tell()
+            source.seek(0)
+
         if file_size > 15 * 1024 * 1024:  # 15MB limit
             raise Exception("Image file is too large (max 15MB)")
-            
+
         try:
-            with Image.open(image_path) as img:
-                print(f"Image opened successfully: {image_path}")
-                print(f"Image size: {img.size}, mode: {img.mode}")
-                
-                # Convert to RGB if needed
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                    print("Converted image to RGB mode")
-                
-                # Resize if too large (max 2048 pixels in either dimension)
-                max_size = 2048
-                if img.width > max_size or img.height > max_size:
-                    ratio = min(max_size/img.width, max_size/img.height)
-                    new_size = (int(img.width * ratio), int(img.height * ratio))
-                    img = img.resize(new_size, Image.LANCZOS)
-                    print(f"Resized image to: {new_size}")
-                
-                # Convert to base64
-                buffered = io.BytesIO()
-                img.save(buffered, format="JPEG")
-                base64_image = base64.b64encode(buffered.getvalue()).decode('utf-8')
-                print(f"Image successfully encoded to base64 (length: {len(base64_image)})")
-                return base64_image
+            with Image.open(source) as img:
+                print(f"Image opened successfully: {source if isinstance(source, str) else 'upload stream'}")
+                print(f"Image size: {img.size}, mode: {img.mode}, format: {img.format}")
+                original_size = list(img.size)
+                policy = self.encoding_policy
+
+                # Already what the policy would produce, send the original bytes
+                if img.format == 'JPEG' and img.mode == 'RGB' and policy.fits(img.width, img.height, file_size):
+                    print("Passing JPEG through without re-encoding")
+                    info = {'original_size': original_size, 'size': original_size, 'format': 'jpeg',
+                            'mime': 'image/jpeg', 'bytes': file_size, 'passthrough': True}
+                    if fingerprint:
+                        # Only a small copy is needed, the decoder can scale down while decoding
+                        img.draft('RGB', (512, 512))
+                        info['fingerprint'] = image_fingerprint(img)
+                    if isinstance(source, str):
+                        return open(source, 'rb'), info
+                    source.seek(0)
+                    return source, info
+
+                # JPEG only: let the decoder scale down by 1/2, 1/4 or 1/8 while decoding.
+                # Landing up to 5% under the target lets large phone photos decode at reduced scale.
+                target_size = policy.target_size(img.width, img.height)
+                if img.format == 'JPEG' and target_size != tuple(img.size):
+                    img.draft('RGB', (int(target_size[0] * 0.95), int(target_size[1] * 0.95)))
+                    print(f"Decoding JPEG at reduced scale: {img.size}")
+
+                encoded, info = encode_for_model(img, policy, fingerprint=fingerprint)
+                info['original_size'] = original_size
+                print(f"Encoded image: {dict((k, v) for k, v in info.items() if k != 'fingerprint')}")
+                return encoded, info
         except Exception as e:
             print(f"Error encoding image: {str(e)}")
             raise
 
-    def extract_info(self, image_path: str) -> List[Dict[str, str]]:
+    def encode_image(self, source: Union[str, BinaryIO]) -> str:
+        """Convert image to base64 string"""
+        encoded, _ = self.prepare_image(source)
+        try:
+            base64_image = base64.b64encode(encoded.read()).decode('utf-8')
+        finally:
+            if encoded is not source:  # Never close the caller's stream
+                encoded.close()
+        print(f"Image successfully encoded to base64 (length: {len(base64_image)})")
+        return base64_image
+
+    def build_headers(self) -> Dict[str, str]:
+        """HTTP headers for the chat completions request"""
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "HTTP-Referer": "https://github.com/",
+            "Content-Type": "application/json"
+        }
+
+    def build_request_data(self, base64_image: str, mime_type: str = "image/jpeg",
+                           prompt: Optional[str] = None, stream: bool = False,
+                           response_format: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Chat completions request body carrying the prompt and the encoded image.
+        `prompt` replaces the prompt of the extractor's profile; `stream` asks for server-sent
+        events and `response_format` constrains the output, e.g. to a JSON schema.
+        The profile instructions come first and unchanged, also when a prompt extends them.
+        """
+        prompt = prompt or self.profile.prompt
+        base = self.profile.prompt
+        if prompt != base and prompt.startswith(base):
+            parts = [{"type": "text", "text": base}, {"type": "text", "text": prompt[len(base):].lstrip('\n')}]
+        else:
+            parts = [{"type": "text", "text": prompt}]
+        data = {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": parts + [
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:{mime_type};base64,{base64_image}"
+                            }
+                        }
+                    ]
+                }
+            ]
+        }
+        if stream:
+            data["stream"] = True
+        if response_format is not None:
+            data["response_format"] = response_format
+        return data
+
+    def build_request_body(self, image: BinaryIO, mime_type: str = "image/jpeg", prompt: Optional[str] = None,
+                           stream: bool = False, response_format: Optional[Dict[str, Any]] = None) -> io.BytesIO:
+        """
+        Serialize the request body, base64-encoding the image stream chunk by chunk
+        straight into the body buffer. This avoids holding the base64 string, the
+        data URL and the serialized JSON as separate copies of the image.
+        """
+        prefix, suffix = self._body_template(mime_type, prompt, stream, response_format)
+
+        body = io.BytesIO()
+        body.write(prefix.encode('utf-8'))
+        # Chunks are a multiple of 3 bytes so no base64 padding appears mid-stream
+        for chunk in iter(lambda: image.read(BASE64_CHUNK_SIZE), b''):
+            body.write(base64.b64encode(chunk))
+        body.write(suffix.encode('utf-8'))
+        body.seek(0)
+        return body
+
+    def _body_template(self, mime_type: str, prompt: Optional[str], stream: bool,
+                       response_format: Optional[Dict[str, Any]]) -> Tuple[str, str]:
+        """Serialized request body before and after the base64 image, built once per prompt"""
+        placeholder = "__IMAGE_BASE64__"
+        if response_format is not None:
+            return tuple(json.dumps(self.build_request_data(placeholder, mime_type, prompt, stream,
+                                                            response_format)).split(placeholder))
+        key = (mime_type, prompt, stream)
+        template = self._body_templates.get(key)
+        if template is None:
+            if len(self._body_templates) >= _BODY_TEMPLATES_LIMIT:
+                self._body_templates.clear()
+            template = tuple(json.dumps(self.build_request_data(placeholder, mime_type, prompt, stream)).split(placeholder))
+            self._body_templates[key] = template
+        return template
+
+    def check_error_response(self, status_code: int, text: str) -> None:
+        """Raise a descriptive error for well-known API failures"""
+        if status_code != 200:
+            print(f"\nAPI Error Response: {text}")
+            if "model not found" in text.lower():
+                raise Exception(f"Model '{self.model}' is not available. Please try a different model.")
+            elif "unauthorized" in text.lower():
+                raise Exception("API key is invalid or expired. Please check your OPENROUTER_API_KEY.")
+
+    def parse_response(self, result: Dict[str, Any]) -> List[Dict[str, str]]:
+        """Parse a chat completions response into cleaned label/value/remarks items"""
+        print("\nAPI Response received:")
+        print(json.dumps(result, indent=2))
+
+        # Get the content from the response
+        if isinstance(result, dict) and 'choices' in result and len(result['choices']) > 0:
+            content = result['choices'][0].get('message', {}).get('content', '')
+            print("\nExtracted content:", content)
+
+            # Try to clean the content if it contains markdown code blocks
+            if "```json" in content:
+                content = content.split("```json")[1].split("```")[0].strip()
+                print("\nCleaned content from markdown:", content)
+        else:
+            print("\nUnexpected API response format")
+            raise Exception("Unexpected API response format")
+
+        # Parse the JSON response
+        try:
+            # Find the first '[' and last ']' to extract the JSON array
+            start_idx = content.find('[')
+            end_idx = content.rfind(']')
+
+            if start_idx == -1 or end_idx == -1:
+                print("\nNo JSON array found in response")
+                if "```" in content:
+                    raise Exception("Model returned markdown instead of JSON. Please try GPT-4 Mini model.")
+                raise Exception("No JSON array found in response")
+
+            json_str = content[start_idx:end_idx + 1]
+            print("\nExtracted JSON string:", json_str)
+
+            try:
+                extracted_data = json.loads(json_str)
+            except json.JSONDecodeError:
+                # Try to clean the string if initial parse fails
+                json_str = json_str.replace('\n', ' ').replace('\r', '')
+                json_str = ' '.join(json_str.split())  # Normalize whitespace
+                extracted_data = json.loads(json_str)
+
+            if not isinstance(extracted_data, list):
+                print("\nExtracted data is not a list")
+                raise Exception("Extracted data is not a list")
+
+            # Validate and clean the extracted data
+            cleaned_data = self._clean_extracted_data(extracted_data)
+            print("\nCleaned data:", json.dumps(cleaned_data, indent=2))
+
+            return cleaned_data
+
+        except json.JSONDecodeError as e:
+            print(f"\nJSON Decode Error: {str(e)}")
+            print("Content:", content)
+            raise Exception("Model returned invalid JSON format. Please try GPT-4 Mini model.")
+
+    def extract_info(self, source: Union[str, BinaryIO, Image.Image],
+                     metrics: Optional[Dict[str, Any]] = None, prompt: Optional[str] = None,
+                     cancel: Optional[threading.Event] = None) -> List[Dict[str, str]]:
         """
         Extract information from any transactional document using AI vision model
+        `source` is an image file path, a seekable binary stream or a decoded image
+        When a `metrics` dict is given, the image encoding chosen and stage timings are recorded in it
+        `prompt` replaces the default extraction prompt, e.g. a shorter template-specific one
+        `cancel` abandons the request if set before it is sent (used by hedged requests)
         Returns a list of dictionaries with label, value, and remarks for each extracted piece of information
         """
         try:
-            print(f"\nStarting extraction for image: {image_path}")
-            
-            # Encode image
-            base64_image = self.encode_image(image_path)
-            
-            # Prepare the prompt
-            prompt = """Analyze this transactional document and extract all relevant information.
-
-For each piece of information you find:
-1. Identify what the information represents (the label)
-2. Extract its corresponding value
-3. Add any relevant remarks about the information
-
-For line items (products/services):
-- Extract each line item separately with sequential numbering
-- For each line item, extract ALL available columns/fields present in the document, such as:
-  * Product/service name
-  * HSN/SAC code
-  * Quantity and unit
-  * Rate/price
-  * Amount
-  * Taxable value
-  * Tax percentages (CGST%, SGST%, IGST%, etc.)
-  * Tax amounts (CGST Amount, SGST Amount, IGST Amount, etc.)
-  * Net amount
-  * Any other columns specific to the document
-- Include line number in all labels (e.g., "Line Item 1 - Product", "Line Item 1 - HSN/SAC", "Line Item 1 - CGST Amount")
-- Do not combine multiple line items into a single entry
-- Be thorough in capturing all columns present for each line item
-
-For summary tables and totals:
-- Extract all summary tables (e.g., HSN/SAC summary, tax summary)
-- Capture row-wise details from summary tables
-- Include table context in label (e.g., "HSN Summary - HSN Code", "HSN Summary - Taxable Value")
-- Extract all total/subtotal rows with proper context
-
-For party information (buyer/seller/other):
-- Include party context in remarks for identifiers (PAN, GST, address)
-- Clearly indicate which party each piece of information belongs to
-- Distinguish between billing/shipping addresses if both present
-
-Look for any important business information such as:
-- Document identifiers (reference numbers, dates)
-- Party details (with clear buyer/seller distinction)
-- Contact information (with party context)
-- Tax identification numbers (with party context)
-- Line items (with ALL columns and details)
-- Summary tables and their details
-- Monetary amounts and calculations
-- Payment/banking details
-- Any other relevant information
-
-Return the information as a list of JSON objects with these fields:
-- label: What this information represents (include line numbers for line items)
-- value: The actual value found
-- remarks: Any relevant notes (include party context for identifiers)
-
-Example format:
-[
-    {
-        "label": "Document Type",
-        "value": "Sales Invoice",
-        "remarks": "Determined from document header"
-    },
-    {
-        "label": "GST Number",
-        "value": "03AAFF2431N1ZR",
-        "remarks": "Belongs to seller (FASHION ARTS)"
-    },
-    {
-        "label": "Line Item 1 - Product",
-        "value": "FRONT PANNEL - 1010",
-        "remarks": "First product line item"
-    },
-    {
-        "label": "Line Item 1 - HSN/SAC",
-        "value": "998822",
-        "remarks": "HSN code for first line item"
-    },
-    {
-        "label": "Line Item 1 - CGST Amount",
-        "value": "1385.65",
-        "remarks": "CGST amount for first line item"
-    },
-    {
-        "label": "HSN Summary - HSN Code",
-        "value": "998822",
-        "remarks": "From HSN/SAC summary table"
-    },
-    {
-        "label": "HSN Summary - Taxable Value",
-        "value": "242,486.00",
-        "remarks": "Total taxable value for HSN code 998822"
-    }
-]"""
+            result = self.request_completion(source, metrics=metrics, prompt=prompt, cancel=cancel)
+            start = time.perf_counter()
+            items = self.parse_response(result)
+            parse_ms = (time.perf_counter() - start) * 1000
+            observe_stage('parse', parse_ms / 1000, model=self.model, profile=self.profile.name)
+            if metrics is not None:
+                metrics['parse_ms'] = round(parse_ms, 1)
+            return items
+        except Exception as e:
+            print(f"\nError in extract_info: {str(e)}")
+            raise Exception(str(e))
 
-            # Prepare the API request
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "HTTP-Referer": "https://github.com/",
-                "Content-Type": "application/json"
-            }
+    def request_completion(self, source: Union[str, BinaryIO, Image.Image], metrics: Optional[Dict[str, Any]] = None,
+                           prompt: Optional[str] = None, response_format: Optional[Dict[str, Any]] = None,
+                           cancel: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """
+        Encode the image, send the chat completions request and return the decoded response.
+        Network and image errors are raised as user-facing messages.
+        `cancel` marks an attempt of the model router: the completion is streamed and assembled,
+        so that once `cancel` is set (e.g. another model answered first) the stream is closed,
+        which makes OpenRouter stop generating it, and CancelledError is raised. It is sent
+        without 429/5xx retries so failures reach the router's circuit breaker at once.
+        With DEDUP_MODE set, near-duplicates of earlier images are flagged in metrics['duplicate'],
+        and in reuse mode answered with the earlier response, once its key fields are verified
+        on the page, instead of a request.
+        """
+        try:
+            if isinstance(source, str):
+                description = source
+            elif isinstance(source, Image.Image):
+                description = 'document page'
+            else:
+                description = 'upload stream'
+            print(f"\nStarting extraction for image: {description}")
             
-            data = {
-                "model": self.model,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": prompt
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
-                                }
-                            }
-                        ]
-                    }
-                ]
-            }
+            # Encode image and prepare the API request
+            start = time.perf_counter()
+            headers = self.build_headers()
+            duplicates = get_duplicate_index()
+            encoded, image_info = self.prepare_image(source, fingerprint=duplicates is not None)
+            fingerprint = image_info.pop('fingerprint', None)
+            try:
+                if duplicates is not None:
+                    request_key = duplicates.request_key(self.model, self.PROMPT_VERSION, prompt, response_format)
+                    reused = duplicates.check(fingerprint, request_key, metrics, page=encoded)
+                    if reused is not None:
+                        if metrics is not None:
+                            metrics.update(image=image_info, encode_ms=round((time.perf_counter() - start) * 1000, 1))
+                        return reused
+                body = self.build_request_body(encoded, image_info['mime'], prompt, stream=cancel is not None,
+                                               response_format=response_format)
+            finally:
+                if encoded is not source:  # Never close the caller's stream
+                    encoded.close()
+            encode_ms = (time.perf_counter() - start) * 1000
+            self._record_encoding(encode_ms, body)
 
-            print(f"\nSending request with data: {json.dumps(data, indent=2)}")
+            print(f"\nSending request to {self.model} ({body.getbuffer().nbytes} bytes)")
             
             # Make the API request
-            response = requests.post(self.api_url, headers=headers, json=data, timeout=60)
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            if cancel is not None and cancel.is_set():
+                raise CancelledError()
+            start = time.perf_counter()
+            if cancel is None:
+                response = self.session.post(self.api_url, headers=headers, data=body, timeout=self.timeout)
+                result, received = None, len(response.content)
+            else:
+                session = self._session if self._session is not None else get_session(status_retries=False)
+                response = session.post(self.api_url, headers=headers, data=body, timeout=self.timeout, stream=True)
+                try:
+                    if response.status_code == 200:
+                        result, received = self._collect_stream(response, cancel)
+                    else:
+                        result, received = None, len(response.content)
+                except CancelledError:
+                    self._record_request('cancelled', (time.perf_counter() - start) * 1000)
+                    print(f"\nRequest to {self.model} cancelled")
+                    raise
+                finally:
+                    response.close()
+            api_ms = (time.perf_counter() - start) * 1000
+            self._record_request(str(response.status_code), api_ms, received)
+            if metrics is not None:
+                metrics.update(image=image_info, encode_ms=round(encode_ms, 1), api_ms=round(api_ms, 1))
             
             if response.status_code != 200:
-                print(f"\nAPI Error Response: {response.text}")
-                if "model not found" in response.text.lower():
-                    raise Exception(f"Model '{self.model}' is not available. Please try a different model.")
-                elif "unauthorized" in response.text.lower():
-                    raise Exception("API key is invalid or expired. Please check your OPENROUTER_API_KEY.")
+                self.check_error_response(response.status_code, response.text)
                 response.raise_for_status()
             
-            # Extract the response
-            result = response.json()
-            print("\nAPI Response received:")
-            print(json.dumps(result, indent=2))
-            
-            # Get the content from the response
-            if isinstance(result, dict) and 'choices' in result and len(result['choices']) > 0:
-                content = result['choices'][0].get('message', {}).get('content', '')
-                print("\nExtracted content:", content)
-                
-                # Try to clean the content if it contains markdown code blocks
-                if "```json" in content:
-                    content = content.split("```json")[1].split("```")[0].strip()
-                    print("\nCleaned content from markdown:", content)
-            else:
-                print("\nUnexpected API response format")
-                raise Exception("Unexpected API response format")
-            
-            # Parse the JSON response
-            try:
-                # Find the first '[' and last ']' to extract the JSON array
-                start_idx = content.find('[')
-                end_idx = content.rfind(']')
-                
-                if start_idx == -1 or end_idx == -1:
-                    print("\nNo JSON array found in response")
-                    if "```" in content:
-                        raise Exception("Model returned markdown instead of JSON. Please try GPT-4 Mini model.")
-                    raise Exception("No JSON array found in response")
-                
-                json_str = content[start_idx:end_idx + 1]
-                print("\nExtracted JSON string:", json_str)
-                
-                try:
-                    extracted_data = json.loads(json_str)
-                except json.JSONDecodeError:
-                    # Try to clean the string if initial parse fails
-                    json_str = json_str.replace('\n', ' ').replace('\r', '')
-                    json_str = ' '.join(json_str.split())  # Normalize whitespace
-                    extracted_data = json.loads(json_str)
-                
-                if not isinstance(extracted_data, list):
-                    print("\nExtracted data is not a list")
-                    raise Exception("Extracted data is not a list")
-                
-                # Validate and clean the extracted data
-                cleaned_data = self._clean_extracted_data(extracted_data)
-                print("\nCleaned data:", json.dumps(cleaned_data, indent=2))
-                
-                return cleaned_data
-                
-            except json.JSONDecodeError as e:
-                print(f"\nJSON Decode Error: {str(e)}")
-                print("Content:", content)
-                raise Exception("Model returned invalid JSON format. Please try GPT-4 Mini model.")
+            if result is None:
+                result = response.json()
+            record_usage(self.model, result, metrics, profile=self.profile.name)
+            if duplicates is not None and result.get('choices'):
+                duplicates.remember(fingerprint, request_key, {'choices': result['choices']})
+            return result
             
         except requests.Timeout:
+            self._record_request('timeout')
             print("API request timed out")
             raise Exception("Request timed out - please try again")
         except requests.RequestException as e:
+            if getattr(e, 'response', None) is None:
+                self._record_request('error')
             print(f"API request failed: {str(e)}")
             raise Exception(f"API request failed: {str(e)}")
         except PIL.UnidentifiedImageError:
             print("Could not identify image file")
             raise Exception("Invalid or corrupted image file")
-        except Exception as e:
-            print(f"\nError in extract_info: {str(e)}")
-            raise Exception(str(e))
+
+    @staticmethod
+    def _collect_stream(response: requests.Response, cancel: threading.Event) -> Tuple[Dict[str, Any], int]:
+        """
+        Assemble a streamed completion into the shape of a non-streamed response, checking
+        `cancel` at every event (content chunks, or keep-alive comments while the model is
+        still reading the prompt). Returns the response and the number of bytes received.
+        """
+        received = 0
+        content, refusal = [], []
+        result = {'choices': []}
+        for line in response.iter_lines():
+            if cancel.is_set():
+                raise CancelledError()
+            received += len(line) + 1
+            if not line.startswith(b'data:'):
+                continue
+            data = line[5:].strip()
+            if data == b'[DONE]':
+                break
+            chunk = json.loads(data)
+            if 'error' in chunk:
+                raise Exception(f"API error during streaming: {chunk['error'].get('message', chunk['error'])}")
+            if chunk.get('usage'):
+                result['usage'] = chunk['usage']
+            for choice in chunk.get('choices') or []:
+                delta = choice.get('delta') or {}
+                content.append(delta.get('content') or '')
+                refusal.append(delta.get('refusal') or '')
+        if cancel.is_set():
+            raise CancelledError()
+        message = {'role': 'assistant', 'content': ''.join(content)}
+        if any(refusal):
+            message['refusal'] = ''.join(refusal)
+        result['choices'].append({'index': 0, 'message': message})
+        return result, received
+
+    def _record_encoding(self, encode_ms: float, body: io.BytesIO) -> None:
+        observe_stage('encode', encode_ms / 1000, model=self.model)
+        observe_bytes('request', body.getbuffer().nbytes, model=self.model)
+
+    def _record_request(self, status: str, api_ms: Optional[float] = None, response_bytes: Optional[int] = None) -> None:
+        """Count a model API request by status (HTTP code, timeout or error) and time it"""
+        get_registry().inc('extractor_model_requests_total', model=self.model, status=status)
+        if api_ms is not None:
+            observe_stage('api', api_ms / 1000, model=self.model, profile=self.profile.name)
+        if response_bytes is not None:
+            observe_bytes('response', response_bytes, model=self.model)
     
+    def stream_info(self, source: Union[str, BinaryIO, Image.Image], metrics: Optional[Dict[str, Any]] = None,
+                    prompt: Optional[str] = None) -> Iterator[Dict[str, str]]:
+        """
+        Streaming variant of extract_info: requests a streamed completion and yields each
+        cleaned label/value/remarks item as soon as the model has finished writing it.
+        `metrics` additionally records first_row_ms (request start to first item) and rows.
+        """
+        try:
+            start = time.perf_counter()
+            headers = self.build_headers()
+            duplicates = get_duplicate_index()
+            encoded, image_info = self.prepare_image(source, fingerprint=duplicates is not None)
+            fingerprint = image_info.pop('fingerprint', None)
+            reused = None
+            try:
+                if duplicates is not None:
+                    request_key = duplicates.request_key(self.model, self.PROMPT_VERSION, prompt)
+                    reused = duplicates.check(fingerprint, request_key, metrics, page=encoded)
+                if reused is None:
+                    body = self.build_request_body(encoded, image_info['mime'], prompt, stream=True)
+            finally:
+                if encoded is not source:  # Never close the caller's stream
+                    encoded.close()
+            if reused is not None:
+                if metrics is not None:
+                    metrics.update(image=image_info, encode_ms=round((time.perf_counter() - start) * 1000, 1))
+                items = self.parse_response(reused)
+                if metrics is not None:
+                    metrics.update(first_row_ms=round((time.perf_counter() - start) * 1000, 1), rows=len(items))
+                yield from items
+                return
+            encode_ms = (time.perf_counter() - start) * 1000
+            self._record_encoding(encode_ms, body)
+            if metrics is not None:
+                metrics.update(image=image_info, encode_ms=round(encode_ms, 1))
+
+            print(f"\nStreaming request to {self.model} ({body.getbuffer().nbytes} bytes)")
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            start = time.perf_counter()
+            response = self.session.post(self.api_url, headers=headers, data=body, timeout=self.timeout, stream=True)
+        except requests.Timeout:
+            self._record_request('timeout')
+            print("API request timed out")
+            raise Exception("Request timed out - please try again")
+        except requests.RequestException as e:
+            self._record_request('error')
+            print(f"API request failed: {str(e)}")
+            raise Exception(f"API request failed: {str(e)}")
+        except PIL.UnidentifiedImageError:
+            print("Could not identify image file")
+            raise Exception("Invalid or corrupted image file")
+
+        rows = 0
+        received = 0
+        parser = JSONArrayStreamParser()
+        content_parts = [] if fingerprint is not None else None  # Kept for the near-duplicate index
+        try:
+            if response.status_code != 200:
+                self.check_error_response(response.status_code, response.text)
+                response.raise_for_status()
+
+            for line in response.iter_lines():
+                received += len(line) + 1
+                # Server-sent events: "data: {...}" chunks, ": comment" keep-alives, "data: [DONE]"
+                if not line.startswith(b'data:'):
+                    continue
+                data = line[5:].strip()
+                if data == b'[DONE]':
+                    break
+                chunk = json.loads(data)
+                if 'error' in chunk:
+                    raise Exception(f"API error during streaming: {chunk['error'].get('message', chunk['error'])}")
+                if chunk.get('usage'):
+                    record_usage(self.model, chunk, metrics, profile=self.profile.name)  # Sent with the final chunk
+                choices = chunk.get('choices') or [{}]
+                content = choices[0].get('delta', {}).get('content')
+                if content_parts is not None and content:
+                    content_parts.append(content)
+                for item in parser.feed(content or ''):
+                    cleaned_item = self._clean_item(item)
+                    if cleaned_item is None:
+                        continue
+                    rows += 1
+                    if rows == 1:
+                        first_row_s = time.perf_counter() - start
+                        get_registry().observe('extractor_first_row_seconds', first_row_s, model=self.model,
+                                               profile=self.profile.name)
+                        if metrics is not None:
+                            metrics['first_row_ms'] = round(first_row_s * 1000, 1)
+                    yield cleaned_item
+        except requests.Timeout:
+            print("API request timed out")
+            raise Exception("Request timed out - please try again")
+        except requests.RequestException as e:
+            print(f"API request failed: {str(e)}")
+            raise Exception(f"API request failed: {str(e)}")
+        finally:
+            response.close()
+            api_ms = (time.perf_counter() - start) * 1000
+            self._record_request(str(response.status_code), api_ms, received)
+            if metrics is not None:
+                metrics.update(api_ms=round(api_ms, 1), rows=rows)
+            print(f"\nStreamed {rows} items from {self.model}")
+
+        if rows == 0 and parser.depth == 0:
+            raise Exception("No JSON array found in response")
+        if content_parts is not None and rows:
+            response_body = {'choices': [{'message': {'role': 'assistant', 'content': ''.join(content_parts)}}]}
+            duplicates.remember(fingerprint, request_key, response_body)
+
+    def _clean_item(self, item: Any) -> Optional[Dict[str, str]]:
+        """A label/value/remarks item with string fields, or None when label or value is missing"""
+        item = self.profile.expand(item)
+        if isinstance(item, dict) and 'label' in item and 'value' in item:
+            cleaned_item = {
+                'label': str(item.get('label', '')).strip(),
+                'value': str(item.get('value', '')).strip(),
+                'remarks': str(item.get('remarks', '')).strip()
+            }
+            if cleaned_item['label'] and cleaned_item['value']:  # Only include items with both label and value
+                return cleaned_item
+        return None
+
     def _clean_extracted_data(self, data: List[Dict[str, Any]]) -> List[Dict[str, str]]:
         """Clean and validate the extracted data"""
         cleaned = []
@@ -290,18 +608,37 @@ Example format:
         try:
             print("\nCleaning extracted data...")
             for item in data:
-                if isinstance(item, dict) and 'label' in item and 'value' in item:
-                    cleaned_item = {
-                        'label': str(item.get('label', '')).strip(),
-                        'value': str(item.get('value', '')).strip(),
-                        'remarks': str(item.get('remarks', '')).strip()
-                    }
-                    if cleaned_item['label'] and cleaned_item['value']:  # Only include items with both label and value
-                        cleaned.append(cleaned_item)
-                        print(f"Added cleaned item: {cleaned_item}")
+                cleaned_item = self._clean_item(item)
+                if cleaned_item is not None:
+                    cleaned.append(cleaned_item)
+                    print(f"Added cleaned item: {cleaned_item}")
             
         except Exception as e:
             print(f"Error cleaning data: {str(e)}")
         
         print(f"\nReturning {len(cleaned)} cleaned items")
         return cleaned
+
+
+_extractors = {}
+_extractors_lock = threading.Lock()
+
+
+def get_extractor(model_choice: str = "gpt4-mini") -> AIInfoExtractor:
+    """
+    Return the shared extractor for a model, creating it on first use.
+    Extractors are stateless between calls, so one instance per MODELS key
+    is safely shared by all request threads. ROUTER_MODEL returns the shared
+    ModelRouter, which has the same extraction methods.
+    """
+    if model_choice == ROUTER_MODEL:
+        from modules.model_router import get_router
+        return get_router()
+    extractor = _extractors.get(model_choice)
+    if extractor is None:
+        with _extractors_lock:
+            extractor = _extractors.get(model_choice)
+            if extractor is None:
+                extractor = AIInfoExtractor(model_choice=model_choice)
+                _extractors[model_choice] = extractor
+    return extractor
@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple, Union
+from modules.metrics import bind_context, get_request_id
+
+# Job lifecycle states
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no room for another job"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Job queue is full, retry after {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """
+    SQLite-backed job records, so any gunicorn worker can report the
+    status of a job that another worker is processing
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, model TEXT, filename TEXT, "
+            "result TEXT, error TEXT, cache_hit INTEGER, worker_pid INTEGER, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, metrics TEXT)"
+        )
+        # Stores created before jobs kept their extraction metrics
+        columns = [row['name'] for row in conn.execute("PRAGMA table_info(jobs)")]
+        if 'metrics' not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN metrics TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at)")
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, job_id: str, model: str, filename: str) -> None:
+        conn = self._connection()
+        conn.execute(
+            "INSERT INTO jobs (id, status, model, filename, worker_pid, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, QUEUED, model, filename, os.getpid(), time.time())
+        )
+        conn.commit()
+
+    def mark_running(self, job_id: str) -> None:
+        conn = self._connection()
+        conn.execute("UPDATE jobs SET status = ?, started_at = ? WHERE id = ?", (RUNNING, time.time(), job_id))
+        conn.commit()
+
+    def mark_done(self, job_id: str, result: Union[List[Dict[str, str]], Dict[str, Any]], cache_hit: bool,
+                  metrics: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Store a finished job's items, or the typed result of a structured mode job, with its
+        extraction metrics (tier, model, near-duplicate match...)
+        """
+        conn = self._connection()
+        conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, cache_hit = ?, finished_at = ?, metrics = ? WHERE id = ?",
+            (DONE, json.dumps(result), int(cache_hit), time.time(),
+             json.dumps(metrics, default=str) if metrics is not None else None, job_id)
+        )
+        conn.commit()
+
+    def mark_failed(self, job_id: str, error: str) -> None:
+        conn = self._connection()
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+            (FAILED, error, time.time(), job_id)
+        )
+        conn.commit()
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs in each status"""
+        rows = self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+
+        # A worker that died mid-job (restart, OOM kill) leaves the job orphaned
+        if job['status'] in (QUEUED, RUNNING) and not _pid_alive(job['worker_pid']):
+            self.mark_failed(job_id, "Processing was interrupted, please upload the document again")
+            return self.get(job_id)
+
+        return self._decode(job)
+
+    @staticmethod
+    def _decode(job: Dict[str, Any]) -> Dict[str, Any]:
+        job['result'] = json.loads(job['result']) if job['result'] is not None else None
+        job['cache_hit'] = bool(job['cache_hit']) if job['cache_hit'] is not None else None
+        job['metrics'] = json.loads(job['metrics']) if job.get('metrics') is not None else None
+        return job
+
+    def iter_finished(self, since: Optional[float] = None, until: Optional[float] = None,
+                      batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """
+        Yield finished (done or failed) jobs in the order they finished, optionally only those
+        finished in [since, until). Rows are fetched batch_size at a time, so exports of any
+        number of jobs hold one batch in memory.
+        """
+        conn = sqlite3.connect(self.path, timeout=30)  # Own connection: a long read must not block other calls
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.execute(
+                "SELECT * FROM jobs WHERE status IN (?, ?) AND finished_at >= ? AND finished_at < ? "
+                "ORDER BY finished_at",
+                (DONE, FAILED, since if since is not None else 0.0, until if until is not None else float('inf'))
+            )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield self._decode(dict(row))
+        finally:
+            conn.close()
+
+
+class JobQueue:
+    """
+    Bounded worker pool that runs extraction jobs in the background.
+    Submissions beyond max_pending queued or running jobs are rejected
+    with QueueFullError so the caller can apply backpressure.
+    """
+
+    def __init__(self, store: JobStore, handler: Callable[..., Tuple[List[Dict[str, str]], bool]],
+                 max_workers: int = 2, max_pending: int = 20):
+        self.store = store
+        self.handler = handler
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._avg_duration = 30.0  # Seconds, refined as jobs complete
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job-worker')
+
+    def retry_after(self) -> int:
+        """Estimated seconds until a worker frees up"""
+        with self._lock:
+            waves = max(1, self.pending // self.max_workers)
+            return max(1, int(self._avg_duration * waves / 2))
+
+    def submit(self, filepath: str, model: str, filename: str, **options) -> str:
+        """
+        Queue a saved upload for extraction and return the job id.
+        Extra keyword options are passed through to the handler, with a `metrics` dict
+        that is stored alongside the results.
+        """
+        with self._lock:
+            if self.pending >= self.max_pending:
+                full = True
+            else:
+                full = False
+                self.pending += 1
+        if full:
+            raise QueueFullError(self.retry_after())
+
+        job_id = uuid.uuid4().hex
+        try:
+            self.store.create(job_id, model, filename)
+            # Jobs keep the request id of the upload that queued them
+            self._executor.submit(bind_context(self._run), job_id, filepath, model, options)
+        except Exception:
+            with self._lock:
+                self.pending -= 1
+            raise
+        return job_id
+
+    def _run(self, job_id: str, filepath: str, model: str, options: Dict[str, Any]) -> None:
+        start = time.time()
+        try:
+            self.store.mark_running(job_id)
+            metrics = {}
+            results, cache_hit = self.handler(filepath, model, metrics=metrics, **options)
+            self.store.mark_done(job_id, results, cache_hit, metrics)
+        except Exception as e:
+            print(f"[{get_request_id()}] Job {job_id} failed: {str(e)}")
+            self.store.mark_failed(job_id, str(e))
+        finally:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+            with self._lock:
+                self.pending -= 1
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * (time.time() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'pending': self.pending,
+                'max_pending': self.max_pending,
+                'workers': self.max_workers,
+                'avg_duration_s': round(self._avg_duration, 2),
+            }
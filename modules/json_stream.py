@@ -0,0 +1,96 @@
+import re
+import json
+from typing import Any, List, Optional
+
+# Characters that change the parser state; everything else is copied through untouched
+_SPECIAL = re.compile(r'[\[\]{}"\\]')
+
+
+class JSONArrayStreamParser:
+    """
+    Incremental parser for a JSON array of objects arriving in arbitrary text chunks,
+    such as a streamed model completion. feed() returns each top-level object as soon
+    as its closing brace arrives. Text before the opening '[' (prose, markdown fences)
+    and after the closing ']' is ignored. Only the object being read is buffered.
+    """
+
+    def __init__(self):
+        self.depth = 0  # 0 before the array, 1 inside it, deeper inside an element
+        self.done = False
+        self.skipped = 0  # Objects that could not be decoded
+        self._in_string = False
+        self._escaped = False
+        self._in_object = False
+        self._parts = []
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Consume a chunk of text and return the objects completed by it"""
+        objects = []
+        if self.done or not chunk:
+            return objects
+
+        start = 0 if self._in_object else None
+        position = 0
+        if self._escaped:
+            # The previous chunk ended with a backslash inside a string
+            self._escaped = False
+            position = 1
+
+        for match in _SPECIAL.finditer(chunk, position):
+            i = match.start()
+            if i < position:
+                continue  # Escaped character
+            char = match.group()
+
+            if self._in_string:
+                if char == '\\':
+                    if i + 1 < len(chunk):
+                        position = i + 2
+                    else:
+                        self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if self.depth == 0:
+                if char == '[':
+                    self.depth = 1
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in '[{':
+                if self.depth == 1 and char == '{':
+                    self._in_object = True
+                    start = i
+                self.depth += 1
+            elif char in ']}':
+                self.depth -= 1
+                if self.depth == 1 and self._in_object:
+                    self._parts.append(chunk[start:i + 1])
+                    obj = self._decode(''.join(self._parts))
+                    if obj is not None:
+                        objects.append(obj)
+                    self._parts = []
+                    self._in_object = False
+                    start = None
+                elif self.depth == 0:
+                    self.done = True
+                    break
+
+        if self._in_object:
+            self._parts.append(chunk[start:])
+        return objects
+
+    def _decode(self, text: str) -> Optional[Any]:
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            pass
+        try:
+            # Same fallback as the non-streaming parser: raw newlines inside strings
+            return json.loads(' '.join(text.replace('\r', '').split()))
+        except json.JSONDecodeError as e:
+            print(f"Skipping undecodable object in stream: {str(e)}")
+            self.skipped += 1
+            return None
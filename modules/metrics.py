@@ -0,0 +1,395 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import atexit
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: snapshots of exited workers are kept as they are
+    fcntl = None
+
+# Seconds; model calls take up to a minute, local stages a few milliseconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Bytes, 1 KiB to 16 MiB in steps of 4
+BYTES_BUCKETS = tuple(1024 * 4 ** n for n in range(8))
+# Snapshot holding the summed counters and histograms of every exited worker
+RETIRED_FILE = 'retired.json'
+# Instance ids of retired workers remembered, so a worker's file is never summed twice
+RETIRED_INSTANCES_LIMIT = 1000
+
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+
+def new_request_id(request_id: Optional[str] = None) -> str:
+    """Start a request: use the given id (e.g. an incoming X-Request-ID) or generate one"""
+    request_id = request_id or uuid.uuid4().hex[:16]
+    request_id_var.set(request_id)
+    return request_id
+
+
+def get_request_id() -> Optional[str]:
+    return request_id_var.get()
+
+
+def bind_context(fn: Callable) -> Callable:
+    """
+    Wrap fn to run in a copy of the current context, so the request id follows work
+    handed to an executor thread. Call once per submission.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def _key(name: str, labels: Dict[str, str]) -> str:
+    return name + json.dumps(sorted((k, str(v)) for k, v in labels.items()), separators=(',', ':'))
+
+
+def _parse_key(key: str) -> Tuple[str, List[Tuple[str, str]]]:
+    split = key.index('[')
+    return key[:split], [tuple(pair) for pair in json.loads(key[split:])]
+
+
+class MetricsRegistry:
+    """
+    Counters, gauges and fixed-bucket histograms for one process.
+    Each process writes a JSON snapshot to `directory` (every `flush_interval` seconds and
+    at exit); render() merges the snapshots of all processes, so any gunicorn worker can
+    answer /metrics for the whole server. Without a directory only this process is reported.
+    Snapshots of exited workers (or of an earlier process whose pid was reused) are folded
+    into RETIRED_FILE and deleted, so their counts stay in the totals while the directory
+    holds one file per live worker.
+    """
+
+    def __init__(self, directory: Optional[str] = None, flush_interval: float = 5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}  # Callbacks evaluated when a snapshot is taken
+        self.help = {}
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+        self._instance = (None, None)  # (pid, id) of this process's snapshots
+        self._flushed_pid = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def describe(self, name: str, text: str) -> None:
+        self.help[name] = text
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+        self._ensure_flusher()
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': list(buckets), 'counts': [0] * (len(buckets) + 1),
+                                                    'sum': 0.0, 'count': 0}
+            histogram['counts'][bisect.bisect_left(histogram['buckets'], value)] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+        self._ensure_flusher()
+
+    def reset(self) -> None:
+        """Drop all counters and histograms of this process, e.g. between benchmark runs"""
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def series(self, name: str) -> List[Tuple[Dict[str, str], Any]]:
+        """(labels, value) of each series of a counter or histogram in this process"""
+        with self._lock:
+            values = dict(self.counters, **self.histograms)
+        series = []
+        for key, value in values.items():
+            metric, labels = _parse_key(key)
+            if metric == name:
+                series.append((dict(labels), dict(value, counts=list(value['counts'])) if isinstance(value, dict) else value))
+        return series
+
+    def gauge(self, name: str, callback: Callable[[], Dict[Tuple[Tuple[str, str], ...], float]]) -> None:
+        """Register a gauge computed at snapshot time; callback returns {labels tuple: value}"""
+        self.gauges[name] = callback
+
+    @contextmanager
+    def timer(self, stage: str, **labels) -> Iterator[None]:
+        """Observe the duration of the block in extractor_stage_seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('extractor_stage_seconds', time.perf_counter() - start, stage=stage, **labels)
+
+    @property
+    def instance(self) -> str:
+        """Id of this process's snapshots, new after a fork, telling a reused pid apart"""
+        pid, instance = self._instance
+        if pid != os.getpid():
+            pid, instance = self._instance = (os.getpid(), uuid.uuid4().hex)
+        return instance
+
+    def snapshot(self) -> Dict[str, Any]:
+        gauges = {}
+        for name, callback in list(self.gauges.items()):
+            try:
+                for labels, value in callback().items():
+                    gauges[_key(name, dict(labels))] = value
+            except Exception as e:
+                print(f"Metrics gauge {name} failed: {str(e)}")
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'instance': self.instance,
+                'counters': dict(self.counters),
+                'histograms': {key: dict(h, counts=list(h['counts'])) for key, h in self.histograms.items()},
+                'gauges': gauges,
+            }
+
+    def flush(self) -> None:
+        """Write this process's snapshot for the other workers to merge"""
+        if not self.directory:
+            return
+        filename = f"worker-{os.getpid()}.json"
+        path = os.path.join(self.directory, filename)
+        if self._flushed_pid != os.getpid():
+            # A file with this pid left by an exited process would be overwritten
+            previous = _read_snapshot(path)
+            if previous is not None and previous.get('instance') != self.instance:
+                self._retire(filename, previous.get('instance'))
+            self._flushed_pid = os.getpid()
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + '.tmp', path)
+
+    def _ensure_flusher(self) -> None:
+        # Started on first use in each process, so workers forked after import get their own thread
+        if not self.directory or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, daemon=True, name='metrics-flush').start()
+        atexit.register(self.flush)
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Metrics flush failed: {str(e)}")
+
+    def collect(self) -> List[Dict[str, Any]]:
+        """
+        Snapshots of every process: this one live, the others from their last flush, and
+        the retired snapshot of exited workers (whose files are folded into it first)
+        """
+        snapshots = [self.snapshot()]
+        if not self.directory:
+            return snapshots
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.startswith('worker-') or not filename.endswith('.json'):
+                continue
+            snapshot = _read_snapshot(os.path.join(self.directory, filename))
+            if snapshot is None or snapshot.get('instance') == self.instance:
+                continue  # Being replaced right now, or this process's own
+            pid = snapshot.get('pid')
+            if pid == os.getpid() or not _pid_alive(pid):
+                # Exited, or an earlier process whose pid this one reused
+                if self._retire(filename, snapshot.get('instance')):
+                    continue
+                snapshot['gauges'] = {}  # Counters stay in the totals, the gauges no longer apply
+            snapshots.append(snapshot)
+        retired = _read_snapshot(os.path.join(self.directory, RETIRED_FILE))
+        if retired is not None:
+            snapshots.append(dict(retired, gauges={}))
+        return snapshots
+
+    def _retire(self, filename: str, instance: Optional[str]) -> bool:
+        """
+        Add the counters and histograms of an exited worker's snapshot to RETIRED_FILE and
+        delete its file. Workers serialize on a lock file; returns False where file locks
+        are unavailable, leaving the snapshot in place.
+        """
+        if fcntl is None:
+            return False
+        path = os.path.join(self.directory, filename)
+        retired_path = os.path.join(self.directory, RETIRED_FILE)
+        with open(os.path.join(self.directory, 'retired.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            snapshot = _read_snapshot(path)
+            if snapshot is None or snapshot.get('instance') != instance:
+                return True  # Already retired by another worker, or replaced
+            retired = _read_snapshot(retired_path) or {'counters': {}, 'histograms': {}, 'instances': []}
+            if instance is None or instance not in retired['instances']:
+                _merge_counts(retired['counters'], retired['histograms'], snapshot)
+                if instance is not None:
+                    retired['instances'] = (retired['instances'] + [instance])[-RETIRED_INSTANCES_LIMIT:]
+                with open(retired_path + '.tmp', 'w') as f:
+                    json.dump(retired, f)
+                os.replace(retired_path + '.tmp', retired_path)
+            os.remove(path)
+        return True
+
+    def render(self, extra_gauges: Optional[Dict[str, Dict[Tuple[Tuple[str, str], ...], float]]] = None) -> str:
+        """Prometheus text exposition of the metrics of all processes, summed"""
+        counters, gauges, histograms = {}, {}, {}
+        for snapshot in self.collect():
+            _merge_counts(counters, histograms, snapshot)
+            for key, value in snapshot['gauges'].items():
+                gauges[key] = gauges.get(key, 0.0) + value
+        for name, values in (extra_gauges or {}).items():
+            for labels, value in values.items():
+                gauges[_key(name, dict(labels))] = value
+
+        lines = []
+        for kind, values in (('counter', counters), ('gauge', gauges), ('histogram', histograms)):
+            by_name = {}
+            for key in sorted(values):
+                name, labels = _parse_key(key)
+                by_name.setdefault(name, []).append((labels, values[key]))
+            for name, series in by_name.items():
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in series:
+                    if kind != 'histogram':
+                        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(value['buckets'] + ['+Inf'], value['counts']):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(labels + [('le', _number(bound))])} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {_number(value['sum'])}")
+                    lines.append(f"{name}_count{_labels(labels)} {value['count']}")
+        return '\n'.join(lines) + '\n'
+
+
+def _read_snapshot(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None  # Missing, or being replaced right now
+
+
+def _merge_counts(counters: Dict[str, float], histograms: Dict[str, Dict[str, Any]],
+                  snapshot: Dict[str, Any]) -> None:
+    """Add a snapshot's counters and histograms to running totals"""
+    for key, value in snapshot['counters'].items():
+        counters[key] = counters.get(key, 0.0) + value
+    for key, histogram in snapshot['histograms'].items():
+        merged = histograms.get(key)
+        if merged is None:
+            histograms[key] = dict(histogram, counts=list(histogram['counts']))
+        else:
+            merged['counts'] = [a + b for a, b in zip(merged['counts'], histogram['counts'])]
+            merged['sum'] += histogram['sum']
+            merged['count'] += histogram['count']
+
+
+def _labels(labels: List[Tuple[str, str]]) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def _number(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> MetricsRegistry:
+    """
+    Return the process-wide registry. METRICS_DIR (default metrics/, empty to disable) is
+    where workers share snapshots, written every METRICS_FLUSH_INTERVAL seconds.
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = MetricsRegistry(os.getenv('METRICS_DIR', 'metrics') or None,
+                                            float(os.getenv('METRICS_FLUSH_INTERVAL', '5')))
+                for name, text in METRIC_HELP.items():
+                    _registry.describe(name, text)
+    return _registry
+
+
+METRIC_HELP = {
+    'extractor_stage_seconds': 'Time spent in each pipeline stage (save, encode, dedup, api, parse, render, ...)',
+    'extractor_payload_bytes': 'Size of uploads, model request bodies and model responses',
+    'extractor_tokens_total': 'Tokens reported in the usage of model responses, by prompt profile',
+    'extractor_model_requests_total': 'Model API requests by outcome',
+    'extractor_first_row_seconds': 'Time from the streamed model request to its first result row',
+    'extractor_cache_requests_total': 'Result cache lookups by result',
+    'extractor_http_request_seconds': 'HTTP request latency by endpoint and status (streamed bodies excluded)',
+    'extractor_jobs': 'Background jobs in the shared job store by status',
+    'extractor_job_queue_pending': 'Queued plus running jobs per worker',
+    'extractor_model_circuit_open': 'Workers whose router has the circuit of a model open',
+    'extractor_routed_requests_total': 'Requests answered through the model router by model and hedging',
+    'extractor_duplicates_total': 'Near-duplicate images found, by action: flagged, reused (earlier response) or rejected (key fields differ)',
+}
+
+
+# Shorthands used by the pipeline
+
+def timer(stage: str, **labels):
+    return get_registry().timer(stage, **labels)
+
+
+def observe_stage(stage: str, seconds: float, **labels) -> None:
+    get_registry().observe('extractor_stage_seconds', seconds, stage=stage, **labels)
+
+
+def observe_bytes(kind: str, size: int, **labels) -> None:
+    get_registry().observe('extractor_payload_bytes', size, buckets=BYTES_BUCKETS, kind=kind, **labels)
+
+
+def record_usage(model: str, result: Dict[str, Any], metrics: Optional[Dict[str, Any]] = None, **labels) -> None:
+    """
+    Count the token usage of a chat completions response (or its final stream chunk),
+    including prompt tokens read from the provider's prompt cache (type="cached")
+    """
+    usage = result.get('usage') if isinstance(result, dict) else None
+    if not isinstance(usage, dict):
+        return
+    registry = get_registry()
+    counts = {kind: usage.get(kind) for kind in ('prompt_tokens', 'completion_tokens')}
+    details = usage.get('prompt_tokens_details')
+    if isinstance(details, dict):
+        counts['cached_tokens'] = details.get('cached_tokens')
+    for kind, count in counts.items():
+        if isinstance(count, (int, float)):
+            registry.inc('extractor_tokens_total', count, model=model, type=kind.split('_')[0], **labels)
+            if metrics is not None:
+                metrics[kind] = count
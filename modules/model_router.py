@@ -0,0 +1,398 @@
+import os
+import io
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, CancelledError, FIRST_COMPLETED, wait
+from typing import Dict, Any, Callable, Iterator, List, BinaryIO, Optional, Sequence, Union
+import requests
+from PIL import Image, UnidentifiedImageError
+from modules.info_extractor import AIInfoExtractor, ROUTER_MODEL, get_extractor
+from modules.http_session import RETRY_STATUS_CODES
+from modules.metrics import bind_context, get_registry
+from modules.prompts import get_profile
+
+
+def failure_kind(error: BaseException) -> Optional[str]:
+    """
+    Classify the failure behind a user-facing extraction error by walking its exception chain:
+    an HTTP status code, 'timeout', 'connection', 'image', 'cancelled', or None for other errors
+    such as an unparseable model response.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, CancelledError):
+            return 'cancelled'
+        if isinstance(error, requests.Timeout):
+            return 'timeout'
+        if isinstance(error, requests.ConnectionError):
+            return 'connection'
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            return str(error.response.status_code)
+        if isinstance(error, UnidentifiedImageError):
+            return 'image'
+        error = error.__cause__ or error.__context__
+    return None
+
+
+# Failures that mean the provider is overloaded or down and count towards opening the circuit
+BREAKER_FAILURES = frozenset(['timeout', 'connection'] + [str(code) for code in RETRY_STATUS_CODES])
+
+
+class ModelHealth:
+    """
+    Rolling latency and error statistics for one model, with a circuit breaker.
+    After `failure_threshold` consecutive 429/5xx/timeout failures the circuit opens and the
+    model receives no requests for `cooldown` seconds; then a single trial request is let
+    through (half-open), which closes the circuit on success or reopens it on failure.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, window: int = 100, failure_threshold: int = 5, cooldown: float = 30.0,
+                 error_window: float = 60.0):
+        self.latencies = deque(maxlen=window)  # ms of recent successful requests
+        self.outcomes = deque(maxlen=window)  # (time, success) of recent requests
+        self.error_window = error_window  # Seconds before an outcome stops counting towards the error rate
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Latency percentile (0-100) of the successful requests in the window, None without samples"""
+        with self._lock:
+            values = sorted(self.latencies)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+    def samples(self) -> int:
+        return len(self.latencies)
+
+    def error_rate(self) -> float:
+        """Share of failures among the outcomes of the last error_window seconds"""
+        since = time.monotonic() - self.error_window
+        with self._lock:
+            outcomes = [success for at, success in self.outcomes if at >= since]
+        return outcomes.count(False) / len(outcomes) if outcomes else 0.0
+
+    def available(self) -> bool:
+        """Whether allow() would currently admit a request, without claiming a trial"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at >= self.cooldown
+            return not self._trial_in_flight
+
+    def allow(self) -> bool:
+        """Admit a request; a half-open circuit admits one trial request at a time"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self, latency_ms: float) -> None:
+        with self._lock:
+            self.latencies.append(latency_ms)
+            self.outcomes.append((time.monotonic(), True))
+            self.consecutive_failures = 0
+            self.state = self.CLOSED
+            self._trial_in_flight = False
+
+    def record_failure(self, kind: Optional[str]) -> bool:
+        """Record a failed request; returns True if this failure opened the circuit"""
+        with self._lock:
+            self.outcomes.append((time.monotonic(), False))
+            self._trial_in_flight = False
+            if kind not in BREAKER_FAILURES:
+                # The provider answered, the response was just unusable
+                self.consecutive_failures = 0
+                if self.state == self.HALF_OPEN:
+                    self.state = self.CLOSED
+                return False
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                opened = self.state != self.OPEN
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                return opened
+            return False
+
+    def release(self) -> None:
+        """Return an unused half-open trial, e.g. when the request was cancelled"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'samples': self.samples(),
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'error_rate': round(self.error_rate(), 3),
+            'consecutive_failures': self.consecutive_failures,
+        }
+
+
+class ModelRouter:
+    """
+    Routes extraction requests across AIInfoExtractor.MODELS by rolling health statistics.
+    Each request goes to the fastest healthy model (models with fewer than `min_samples`
+    latencies are tried first so every model gets measured). If it has not answered after
+    its p95 latency (between hedge_min_ms and hedge_max_ms), a hedged request is sent to the
+    next model and the first success wins; the other request is cancelled, which closes its
+    streamed completion if it was already sent (see AIInfoExtractor.request_completion).
+    Routed requests are not retried on 429/5xx, so a failed request falls back to the next
+    model immediately and counts towards its circuit breaker. Models whose
+    circuit is open are skipped. Has the extraction methods of AIInfoExtractor, so it can be
+    used anywhere a model's extractor is (see ROUTER_MODEL).
+    """
+
+    def __init__(self, models: Optional[Sequence[str]] = None, hedge: bool = True,
+                 hedge_delay_ms: Optional[float] = None, hedge_min_ms: float = 1000.0,
+                 hedge_max_ms: float = 10000.0, hedge_default_ms: float = 10000.0, min_samples: int = 5, max_error_rate: float = 0.5,
+                 window: int = 100, failure_threshold: int = 5, cooldown: float = 30.0,
+                 error_window: float = 60.0, max_workers: int = 32):
+        self.models = list(models or AIInfoExtractor.MODELS)
+        for model_choice in self.models:
+            if model_choice not in AIInfoExtractor.MODELS:
+                raise ValueError(f"Invalid model choice. Available models: {', '.join(AIInfoExtractor.MODELS)}")
+        # Cached results are shared by every routed model
+        self.model = f"{ROUTER_MODEL}/{'+'.join(self.models)}"
+        self.structured_output = all(AIInfoExtractor.MODELS[m].get('structured_output') for m in self.models)
+        # The routed extractors all use the PROMPT_PROFILE prompt
+        self.profile = get_profile()
+        self.PROMPT_VERSION = f"{AIInfoExtractor.PROMPT_VERSION}{self.profile.version}"
+        self.hedge = hedge and len(self.models) > 1
+        self.hedge_delay_ms = hedge_delay_ms
+        self.hedge_min_ms = hedge_min_ms
+        self.hedge_max_ms = hedge_max_ms
+        self.hedge_default_ms = hedge_default_ms
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.health = {m: ModelHealth(window, failure_threshold, cooldown, error_window) for m in self.models}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='model-router')
+        get_registry().gauge('extractor_model_circuit_open', lambda: {
+            (('model', m),): float(self.health[m].state == ModelHealth.OPEN) for m in self.models})
+
+    def rank(self) -> List[str]:
+        """Models that can take a request, in the order they should be tried"""
+        candidates = [m for m in self.models if self.health[m].available()]
+        # Prefer models below the error rate limit, but never refuse work while any circuit is closed.
+        # Failures expire after error_window seconds, so an excluded model is tried again later.
+        healthy = [m for m in candidates if self.health[m].error_rate() <= self.max_error_rate] or candidates
+        return sorted(healthy, key=lambda m: (self.health[m].samples() >= self.min_samples,
+                                              self.health[m].percentile(50) or 0.0))
+
+    def hedge_delay(self, model_choice: str) -> float:
+        """Seconds to wait for a model before sending a hedged request"""
+        if self.hedge_delay_ms is not None:
+            return self.hedge_delay_ms / 1000
+        health = self.health[model_choice]
+        if health.samples() < self.min_samples:
+            return min(self.hedge_default_ms, self.hedge_max_ms) / 1000
+        # A model slowing down must not push its own hedge out indefinitely
+        return min(self.hedge_max_ms, max(self.hedge_min_ms, health.percentile(95))) / 1000
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Current statistics and circuit state of every model"""
+        return {m: self.health[m].snapshot() for m in self.models}
+
+    def close(self) -> None:
+        """Wait for attempts still running (e.g. cancelled hedges) and stop the worker threads"""
+        self._executor.shutdown(wait=True)
+
+    def _attempt(self, model_choice: str, call: Callable, source: Any, metrics: Dict[str, Any],
+                 cancel: threading.Event) -> Any:
+        health = self.health[model_choice]
+        if cancel.is_set():
+            # Started after another model already answered
+            health.release()
+            return None
+        start = time.perf_counter()
+        try:
+            result = call(get_extractor(model_choice), source, metrics, cancel)
+        except Exception as e:
+            kind = failure_kind(e)
+            if kind == 'cancelled':
+                health.release()
+            elif kind != 'image' and health.record_failure(kind):
+                print(f"Circuit opened for {model_choice} after {health.consecutive_failures} failures ({kind})")
+            raise
+        health.record_success(metrics.get('api_ms', (time.perf_counter() - start) * 1000))
+        return result
+
+    def _route(self, call: Callable, source: Union[str, BinaryIO, Image.Image],
+               metrics: Optional[Dict[str, Any]]) -> Any:
+        """Run `call(extractor, source, metrics, cancel)` with hedging and fallback"""
+        candidates = iter(self.rank())
+        # Concurrent attempts each need their own copy of a stream or image
+        if isinstance(source, Image.Image):
+            copy_source = source.copy
+        elif isinstance(source, str):
+            copy_source = lambda: source
+        else:
+            source.seek(0)
+            data = source.read()
+            copy_source = lambda: io.BytesIO(data)
+
+        cancel = threading.Event()
+        pending = {}
+
+        def launch() -> Optional[str]:
+            for model_choice in candidates:
+                if self.health[model_choice].allow():
+                    attempt_metrics = {}
+                    future = self._executor.submit(bind_context(self._attempt), model_choice, call, copy_source(),
+                                                   attempt_metrics, cancel)
+                    pending[future] = (model_choice, attempt_metrics)
+                    return model_choice
+            return None
+
+        primary = launch()
+        if primary is None:
+            raise Exception("All models are temporarily unavailable. Please try again shortly.")
+        hedge_at = time.monotonic() + self.hedge_delay(primary) if self.hedge else None
+        hedged = False
+        error = None
+        try:
+            while pending:
+                timeout = max(0.0, hedge_at - time.monotonic()) if hedge_at is not None else None
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    hedge_at = None
+                    hedge_model = launch()
+                    if hedge_model is not None:
+                        hedged = True
+                        print(f"{primary} slower than {self.hedge_delay(primary):.1f}s, hedging with {hedge_model}")
+                    continue
+                for future in done:
+                    model_choice, attempt_metrics = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        error = e
+                        print(f"Routed request to {model_choice} failed: {str(e)}")
+                        if failure_kind(e) == 'image':
+                            raise
+                        continue
+                    get_registry().inc('extractor_routed_requests_total', model=model_choice, hedged=str(hedged).lower())
+                    if metrics is not None:
+                        metrics.update(attempt_metrics, model=model_choice, hedged=hedged)
+                    return result
+                if not pending:
+                    # Fall back to the next model straight away instead of waiting for the hedge
+                    hedge_at = None
+                    launch()
+        finally:
+            cancel.set()
+            for future, (model_choice, _) in pending.items():
+                # A hedge cancelled before it started never runs _attempt, so return its trial here
+                if future.cancel():
+                    self.health[model_choice].release()
+        raise error
+
+    def extract_info(self, source: Union[str, BinaryIO, Image.Image], metrics: Optional[Dict[str, Any]] = None,
+                     prompt: Optional[str] = None) -> List[Dict[str, str]]:
+        return self._route(
+            lambda extractor, src, m, cancel: extractor.extract_info(src, metrics=m, prompt=prompt, cancel=cancel),
+            source, metrics)
+
+    def request_completion(self, source: Union[str, BinaryIO, Image.Image], metrics: Optional[Dict[str, Any]] = None,
+                           prompt: Optional[str] = None,
+                           response_format: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return self._route(
+            lambda extractor, src, m, cancel: extractor.request_completion(
+                src, metrics=m, prompt=prompt, response_format=response_format, cancel=cancel),
+            source, metrics)
+
+    def stream_info(self, source: Union[str, BinaryIO, Image.Image], metrics: Optional[Dict[str, Any]] = None,
+                    prompt: Optional[str] = None) -> Iterator[Dict[str, str]]:
+        """
+        Stream from the fastest healthy model. Streams are not hedged, since rows may already
+        have been shown; a model failing before its first row falls back to the next model.
+        """
+        error = None
+        for model_choice in self.rank():
+            health = self.health[model_choice]
+            if not health.allow():
+                continue
+            attempt_metrics = {}
+            rows = 0
+            try:
+                for item in get_extractor(model_choice).stream_info(source, metrics=attempt_metrics, prompt=prompt):
+                    if rows == 0 and metrics is not None:
+                        metrics.update(model=model_choice, hedged=False)
+                    rows += 1
+                    yield item
+            except GeneratorExit:
+                health.release()
+                raise
+            except Exception as e:
+                kind = failure_kind(e)
+                if kind != 'image' and health.record_failure(kind):
+                    print(f"Circuit opened for {model_choice} after {health.consecutive_failures} failures ({kind})")
+                if rows or kind == 'image':
+                    raise
+                print(f"Streaming from {model_choice} failed, falling back: {str(e)}")
+                error = e
+                continue
+            finally:
+                if metrics is not None:
+                    metrics.update(attempt_metrics)
+            health.record_success(attempt_metrics.get('api_ms', 0.0))
+            if metrics is not None:
+                metrics.update(model=model_choice, hedged=False)
+            return
+        if error is not None:
+            raise error
+        raise Exception("All models are temporarily unavailable. Please try again shortly.")
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> ModelRouter:
+    """
+    Return the process-wide router, configured by ROUTER_MODELS (comma-separated MODELS keys,
+    default all), ROUTER_HEDGE, ROUTER_HEDGE_DELAY_MS (fixed delay instead of the p95),
+    ROUTER_HEDGE_MIN_MS, ROUTER_HEDGE_MAX_MS, ROUTER_MIN_SAMPLES, ROUTER_MAX_ERROR_RATE, ROUTER_ERROR_WINDOW,
+    ROUTER_WINDOW, ROUTER_BREAKER_FAILURES and ROUTER_BREAKER_COOLDOWN.
+    """
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                models = [m.strip() for m in os.getenv('ROUTER_MODELS', '').split(',') if m.strip()]
+                hedge_delay = os.getenv('ROUTER_HEDGE_DELAY_MS')
+                _router = ModelRouter(
+                    models=models or None,
+                    hedge=os.getenv('ROUTER_HEDGE', 'true').lower() == 'true',
+                    hedge_delay_ms=float(hedge_delay) if hedge_delay else None,
+                    hedge_min_ms=float(os.getenv('ROUTER_HEDGE_MIN_MS', '1000')),
+                    hedge_max_ms=float(os.getenv('ROUTER_HEDGE_MAX_MS', '10000')),
+                    min_samples=int(os.getenv('ROUTER_MIN_SAMPLES', '5')),
+                    max_error_rate=float(os.getenv('ROUTER_MAX_ERROR_RATE', '0.5')),
+                    window=int(os.getenv('ROUTER_WINDOW', '100')),
+                    failure_threshold=int(os.getenv('ROUTER_BREAKER_FAILURES', '5')),
+                    cooldown=float(os.getenv('ROUTER_BREAKER_COOLDOWN', '30')),
+                    error_window=float(os.getenv('ROUTER_ERROR_WINDOW', '60')),
+                )
+    return _router
@@ -2,32 +2,281 @@ import cv2
 import pytesseract
 import numpy as np
 import os
+import io
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 from PIL import Image
 
-class OCRProcessor:
+# Preprocessing stages in the order OCR_PIPELINE lists them; grayscale conversion always runs first.
+# deskew straightens pages scanned at an angle, denoise (non-local means, slow) cleans noisy scans.
+PIPELINE_STAGES = ('denoise', 'deskew', 'threshold', 'dilate', 'median')
+DEFAULT_PIPELINE = ('threshold', 'dilate', 'median')
+ENGINES = ('auto', 'tesserocr', 'pytesseract')
+
+# Columns of Tesseract's TSV output, the same as pytesseract.image_to_data
+TSV_COLUMNS = ('level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+               'left', 'top', 'width', 'height', 'conf', 'text')
+
+
+class PreprocessBuffers:
+    """
+    Output arrays reused from image to image by one worker thread or process.
+    Each stage writes into the array that isn't its input, so two buffers serve any
+    pipeline; they are reallocated only when the page size changes.
+    """
+    
     def __init__(self):
+        self.arrays = [None, None]
+        
+    def output(self, src: np.ndarray) -> np.ndarray:
+        shape = src.shape[:2]
+        for index, array in enumerate(self.arrays):
+            if array is src:
+                continue
+            if array is None or array.shape != shape:
+                array = self.arrays[index] = np.empty(shape, np.uint8)
+            return array
+
+
+class OCRProcessor:
+    # Non-local means filter strength and the largest skew angle corrected, in degrees
+    DENOISE_STRENGTH = 10
+    MAX_SKEW = 10.0
+    
+    def __init__(self, pipeline: Optional[Sequence[str]] = None, engine: Optional[str] = None):
+        """
+        pipeline: preprocessing stages (default OCR_PIPELINE, comma separated).
+        engine: 'tesserocr' keeps a Tesseract API per thread instead of starting the
+        tesseract CLI per page, 'pytesseract' always uses the CLI and 'auto' (OCR_ENGINE,
+        default) uses tesserocr when it is installed.
+        """
         # Set Tesseract path for Windows
         if os.name == 'nt':  # Windows
             pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
         
-    def preprocess_image(self, image):
+        if pipeline is None:
+            configured = os.getenv('OCR_PIPELINE')
+            pipeline = [stage.strip() for stage in configured.split(',') if stage.strip()] if configured else DEFAULT_PIPELINE
+        for stage in pipeline:
+            if stage not in PIPELINE_STAGES:
+                raise Exception(f"Unknown OCR preprocessing stage: {stage}")
+        self.pipeline = tuple(pipeline)
+        self.kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3,3))
+        
+        requested = engine or os.getenv('OCR_ENGINE', 'auto')
+        if requested not in ENGINES:
+            raise Exception(f"Unknown OCR engine: {requested}")
+        self.tesserocr = None
+        if requested != 'pytesseract':
+            try:
+                import tesserocr
+                self.tesserocr = tesserocr
+            except ImportError:
+                if requested == 'tesserocr':
+                    raise Exception("OCR_ENGINE=tesserocr requires the tesserocr package")
+        self.engine = 'tesserocr' if self.tesserocr else 'pytesseract'
+        self._local = threading.local()
+        
+    def preprocess_image(self, image, buffers: Optional[PreprocessBuffers] = None):
         """
-        Preprocess the image to improve OCR accuracy
+        Preprocess the image to improve OCR accuracy. With buffers, every stage writes
+        into them instead of allocating; the result then stays valid only until the
+        next image is preprocessed with the same buffers.
         """
+        buffers = buffers or PreprocessBuffers()
+        
         # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if image.ndim == 2:
+            gray = image
+        else:
+            gray = buffers.output(image)
+            code = cv2.COLOR_BGRA2GRAY if image.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+            cv2.cvtColor(image, code, dst=gray)
+        
+        for stage in self.pipeline:
+            gray = getattr(self, f"_{stage}")(gray, buffers)
+        return gray
+        
+    def _denoise(self, src, buffers):
+        dst = buffers.output(src)
+        cv2.fastNlMeansDenoising(src, dst, self.DENOISE_STRENGTH)
+        return dst
+        
+    def _deskew(self, src, buffers):
+        angle = self.estimate_skew(src)
+        if abs(angle) < 0.2:  # Within the search's own error
+            return src
+        dst = buffers.output(src)
+        height, width = src.shape[:2]
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+        cv2.warpAffine(src, matrix, (width, height), dst=dst, flags=cv2.INTER_LINEAR,
+                       borderMode=cv2.BORDER_CONSTANT, borderValue=255)
+        return dst
+        
+    def estimate_skew(self, gray) -> float:
+        """
+        Rotation in degrees (counterclockwise, up to MAX_SKEW) that levels the text lines
+        of a grayscale page: the angle whose row profile of ink is sharpest, searched in
+        1 degree then 0.1 degree steps on a downscaled copy
+        """
+        scale = min(1.0, 800 / max(gray.shape[:2]))
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        ink = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+        height, width = ink.shape
+        rotated = np.empty_like(ink)
+        
+        def sharpness(angle):
+            matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+            cv2.warpAffine(ink, matrix, (width, height), dst=rotated, flags=cv2.INTER_NEAREST)
+            return float(np.var(cv2.reduce(rotated, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S)))
         
+        best = max(np.arange(-self.MAX_SKEW, self.MAX_SKEW + 0.5, 1.0), key=sharpness)
+        best = max(np.arange(best - 1.0, best + 1.05, 0.1), key=sharpness)
+        return round(float(best), 1)
+        
+    def _threshold(self, src, buffers):
         # Apply thresholding to preprocess the image
-        gray = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+        dst = buffers.output(src)
+        cv2.threshold(src, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=dst)
+        return dst
         
+    def _dilate(self, src, buffers):
         # Apply dilation to connect text components
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3,3))
-        gray = cv2.dilate(gray, kernel, iterations=1)
+        dst = buffers.output(src)
+        cv2.dilate(src, self.kernel, dst=dst, iterations=1)
+        return dst
         
+    def _median(self, src, buffers):
         # Apply median blur to remove noise
-        gray = cv2.medianBlur(gray, 3)
+        dst = buffers.output(src)
+        cv2.medianBlur(src, 3, dst=dst)
+        return dst
         
-        return gray
+    def _buffers(self) -> PreprocessBuffers:
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None:
+            buffers = self._local.buffers = PreprocessBuffers()
+        return buffers
+        
+    def _tesseract_api(self):
+        # tesserocr APIs are not thread safe, so each thread keeps its own
+        api = getattr(self._local, 'api', None)
+        if api is None:
+            api = self._local.api = self.tesserocr.PyTessBaseAPI(psm=self.tesserocr.PSM.SINGLE_BLOCK,
+                                                                 oem=self.tesserocr.OEM.DEFAULT)
+        return api
+        
+    def _set_api_image(self, image):
+        api = self._tesseract_api()
+        image = np.ascontiguousarray(image)
+        height, width = image.shape[:2]
+        api.SetImageBytes(image.tobytes(), width, height, 1, width)
+        return api
+        
+    def _image_to_string(self, image) -> str:
+        if self.tesserocr:
+            return self._set_api_image(image).GetUTF8Text()
+        custom_config = r'--oem 3 --psm 6'
+        return pytesseract.image_to_string(image, config=custom_config)
+        
+    def _image_to_data(self, image) -> Dict[str, List[Any]]:
+        """Word boxes as a dict of columns, like pytesseract.image_to_data with Output.DICT"""
+        if not self.tesserocr:
+            custom_config = r'--oem 3 --psm 6'
+            return pytesseract.image_to_data(image, config=custom_config, output_type=pytesseract.Output.DICT)
+        data = {column: [] for column in TSV_COLUMNS}
+        for line in self._set_api_image(image).GetTSVText(0).splitlines():
+            values = line.split('\t')
+            if len(values) != len(TSV_COLUMNS):
+                continue
+            for column, value in zip(TSV_COLUMNS, values):
+                data[column].append(value if column == 'text' else float(value) if column == 'conf' else int(value))
+        return data
+        
+    def find_content_bounds(self, image, margin=16):
+        """
+        Find the bounding box (x, y, w, h) of the non-blank content of a page,
+        padded by margin pixels. Returns None for a blank page.
+        """
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        
+        # Inverted Otsu threshold turns dark ink on light paper into white foreground
+        mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+        
+        # Merge nearby strokes into blocks, then drop tiny isolated blocks (scanner dust)
+        # so they don't stretch the box
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (15,15))
+        blocks = cv2.dilate(mask, kernel, iterations=1)
+        count, _, stats, _ = cv2.connectedComponentsWithStats(blocks)
+        min_area = 0.0005 * gray.shape[0] * gray.shape[1]
+        boxes = [stats[i] for i in range(1, count) if stats[i][cv2.CC_STAT_AREA] >= min_area]
+        if not boxes:
+            return None
+        x = min(box[cv2.CC_STAT_LEFT] for box in boxes)
+        y = min(box[cv2.CC_STAT_TOP] for box in boxes)
+        w = max(box[cv2.CC_STAT_LEFT] + box[cv2.CC_STAT_WIDTH] for box in boxes) - x
+        h = max(box[cv2.CC_STAT_TOP] + box[cv2.CC_STAT_HEIGHT] for box in boxes) - y
+        
+        height, width = gray.shape[:2]
+        x0, y0 = max(0, x - margin), max(0, y - margin)
+        x1, y1 = min(width, x + w + margin), min(height, y + h + margin)
+        return x0, y0, x1 - x0, y1 - y0
+        
+    def find_text_lines(self, image, min_ink=0.002, max_gap=1):
+        """
+        Find the rows (top, bottom) of the text lines of a page from the row profile
+        of its ink, top to bottom. A row belongs to a line when more than min_ink of its
+        width is ink; lines separated by at most max_gap blank rows are merged.
+        Ruling lines of tables come out as lines a few pixels high.
+        """
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+        profile = cv2.reduce(mask, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel() // 255
+        ink = np.concatenate(([False], profile > max(1, min_ink * gray.shape[1]), [False]))
+        edges = np.flatnonzero(ink[1:] != ink[:-1])
+        
+        lines = []
+        for top, bottom in zip(edges[::2], edges[1::2]):
+            if lines and top - lines[-1][1] <= max_gap:
+                lines[-1] = (lines[-1][0], int(bottom))
+            else:
+                lines.append((int(top), int(bottom)))
+        return lines
+        
+    def load_image(self, source):
+        """
+        Read an image as a BGR array from a file path, bytes, a seekable binary stream,
+        a PIL image or an already loaded array
+        """
+        if isinstance(source, np.ndarray):
+            return source
+        if isinstance(source, Image.Image):
+            return cv2.cvtColor(np.asarray(source.convert('RGB')), cv2.COLOR_RGB2BGR)
+        if isinstance(source, str):
+            image = cv2.imread(source)
+        else:
+            if isinstance(source, (bytes, bytearray)):
+                data = source
+            else:
+                source.seek(0)
+                data = source.read()
+                source.seek(0)  # Leave the stream ready for the next consumer
+            image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            
+        if image is None:
+            # OpenCV can't decode every format we accept (e.g. GIF), fall back to PIL
+            try:
+                pil_source = source if isinstance(source, str) else io.BytesIO(data)
+                with Image.open(pil_source) as img:
+                    image = cv2.cvtColor(np.asarray(img.convert('RGB')), cv2.COLOR_RGB2BGR)
+            except Exception:
+                raise Exception("Invalid or corrupted image file")
+            finally:
+                if not isinstance(source, (str, bytes, bytearray)):
+                    source.seek(0)
+        return image
         
     def process_image(self, image_path):
         """
@@ -35,16 +284,119 @@ class OCRProcessor:
         """
         try:
             # Read image using opencv
-            image = cv2.imread(image_path)
+            image = self.load_image(image_path)
             
             # Preprocess the image
-            processed_image = self.preprocess_image(image)
+            processed_image = self.preprocess_image(image, self._buffers())
             
             # Perform OCR on the processed image
-            custom_config = r'--oem 3 --psm 6'
-            extracted_text = pytesseract.image_to_string(processed_image, config=custom_config)
+            extracted_text = self._image_to_string(processed_image)
             
             return extracted_text.strip()
             
         except Exception as e:
             raise Exception(f"Error in OCR processing: {str(e)}")
+            
+    def extract_words(self, source):
+        """
+        Run Tesseract once and return the recognized words in reading order as dicts
+        with text, conf (0-100), left, top, width, height and line (block, paragraph, line)
+        """
+        try:
+            image = self.load_image(source)
+            processed_image = self.preprocess_image(image, self._buffers())
+            return self._read_words(processed_image)
+            
+        except Exception as e:
+            raise Exception(f"Error in OCR processing: {str(e)}")
+            
+    def _read_words(self, processed_image) -> List[Dict[str, Any]]:
+        data = self._image_to_data(processed_image)
+        
+        words = []
+        for i, text in enumerate(data['text']):
+            text = text.strip()
+            conf = float(data['conf'][i])
+            if not text or conf < 0:
+                continue
+            words.append({
+                'text': text,
+                'conf': conf,
+                'left': data['left'][i],
+                'top': data['top'][i],
+                'width': data['width'][i],
+                'height': data['height'][i],
+                'line': (data['block_num'][i], data['par_num'][i], data['line_num'][i]),
+            })
+        return words
+            
+    def process_image_with_confidence(self, source):
+        """
+        Extract text with a single Tesseract pass, returning (text, confidence)
+        where confidence is the mean word confidence between 0 and 1
+        """
+        return self._join_words(self.extract_words(source))
+        
+    @staticmethod
+    def _join_words(words: List[Dict[str, Any]]) -> Tuple[str, float]:
+        # Rebuild the text line by line from the word boxes
+        lines = {}
+        for word in words:
+            lines.setdefault(word['line'], []).append(word['text'])
+        confidences = [word['conf'] for word in words]
+        
+        text = '\n'.join(' '.join(line) for line in lines.values())
+        confidence = sum(confidences) / len(confidences) / 100 if confidences else 0.0
+        return text, confidence
+        
+    def process_batch(self, sources: Iterable[Union[str, bytes]], workers: Optional[int] = None,
+                      chunksize: int = 4, recognize: bool = True) -> Iterator[Dict[str, Any]]:
+        """
+        OCR many images (paths or bytes) in worker processes, each with its own preprocessing
+        buffers and Tesseract engine. Yields a dict per source in input order with index,
+        text, confidence (0-1) and error (None on success), so an unreadable scan doesn't stop
+        a backfill. Sources are read lazily, a few chunks per worker ahead. workers defaults
+        to OCR_WORKERS or the CPU count; recognize=False only loads and preprocesses.
+        """
+        workers = workers or int(os.getenv('OCR_WORKERS', '0')) or os.cpu_count() or 1
+        items = enumerate(sources)
+        if workers == 1:
+            for index, source in items:
+                yield self._process_batch_item(index, source, recognize)
+            return
+        
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                       initargs=(self.pipeline, self.engine))
+        pending = deque()
+        try:
+            while True:
+                chunk = [item for _, item in zip(range(chunksize), items)]
+                if chunk:
+                    pending.append(executor.submit(_process_batch_chunk, chunk, recognize))
+                if pending and (not chunk or len(pending) >= workers * 2):
+                    yield from pending.popleft().result()
+                elif not chunk:
+                    return
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            
+    def _process_batch_item(self, index, source, recognize):
+        try:
+            processed_image = self.preprocess_image(self.load_image(source), self._buffers())
+            text, confidence = self._join_words(self._read_words(processed_image)) if recognize else (None, None)
+            return {'index': index, 'text': text, 'confidence': confidence, 'error': None}
+        except Exception as e:
+            return {'index': index, 'text': None, 'confidence': None, 'error': str(e)}
+
+
+# Processor of a batch worker process, created once by the pool initializer
+_batch_processor = None
+
+
+def _init_batch_worker(pipeline, engine):
+    global _batch_processor
+    _batch_processor = OCRProcessor(pipeline=pipeline, engine=engine)
+
+
+def _process_batch_chunk(chunk, recognize):
+    return [_batch_processor._process_batch_item(index, source, recognize) for index, source in chunk]
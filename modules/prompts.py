@@ -0,0 +1,180 @@
+import os
+import re
+from typing import Any, Optional
+
+# Instructions and output format sent with every extraction, and the version of each,
+# part of the result cache and near-duplicate keys. The full prompt is the original one.
+EXTRACTION_PROMPT = """Analyze this transactional document and extract all relevant information.
+
+For each piece of information you find:
+1. Identify what the information represents (the label)
+2. Extract its corresponding value
+3. Add any relevant remarks about the information
+
+For line items (products/services):
+- Extract each line item separately with sequential numbering
+- For each line item, extract ALL available columns/fields present in the document, such as:
+  * Product/service name
+  * HSN/SAC code
+  * Quantity and unit
+  * Rate/price
+  * Amount
+  * Taxable value
+  * Tax percentages (CGST%, SGST%, IGST%, etc.)
+  * Tax amounts (CGST Amount, SGST Amount, IGST Amount, etc.)
+  * Net amount
+  * Any other columns specific to the document
+- Include line number in all labels (e.g., "Line Item 1 - Product", "Line Item 1 - HSN/SAC", "Line Item 1 - CGST Amount")
+- Do not combine multiple line items into a single entry
+- Be thorough in capturing all columns present for each line item
+
+For summary tables and totals:
+- Extract all summary tables (e.g., HSN/SAC summary, tax summary)
+- Capture row-wise details from summary tables
+- Include table context in label (e.g., "HSN Summary - HSN Code", "HSN Summary - Taxable Value")
+- Extract all total/subtotal rows with proper context
+
+For party information (buyer/seller/other):
+- Include party context in remarks for identifiers (PAN, GST, address)
+- Clearly indicate which party each piece of information belongs to
+- Distinguish between billing/shipping addresses if both present
+
+Look for any important business information such as:
+- Document identifiers (reference numbers, dates)
+- Party details (with clear buyer/seller distinction)
+- Contact information (with party context)
+- Tax identification numbers (with party context)
+- Line items (with ALL columns and details)
+- Summary tables and their details
+- Monetary amounts and calculations
+- Payment/banking details
+- Any other relevant information
+
+Return the information as a list of JSON objects with these fields:
+- label: What this information represents (include line numbers for line items)
+- value: The actual value found
+- remarks: Any relevant notes (include party context for identifiers)
+
+Example format:
+[
+    {
+        "label": "Document Type",
+        "value": "Sales Invoice",
+        "remarks": "Determined from document header"
+    },
+    {
+        "label": "GST Number",
+        "value": "03AAFF2431N1ZR",
+        "remarks": "Belongs to seller (FASHION ARTS)"
+    },
+    {
+        "label": "Line Item 1 - Product",
+        "value": "FRONT PANNEL - 1010",
+        "remarks": "First product line item"
+    },
+    {
+        "label": "Line Item 1 - HSN/SAC",
+        "value": "998822",
+        "remarks": "HSN code for first line item"
+    },
+    {
+        "label": "Line Item 1 - CGST Amount",
+        "value": "1385.65",
+        "remarks": "CGST amount for first line item"
+    },
+    {
+        "label": "HSN Summary - HSN Code",
+        "value": "998822",
+        "remarks": "From HSN/SAC summary table"
+    },
+    {
+        "label": "HSN Summary - Taxable Value",
+        "value": "242,486.00",
+        "remarks": "Total taxable value for HSN code 998822"
+    }
+]"""
+
+COMPACT_INSTRUCTIONS = """Extract all information from this transactional document (invoice, bill, receipt or similar):
+- Document type, numbers, dates and references.
+- Parties (seller, buyer, consignee): names, addresses, contacts, PAN, GST and other tax IDs.
+- Every line item, each column as its own entry: product/service, HSN/SAC, quantity, unit, rate, amount, taxable value, tax rates and amounts (CGST, SGST, IGST, ...), net amount and any other column.
+- Summary tables (e.g. HSN/SAC or tax summary) row by row, and every total and subtotal.
+- Payment and bank details, and anything else of business relevance.
+Never merge line items."""
+
+COMPACT_OUTPUT = """Return only a JSON array of {"label", "value", "remarks"} objects:
+- label: line items as "Line Item N - Column" (N from 1), table rows as "Table - Column", e.g. "HSN Summary - Taxable Value".
+- remarks: the party an identifier, address or contact belongs to, otherwise "".
+Example: [{"label":"Invoice Number","value":"INV-102","remarks":""},{"label":"GST Number","value":"03AAFF2431N1ZR","remarks":"Seller"},{"label":"Line Item 1 - Amount","value":"1385.65","remarks":""}]"""
+
+TERSE_OUTPUT = """Return only a JSON array of objects with the short keys "l" (label) and "v" (value){remarks}.
+- Line items: "L<N> <Column>" (N from 1), e.g. "L1 Product", "L1 CGST Amount". Table rows: "Table - Column", e.g. "HSN Summary - Taxable Value".
+- {party}
+Example: {example}"""
+
+_TERSE_REMARKS = {
+    False: ('', 'Start identifiers, addresses and contacts with their party, e.g. "Seller GST Number".',
+            '[{"l":"Invoice Number","v":"INV-102"},{"l":"Seller GST Number","v":"03AAFF2431N1ZR"},{"l":"L1 Amount","v":"1385.65"}]'),
+    True: (' and, only when useful, "r" (remarks)', 'Give the party of identifiers, addresses and contacts in "r".',
+           '[{"l":"Invoice Number","v":"INV-102"},{"l":"GST Number","v":"03AAFF2431N1ZR","r":"Seller"},{"l":"L1 Amount","v":"1385.65"}]'),
+}
+
+PROMPT_PROFILES = ('full', 'compact', 'terse')
+
+# "L12 CGST Amount" in terse output is "Line Item 12 - CGST Amount"
+_TERSE_LINE_ITEM = re.compile(r'^L(\d+)\s*[-:.]?\s+(?=\S)')
+
+
+class PromptProfile:
+    """
+    A prompt variant: the instructions and output format sent to the model, and how its
+    output is read back. 'full' is the original verbose prompt; 'compact' asks for the
+    same label/value/remarks output in far fewer words; 'terse' also has the model write
+    short keys and line item labels, and remarks only with `remarks`. expand() turns
+    terse items back into label/value/remarks, so results look the same for every profile.
+    """
+
+    def __init__(self, name: str, remarks: bool = False):
+        if name not in PROMPT_PROFILES:
+            raise ValueError(f"Invalid prompt profile. Available profiles: {', '.join(PROMPT_PROFILES)}")
+        self.name = name
+        self.terse = name == 'terse'
+        self.remarks = remarks if self.terse else True
+        if name == 'full':
+            self.prompt = EXTRACTION_PROMPT
+            self.version = ''  # Results of the original prompt keep their cache keys
+        elif name == 'compact':
+            self.prompt = f"{COMPACT_INSTRUCTIONS}\n\n{COMPACT_OUTPUT}"
+            self.version = '.c1'
+        else:
+            key, party, example = _TERSE_REMARKS[self.remarks]
+            self.prompt = f"{COMPACT_INSTRUCTIONS}\n\n{TERSE_OUTPUT.format(remarks=key, party=party, example=example)}"
+            self.version = '.z1r' if self.remarks else '.z1'
+
+    def expand(self, item: Any) -> Any:
+        """A terse {"l", "v", "r"} item as {"label", "value", "remarks"}; other items unchanged"""
+        if not self.terse or not isinstance(item, dict) or 'label' in item or 'l' not in item:
+            return item
+        label = str(item['l'])
+        match = _TERSE_LINE_ITEM.match(label)
+        if match:
+            label = f"Line Item {match.group(1)} - {label[match.end():]}"
+        return {'label': label, 'value': item.get('v', ''), 'remarks': item.get('r', '')}
+
+
+_profiles = {}
+
+
+def get_profile(name: Optional[str] = None, remarks: Optional[bool] = None) -> PromptProfile:
+    """
+    The prompt profile called `name`, by default PROMPT_PROFILE (full). Terse output
+    includes remarks when `remarks` is set, by default PROMPT_REMARKS.
+    """
+    name = (name or os.getenv('PROMPT_PROFILE', 'full')).lower()
+    if remarks is None:
+        remarks = os.getenv('PROMPT_REMARKS', '').strip().lower() in ('1', 'true', 'yes', 'on')
+    key = (name, remarks)
+    profile = _profiles.get(key)
+    if profile is None:
+        profile = _profiles[key] = PromptProfile(name, remarks)
+    return profile
@@ -0,0 +1,79 @@
+import os
+import time
+import asyncio
+import threading
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket allowing `rate` acquisitions per second
+    with bursts of up to `capacity`
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("Rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """Take tokens if available; return 0, or the seconds to wait before retrying"""
+        with self._lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens: float = 1) -> None:
+        """Block until the requested tokens are available"""
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0:
+                return
+            time.sleep(wait)
+
+
+class AsyncTokenBucket:
+    """
+    asyncio view of a TokenBucket; waiting yields to the event loop instead of
+    blocking the thread. Wrapping the shared bucket keeps sync and async callers
+    within one budget.
+    """
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+
+    async def acquire(self, tokens: float = 1) -> None:
+        while True:
+            wait = self.bucket.try_acquire(tokens)
+            if wait == 0:
+                return
+            await asyncio.sleep(wait)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str) -> Optional[TokenBucket]:
+    """
+    Return the process-wide rate limiter for a provider, configured by
+    <PROVIDER>_RATE_LIMIT (requests per second) and <PROVIDER>_RATE_BURST.
+    Returns None when the provider has no limit configured.
+    """
+    with _limiters_lock:
+        if provider not in _limiters:
+            rate = os.getenv(f"{provider.upper()}_RATE_LIMIT")
+            burst = os.getenv(f"{provider.upper()}_RATE_BURST")
+            _limiters[provider] = TokenBucket(float(rate), float(burst) if burst else None) if rate else None
+        return _limiters[provider]
@@ -0,0 +1,252 @@
+import os
+import io
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Iterator, List, Optional, Tuple, Union
+from modules.metrics import get_registry
+
+
+def image_digest(source: Union[str, bytes, io.IOBase], chunk_size: int = 1024 * 1024) -> str:
+    """
+    Compute a SHA-256 digest of the raw image bytes.
+    Accepts a file path, a bytes object or a binary file-like object.
+    """
+    hasher = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        hasher.update(source)
+    elif isinstance(source, str):
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                hasher.update(chunk)
+    else:
+        position = source.tell()
+        for chunk in iter(lambda: source.read(chunk_size), b''):
+            hasher.update(chunk)
+        source.seek(position)
+    return hasher.hexdigest()
+
+
+class MemoryCacheBackend:
+    """In-process LRU cache with size and TTL eviction"""
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[List[Dict[str, str]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: List[Dict[str, str]]) -> None:
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """On-disk cache shared across worker processes through a SQLite database"""
+
+    def __init__(self, path: str, max_entries: int = 100000, ttl: Optional[float] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS results_accessed_at ON results (accessed_at)")
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[List[Dict[str, str]]]:
+        conn = self._connection()
+        row = conn.execute("SELECT value, stored_at FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, stored_at = row
+        now = time.time()
+        if self.ttl is not None and now - stored_at > self.ttl:
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            conn.commit()
+            return None
+        conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+        conn.commit()
+        return json.loads(value)
+
+    def set(self, key: str, value: List[Dict[str, str]]) -> None:
+        conn = self._connection()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO results (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now, now)
+        )
+        # Evict least recently used rows beyond the size limit
+        conn.execute(
+            "DELETE FROM results WHERE key IN ("
+            "SELECT key FROM results ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+        conn.commit()
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+
+class ResultCache:
+    """
+    Content-addressed cache of extraction results.
+    Keys combine a hash of the image bytes with the model id and prompt version,
+    so a prompt or model change never serves stale results.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(image_hash: str, model: str, prompt_version: str) -> str:
+        return f"{image_hash}:{model}:{prompt_version}"
+
+    def get(self, key: str) -> Optional[List[Dict[str, str]]]:
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            print(f"Result cache lookup failed: {str(e)}")
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        get_registry().inc('extractor_cache_requests_total', result='miss' if value is None else 'hit')
+        return value
+
+    def set(self, key: str, value: List[Dict[str, str]]) -> None:
+        try:
+            self.backend.set(key, value)
+        except Exception as e:
+            print(f"Result cache store failed: {str(e)}")
+
+    def fetch(self, source, extractor, metrics: Optional[Dict[str, Any]] = None,
+              structured: bool = False) -> Tuple[Any, bool]:
+        """
+        Return (results, cache_hit) for an image, calling the extractor only on a miss.
+        Cache hits skip image encoding and the API request entirely.
+        Extractors with a typed result (structured mode) are cached as that result's dict,
+        which is returned with `structured` and flattened into items otherwise.
+        `metrics` is passed through to the extractor.
+        """
+        typed = getattr(extractor, 'structured', False)
+        if structured and not typed:
+            raise ValueError("Structured results need the structured extraction mode")
+        key = self.make_key(image_digest(source), extractor.model, extractor.PROMPT_VERSION)
+        results = self.get(key)
+        cache_hit = results is not None
+        if cache_hit:
+            print(f"Result cache hit: {key}")
+        elif typed:
+            results = extractor.extract_structured(source, metrics=metrics)
+        else:
+            results = extractor.extract_info(source, metrics=metrics)
+
+        items = extractor.to_items(results) if typed else results
+        if items and not cache_hit:  # Never cache empty extractions, the user will retry those
+            self.set(key, results)
+        return (results if structured else items), cache_hit
+
+    def fetch_stream(self, source, extractor, metrics: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, str]]:
+        """
+        Streaming counterpart of fetch: yields cached items on a hit, otherwise the items
+        of extractor.stream_info as they arrive. Results are stored only once the stream
+        completes, so an interrupted stream is never cached.
+        `metrics` is passed through to the extractor and records cache_hit.
+        """
+        key = self.make_key(image_digest(source), extractor.model, extractor.PROMPT_VERSION)
+        cached = self.get(key)
+        if metrics is not None:
+            metrics['cache_hit'] = cached is not None
+        if cached is not None:
+            print(f"Result cache hit: {key}")
+            yield from cached
+            return
+
+        results = []
+        for item in extractor.stream_info(source, metrics=metrics):
+            results.append(item)
+            yield item
+        if results:  # Never cache empty extractions, the user will retry those
+            self.set(key, results)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        try:
+            size = len(self.backend)
+        except Exception:
+            size = None
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / total if total else 0.0,
+            'size': size,
+        }
+
+
+def create_cache_from_env() -> Optional[ResultCache]:
+    """
+    Build the result cache configured by environment variables:
+    RESULT_CACHE_BACKEND (memory, sqlite or none), RESULT_CACHE_PATH,
+    RESULT_CACHE_MAX_ENTRIES and RESULT_CACHE_TTL (seconds).
+    """
+    backend_name = os.getenv('RESULT_CACHE_BACKEND', 'memory').lower()
+    ttl = os.getenv('RESULT_CACHE_TTL')
+    ttl = float(ttl) if ttl else None
+
+    if backend_name == 'none':
+        return None
+    if backend_name == 'memory':
+        max_entries = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '1024'))
+        return ResultCache(MemoryCacheBackend(max_entries=max_entries, ttl=ttl))
+    if backend_name == 'sqlite':
+        path = os.getenv('RESULT_CACHE_PATH', os.path.join('cache', 'results.db'))
+        max_entries = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '100000'))
+        return ResultCache(SQLiteCacheBackend(path, max_entries=max_entries, ttl=ttl))
+    raise ValueError(f"Invalid RESULT_CACHE_BACKEND '{backend_name}'. Available backends: memory, sqlite, none")
@@ -0,0 +1,164 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+_DATE = (r'(\d{1,2}[/\-.]\d{1,2}[/\-.]\d{2,4}'
+         r'|\d{4}-\d{2}-\d{2}'
+         r'|\d{1,2}[\s\-]+(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*[\s\-,]+\d{2,4})')
+_AMOUNT = re.compile(r'(?<![\w.])(\d{1,3}(?:,\d{2,3})+(?:\.\d{1,2})?|\d+\.\d{1,2}|\d+)(?![\w%])')
+
+_GSTIN = re.compile(r'\b(\d{2}[A-Z]{5}\d{4}[A-Z][1-9A-Z]Z[0-9A-Z])\b')
+_PAN = re.compile(r'\b([A-Z]{5}\d{4}[A-Z])\b')
+_GSTIN_CHARSET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+# (label, pattern, remarks) for identifier fields; the first match in the document wins
+_IDENTIFIER_FIELDS = [
+    ('Invoice Number',
+     re.compile(r'\b(?:invoice|inv|bill)\s*(?:no\.?|number|num|#)\s*[:#\-]?\s*([A-Z0-9][A-Z0-9\-/]{2,})', re.I),
+     'Document identifier'),
+    ('Due Date', re.compile(r'\bdue\s*date\s*[:\-]?\s*' + _DATE, re.I), 'Payment due date'),
+    ('Invoice Date', re.compile(r'\b(?:invoice\s*|bill\s*)?(?<!due )date(?:d)?\s*(?:of\s*issue)?\s*[:\-]?\s*' + _DATE, re.I),
+     'Document date'),
+]
+
+# (label, line pattern) for amount fields, most specific first; a line feeds at most one field
+_AMOUNT_FIELDS = [
+    ('Sub Total', re.compile(r'\bsub\s*-?\s*total\b', re.I)),
+    ('Taxable Value', re.compile(r'\btaxable\s+(?:value|amount)\b', re.I)),
+    ('CGST Amount', re.compile(r'\bcgst\b', re.I)),
+    ('SGST Amount', re.compile(r'\b(?:sgst|utgst)\b', re.I)),
+    ('IGST Amount', re.compile(r'\bigst\b', re.I)),
+    ('Tax Amount', re.compile(r'\b(?:tax|vat)\b(?!\s*invoice)', re.I)),
+    ('Total Amount', re.compile(r'\b(?:grand\s+total|total\s+amount|amount\s+(?:due|payable)|'
+                                r'balance\s+due|net\s+(?:amount|payable)|total)\b', re.I)),
+]
+
+_TAX_FIELDS = ('CGST Amount', 'SGST Amount', 'IGST Amount', 'Tax Amount')
+
+
+def gstin_checksum_valid(gstin: str) -> bool:
+    """Validate the check character of a 15 character GSTIN"""
+    total = 0
+    for i, char in enumerate(gstin[:14]):
+        product = _GSTIN_CHARSET.index(char) * (2 if i % 2 else 1)
+        total += product // 36 + product % 36
+    return _GSTIN_CHARSET[(36 - total % 36) % 36] == gstin[14]
+
+
+def _parse_amount(value: str) -> float:
+    return float(value.replace(',', ''))
+
+
+# Kinds of field values whose format can be checked, most specific first
+_VALUE_KINDS = (
+    ('gstin', re.compile(r'^' + _GSTIN.pattern[2:-2] + r'$')),
+    ('date', re.compile(r'^' + _DATE + r'$', re.I)),
+    ('amount', re.compile(r'^(?:rs\.?|inr|₹|\$)?\s*-?(?:\d{1,3}(?:,\d{2,3})+|\d+)\.\d{1,2}$', re.I)),
+    ('number', re.compile(r'^\d+$')),
+)
+
+
+def value_kind(value: str) -> str:
+    """Format of a field value: gstin, date, amount, number or text"""
+    value = value.strip()
+    for kind, pattern in _VALUE_KINDS:
+        if pattern.match(value):
+            return kind
+    return 'text'
+
+
+def value_matches_kind(value: str, kind: Optional[str]) -> bool:
+    """Whether a value has the format of its field (GSTINs also need a valid check character)"""
+    if not kind or kind == 'text':
+        return bool(value.strip())
+    if value_kind(value) != kind:
+        return False
+    return kind != 'gstin' or gstin_checksum_valid(value.strip())
+
+
+def totals_consistent(found: Dict[str, str]) -> Optional[bool]:
+    """
+    Whether base amount plus taxes adds up to the total (within rounding), or None when
+    the fields needed to check are missing
+    """
+    base = found.get('Taxable Value') or found.get('Sub Total')
+    if base is None or 'Total Amount' not in found:
+        return None
+    try:
+        expected = _parse_amount(base) + sum(_parse_amount(found[label]) for label in _TAX_FIELDS if label in found)
+        return abs(expected - _parse_amount(found['Total Amount'])) <= 1.0
+    except ValueError:
+        return False
+
+
+class RuleBasedExtractor:
+    """
+    Regex/heuristic extraction of standard invoice fields from OCR text.
+    Produces the same label/value/remarks items as the AI extractor together
+    with a confidence score used to decide whether to escalate to the model.
+    """
+
+    # Bump whenever the rules change so cached results are invalidated
+    VERSION = "1"
+
+    # Fields a document must yield before it can be trusted without the model
+    REQUIRED_FIELDS = ('Invoice Number', 'Invoice Date', 'Total Amount')
+
+    def extract(self, text: str) -> List[Dict[str, str]]:
+        """Extract standard fields from OCR text as label/value/remarks items"""
+        items = []
+
+        for label, pattern, remarks in _IDENTIFIER_FIELDS:
+            match = pattern.search(text)
+            if match:
+                items.append({'label': label, 'value': match.group(1).strip(), 'remarks': remarks})
+
+        gstins = []
+        for match in _GSTIN.finditer(text):
+            if match.group(1) not in gstins:
+                gstins.append(match.group(1))
+        for i, gstin in enumerate(gstins):
+            party = 'usually the seller' if i == 0 else 'usually the buyer' if i == 1 else 'additional party'
+            remarks = f"GSTIN #{i + 1} on document ({party})"
+            if not gstin_checksum_valid(gstin):
+                remarks += "; check digit does not validate"
+            items.append({'label': 'GST Number', 'value': gstin, 'remarks': remarks})
+
+        for pan in dict.fromkeys(_PAN.findall(text)):
+            items.append({'label': 'PAN', 'value': pan, 'remarks': 'Permanent Account Number'})
+
+        amounts = {}
+        for line in text.splitlines():
+            values = _AMOUNT.findall(line)
+            if not values:
+                continue
+            for label, pattern in _AMOUNT_FIELDS:
+                if pattern.search(line):
+                    # Amount columns are right-aligned, so the last number on the line is the amount.
+                    # Totals keep the last occurrence (the grand total sits at the bottom), others the first.
+                    if label == 'Total Amount' or label not in amounts:
+                        amounts[label] = values[-1]
+                    break
+        for label, pattern in _AMOUNT_FIELDS:
+            if label in amounts:
+                items.append({'label': label, 'value': amounts[label], 'remarks': 'From document totals'})
+
+        return items
+
+    def confidence(self, items: List[Dict[str, str]], ocr_confidence: float) -> float:
+        """
+        Score between 0 and 1: OCR word confidence scaled by how many required
+        fields were found, adjusted by consistency checks on totals and GSTINs
+        """
+        found = {item['label']: item['value'] for item in items}
+        coverage = sum(1 for label in self.REQUIRED_FIELDS if label in found) / len(self.REQUIRED_FIELDS)
+        score = ocr_confidence * coverage
+
+        if totals_consistent(found):
+            score = min(1.0, score + 0.1)
+        if any('check digit' in item['remarks'] for item in items if item['label'] == 'GST Number'):
+            score *= 0.8
+        return round(score, 3)
+
+    def extract_with_confidence(self, text: str, ocr_confidence: float) -> Tuple[List[Dict[str, str]], float]:
+        items = self.extract(text)
+        return items, self.confidence(items, ocr_confidence)
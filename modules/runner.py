@@ -0,0 +1,263 @@
+"""
+Extraction without the web app, for scripts and the command line (python -m modules.cli extract).
+Only the standard library is imported here; extractors and their dependencies are imported
+by the mode that needs them, so the local 'ocr' mode runs without an API key and the CLI
+starts quickly.
+"""
+import os
+import json
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Any, Iterable, Iterator, Optional, Sequence, Tuple
+
+# Extraction modes of the web app, plus 'ocr': local Tesseract and rules only, never the model
+EXTRACTION_MODES = ('ai', 'tiered', 'template', 'structured', 'tiled', 'ocr')
+DOCUMENT_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'tiff', 'tif', 'bmp', 'pdf'}
+MANIFEST_EXTENSIONS = {'txt', 'json', 'jsonl', 'ndjson'}
+
+
+def get_mode_extractor(mode: str, model: str):
+    """Shared extractor of an extraction mode for a model (not for 'ocr', which runs in batches)"""
+    if mode == 'tiered':
+        from modules.tiered_extractor import get_tiered_extractor
+        return get_tiered_extractor(model)
+    if mode == 'template':
+        from modules.template_index import get_template_extractor
+        return get_template_extractor(model)
+    if mode == 'structured':
+        from modules.structured_extractor import get_structured_extractor
+        return get_structured_extractor(model)
+    if mode == 'tiled':
+        from modules.tiled_extractor import get_tiled_extractor
+        return get_tiled_extractor(model)
+    if mode == 'ai':
+        from modules.info_extractor import get_extractor
+        return get_extractor(model)
+    raise ValueError(f"Invalid extraction mode. Available modes: {', '.join(EXTRACTION_MODES)}")
+
+
+def _extension(path: str) -> str:
+    return os.path.splitext(path)[1].lstrip('.').lower()
+
+
+def _manifest_paths(path: str) -> Iterator[str]:
+    """
+    Document paths listed in a manifest: one per line (.txt), a JSON list of paths or of
+    objects with a "path" (.json, e.g. a benchmark corpus manifest.json) or one such object
+    per line (.jsonl). Relative paths that don't exist from the working directory are taken
+    relative to the manifest.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, encoding='utf-8') as f:
+        if _extension(path) == 'json':
+            entries = json.load(f)
+        elif _extension(path) == 'txt':
+            entries = (line.strip() for line in f)
+        else:
+            entries = (json.loads(line) for line in f if line.strip())
+        for entry in entries:
+            document = entry.get('path') if isinstance(entry, dict) else entry
+            if not document or document.startswith('#'):
+                continue
+            if not os.path.isabs(document) and not os.path.exists(document):
+                document = os.path.join(base, document)
+            yield document
+
+
+def iter_documents(inputs: Sequence[str], recursive: bool = True) -> Iterator[str]:
+    """
+    Document paths from files, directories (walked in sorted order, subdirectories too
+    unless recursive is False) and manifests, lazily so huge trees start at once
+    """
+    for source in inputs:
+        if os.path.isdir(source):
+            for root, directories, files in os.walk(source):
+                directories.sort()
+                if not recursive:
+                    directories.clear()
+                for name in sorted(files):
+                    if _extension(name) in DOCUMENT_EXTENSIONS:
+                        yield os.path.join(root, name)
+        elif _extension(source) in MANIFEST_EXTENSIONS:
+            yield from _manifest_paths(source)
+        elif os.path.exists(source):
+            yield source
+        else:
+            raise Exception(f"File not found: {source}")
+
+
+class Checkpoint:
+    """
+    Documents already processed, appended to a file as each one finishes so an interrupted
+    run can resume. Documents are identified by absolute path, size and modification time,
+    so a replaced file is processed again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.finished = {}  # Key -> status
+        self.skipped = 0
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Last line cut short by the interruption
+                    self.finished[tuple(entry['key'])] = entry['status']
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    @staticmethod
+    def key(document: str) -> Tuple[str, int, int]:
+        try:
+            stat = os.stat(document)
+        except OSError:
+            return os.path.abspath(document), -1, -1
+        return os.path.abspath(document), stat.st_size, stat.st_mtime_ns
+
+    def pending(self, documents: Iterable[str], retry_failed: bool = True) -> Iterator[str]:
+        """The documents not finished yet (failed ones only with retry_failed)"""
+        for document in documents:
+            status = self.finished.get(self.key(document))
+            if status == 'done' or (status is not None and not retry_failed):
+                self.skipped += 1
+                continue
+            yield document
+
+    def add(self, document: str, status: str) -> None:
+        key = self.key(document)
+        with self._lock:
+            self.finished[key] = status
+            self._file.write(json.dumps({'key': key, 'status': status}) + '\n')
+            self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _extract_one(document: str, mode: str, model: str, result_cache) -> Dict[str, Any]:
+    from modules.document_pages import PagedExtractor, is_paged_document
+
+    start = time.time()
+    record = {'document': document}
+    try:
+        metrics = {}
+        extractor = get_mode_extractor(mode, model)
+        if is_paged_document(document):
+            extractor = PagedExtractor(extractor)
+        structured = getattr(extractor, 'structured', False)
+        if result_cache is not None:
+            results, cache_hit = result_cache.fetch(document, extractor, metrics=metrics, structured=structured)
+        elif structured:
+            results, cache_hit = extractor.extract_structured(document, metrics=metrics), False
+        else:
+            results, cache_hit = extractor.extract_info(document, metrics=metrics), False
+        if structured:
+            # Structured mode records carry the typed result as well (Document.to_dict)
+            record['structured'], results = results, extractor.to_items(results)
+        record.update(status='done', results=results, cache_hit=cache_hit, metrics=metrics)
+    except Exception as e:
+        print(f"Document {document} failed: {str(e)}")
+        record.update(status='failed', error=str(e))
+    record['elapsed_s'] = round(time.time() - start, 3)
+    return record
+
+
+def _extract_ocr(documents: Iterable[str], workers: int) -> Iterator[Dict[str, Any]]:
+    from modules.ocr_processor import OCRProcessor
+    from modules.rule_extractor import RuleBasedExtractor
+
+    rules = RuleBasedExtractor()
+    fed = deque()
+
+    def feed():
+        for document in documents:
+            fed.append((document, time.time()))
+            yield document
+
+    # Results come back in input order, so they pair with the documents fed in order
+    for result in OCRProcessor().process_batch(feed(), workers=workers):
+        document, start = fed.popleft()
+        record = {'document': document}
+        if result['error']:
+            record.update(status='failed', error=result['error'])
+        else:
+            try:
+                items, confidence = rules.extract_with_confidence(result['text'], result['confidence'])
+                record.update(status='done', results=items, cache_hit=False,
+                              metrics={'tier': 'ocr', 'ocr_confidence': confidence})
+            except Exception as e:
+                print(f"Document {document} failed: {str(e)}")
+                record.update(status='failed', error=str(e))
+        record['elapsed_s'] = round(time.time() - start, 3)
+        yield record
+
+
+def extract_documents(documents: Iterable[str], mode: str = 'ai', model: Optional[str] = None,
+                      workers: int = 4, checkpoint: Optional[Checkpoint] = None, retry_failed: bool = True,
+                      use_cache: bool = True) -> Iterator[Dict[str, Any]]:
+    """
+    Extract documents (paths) with up to `workers` in flight, yielding one record per
+    document as it finishes: document, status ('done' or 'failed'), results or error,
+    and timings, the same shape as the records /batch streams.
+    With a checkpoint, documents it lists as finished are skipped and every new record is
+    added to it once yielded. model defaults to DEFAULT_MODEL (the 'auto' router);
+    use_cache consults the RESULT_CACHE_* cache like the web app.
+    """
+    if mode not in EXTRACTION_MODES:
+        raise ValueError(f"Invalid extraction mode. Available modes: {', '.join(EXTRACTION_MODES)}")
+    model = model or os.getenv('DEFAULT_MODEL', 'auto')
+    if checkpoint is not None:
+        documents = checkpoint.pending(documents, retry_failed)
+
+    if mode == 'ocr':
+        records = _extract_ocr(documents, workers)
+    else:
+        records = _extract_concurrently(documents, mode, model, workers, use_cache)
+    try:
+        for record in records:
+            yield record
+            if checkpoint is not None:
+                # Only once the caller has the record, so a crash never loses a result
+                checkpoint.add(record['document'], record['status'])
+    finally:
+        # Cancel queued documents now rather than when the generator is collected
+        records.close()
+
+
+def _extract_concurrently(documents: Iterable[str], mode: str, model: str, workers: int,
+                          use_cache: bool) -> Iterator[Dict[str, Any]]:
+    from modules.metrics import bind_context
+
+    result_cache = None
+    if use_cache:
+        from modules.result_cache import create_cache_from_env
+        result_cache = create_cache_from_env()
+    # Fail on a bad model or missing API key before the first document, not on every one
+    get_mode_extractor(mode, model)
+
+    documents = iter(documents)
+    pending = set()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='extract-worker') as executor:
+        try:
+            while True:
+                # Keep a couple of documents per worker queued; paths are read only as needed
+                while len(pending) < workers * 2:
+                    document = next(documents, None)
+                    if document is None:
+                        break
+                    pending.add(executor.submit(bind_context(_extract_one), document, mode, model, result_cache))
+                if not pending:
+                    return
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            # Also runs when the caller stops early or is interrupted
+            for future in pending:
+                future.cancel()
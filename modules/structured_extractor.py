@@ -0,0 +1,95 @@
+import json
+import time
+import threading
+from typing import Dict, Any, List, BinaryIO, Optional, Union
+from PIL import Image
+from modules.info_extractor import get_extractor
+from modules.metrics import observe_stage
+from modules.structured_output import (STRUCTURED_PROMPT, RESPONSE_FORMAT, Document,
+                                       SchemaValidationError, validate_document, document_items)
+
+
+class StructuredExtractor:
+    """
+    Extraction using the provider's JSON schema response format.
+    The model is constrained to DOCUMENT_SCHEMA, so the reply is decoded with one
+    json.loads and validated in a single pass into a typed Document, with no markdown
+    stripping or bracket slicing. extract_structured returns the Document as a dict, which
+    the result cache, jobs and exports keep as is; extract_info flattens it into the usual
+    label/value/remarks items for the results page.
+    """
+
+    # Bump whenever the schema, prompt or flattening changes so cached results are invalidated
+    VERSION = "2"
+    # Has a typed result (extract_structured), see ResultCache.fetch
+    structured = True
+
+    def __init__(self, model_choice="gpt4-mini"):
+        self.ai_extractor = get_extractor(model_choice)
+        if not self.ai_extractor.structured_output:
+            raise ValueError(f"Model '{model_choice}' does not support structured output")
+        self.model = f"structured/{self.ai_extractor.model}"
+        self.PROMPT_VERSION = f"s{self.VERSION}"
+
+    def extract_document(self, source: Union[str, BinaryIO, Image.Image],
+                         metrics: Optional[Dict[str, Any]] = None) -> Document:
+        """Extract a typed Document from a document image"""
+        result = self.ai_extractor.request_completion(source, metrics=metrics, prompt=STRUCTURED_PROMPT,
+                                                      response_format=RESPONSE_FORMAT)
+        try:
+            message = result['choices'][0]['message']
+        except (KeyError, IndexError, TypeError):
+            print("\nUnexpected API response format")
+            raise Exception("Unexpected API response format")
+        if message.get('refusal'):
+            raise Exception(f"Model refused to extract the document: {message['refusal']}")
+
+        start = time.perf_counter()
+        try:
+            document = validate_document(json.loads(message.get('content') or ''))
+        except json.JSONDecodeError as e:
+            # Only happens when the completion was cut off, e.g. by the token limit
+            print(f"\nJSON Decode Error in structured response: {str(e)}")
+            raise Exception("Model response was incomplete. Please try again.")
+        except SchemaValidationError as e:
+            print(f"\n{str(e)}")
+            raise Exception(str(e))
+
+        parse_ms = (time.perf_counter() - start) * 1000
+        observe_stage('parse', parse_ms / 1000, model=self.model)
+
+        print(f"\nStructured extraction: {len(document.fields)} fields, {len(document.parties)} parties, "
+              f"{len(document.line_items)} line items")
+        if metrics is not None:
+            metrics.update(line_items=len(document.line_items), parse_ms=round(parse_ms, 1))
+        return document
+
+    def extract_structured(self, source: Union[str, BinaryIO, Image.Image],
+                           metrics: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """The typed Document as a JSON-ready dict (Document.to_dict)"""
+        return self.extract_document(source, metrics=metrics).to_dict()
+
+    @staticmethod
+    def to_items(result: Dict[str, Any]) -> List[Dict[str, str]]:
+        """Flatten an extract_structured result into label/value/remarks items"""
+        return document_items(result)
+
+    def extract_info(self, source: Union[str, BinaryIO, Image.Image],
+                     metrics: Optional[Dict[str, Any]] = None) -> List[Dict[str, str]]:
+        return self.extract_document(source, metrics=metrics).to_items()
+
+
+_structured_extractors = {}
+_structured_extractors_lock = threading.Lock()
+
+
+def get_structured_extractor(model_choice: str = "gpt4-mini") -> StructuredExtractor:
+    """Return the shared structured extractor for a model, creating it on first use"""
+    extractor = _structured_extractors.get(model_choice)
+    if extractor is None:
+        with _structured_extractors_lock:
+            extractor = _structured_extractors.get(model_choice)
+            if extractor is None:
+                extractor = StructuredExtractor(model_choice=model_choice)
+                _structured_extractors[model_choice] = extractor
+    return extractor
@@ -0,0 +1,346 @@
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+STRUCTURED_PROMPT = """Analyze this transactional document (invoice, bill, sales order, etc.) and fill in the response schema.
+
+- document_type: e.g. "Tax Invoice", "Sales Order"
+- fields: document identifiers, dates, payment/banking details and any other header information, each with a label, value and remarks
+- parties: every party (seller, buyer, shipping address, etc.) with its name, address, GSTIN, PAN and contact details
+- line_items: every product/service row in order with all its columns; taxes holds each tax (CGST, SGST, IGST, ...) with rate and amount, other holds any remaining columns
+- tax_summary: rows of HSN/SAC or tax summary tables
+- totals: sub totals, tax totals, round off, grand total and amount in words
+
+Use an empty string for values not present in the document. Copy values exactly as printed."""
+
+_STRING = {"type": "string"}
+
+
+def _object_schema(properties: Dict[str, Any]) -> Dict[str, Any]:
+    # Strict structured outputs require every property to be listed as required
+    return {"type": "object", "additionalProperties": False,
+            "required": list(properties), "properties": properties}
+
+
+_FIELD_SCHEMA = _object_schema({"label": _STRING, "value": _STRING, "remarks": _STRING})
+_TAX_SCHEMA = _object_schema({"name": _STRING, "rate": _STRING, "amount": _STRING})
+_COLUMN_SCHEMA = _object_schema({"name": _STRING, "value": _STRING})
+
+DOCUMENT_SCHEMA = _object_schema({
+    "document_type": _STRING,
+    "fields": {"type": "array", "items": _FIELD_SCHEMA},
+    "parties": {"type": "array", "items": _object_schema({
+        "role": _STRING, "name": _STRING, "address": _STRING,
+        "gstin": _STRING, "pan": _STRING, "contact": _STRING,
+    })},
+    "line_items": {"type": "array", "items": _object_schema({
+        "description": _STRING, "hsn_sac": _STRING, "quantity": _STRING, "unit": _STRING,
+        "rate": _STRING, "amount": _STRING, "taxable_value": _STRING,
+        "taxes": {"type": "array", "items": _TAX_SCHEMA},
+        "other": {"type": "array", "items": _COLUMN_SCHEMA},
+    })},
+    "tax_summary": {"type": "array", "items": _object_schema({
+        "hsn_sac": _STRING, "taxable_value": _STRING,
+        "taxes": {"type": "array", "items": _TAX_SCHEMA},
+    })},
+    "totals": {"type": "array", "items": _FIELD_SCHEMA},
+})
+
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "document_extraction", "strict": True, "schema": DOCUMENT_SCHEMA},
+}
+
+
+class SchemaValidationError(Exception):
+    """Raised when a structured response does not match DOCUMENT_SCHEMA"""
+
+    def __init__(self, path: str, message: str):
+        super().__init__(f"Invalid structured response at {path}: {message}")
+        self.path = path
+
+
+class Field:
+    __slots__ = ('label', 'value', 'remarks')
+
+    def __init__(self, label: str, value: str, remarks: str = ''):
+        self.label = label
+        self.value = value
+        self.remarks = remarks
+
+
+class Tax:
+    __slots__ = ('name', 'rate', 'amount')
+
+    def __init__(self, name: str, rate: str = '', amount: str = ''):
+        self.name = name
+        self.rate = rate
+        self.amount = amount
+
+
+class Party:
+    __slots__ = ('role', 'name', 'address', 'gstin', 'pan', 'contact')
+
+    def __init__(self, role: str, name: str = '', address: str = '', gstin: str = '', pan: str = '', contact: str = ''):
+        self.role = role
+        self.name = name
+        self.address = address
+        self.gstin = gstin
+        self.pan = pan
+        self.contact = contact
+
+
+class LineItem:
+    __slots__ = ('description', 'hsn_sac', 'quantity', 'unit', 'rate', 'amount', 'taxable_value', 'taxes', 'other')
+
+    def __init__(self, description: str = '', hsn_sac: str = '', quantity: str = '', unit: str = '',
+                 rate: str = '', amount: str = '', taxable_value: str = '',
+                 taxes: Optional[List[Tax]] = None, other: Optional[Dict[str, str]] = None):
+        self.description = description
+        self.hsn_sac = hsn_sac
+        self.quantity = quantity
+        self.unit = unit
+        self.rate = rate
+        self.amount = amount
+        self.taxable_value = taxable_value
+        self.taxes = taxes or []
+        self.other = other or {}
+
+
+class TaxSummaryRow:
+    __slots__ = ('hsn_sac', 'taxable_value', 'taxes')
+
+    def __init__(self, hsn_sac: str = '', taxable_value: str = '', taxes: Optional[List[Tax]] = None):
+        self.hsn_sac = hsn_sac
+        self.taxable_value = taxable_value
+        self.taxes = taxes or []
+
+
+class Document:
+    """Typed extraction result: header fields, parties, line items, tax summary and totals"""
+    __slots__ = ('document_type', 'fields', 'parties', 'line_items', 'tax_summary', 'totals')
+
+    def __init__(self, document_type: str = '', fields: Optional[List[Field]] = None,
+                 parties: Optional[List[Party]] = None, line_items: Optional[List[LineItem]] = None,
+                 tax_summary: Optional[List[TaxSummaryRow]] = None, totals: Optional[List[Field]] = None):
+        self.document_type = document_type
+        self.fields = fields or []
+        self.parties = parties or []
+        self.line_items = line_items or []
+        self.tax_summary = tax_summary or []
+        self.totals = totals or []
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dict in the shape of DOCUMENT_SCHEMA (other columns as a name to value mapping)"""
+        def taxes(values):
+            return [{'name': t.name, 'rate': t.rate, 'amount': t.amount} for t in values]
+
+        return {
+            'document_type': self.document_type,
+            'fields': [{'label': f.label, 'value': f.value, 'remarks': f.remarks} for f in self.fields],
+            'parties': [{slot: getattr(p, slot) for slot in Party.__slots__} for p in self.parties],
+            'line_items': [
+                dict({slot: getattr(item, slot) for slot in LineItem.__slots__[:7]},
+                     taxes=taxes(item.taxes), other=dict(item.other))
+                for item in self.line_items
+            ],
+            'tax_summary': [{'hsn_sac': r.hsn_sac, 'taxable_value': r.taxable_value, 'taxes': taxes(r.taxes)}
+                            for r in self.tax_summary],
+            'totals': [{'label': f.label, 'value': f.value, 'remarks': f.remarks} for f in self.totals],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Document':
+        """Rebuild a Document from to_dict() output, e.g. a cached or stored result (not validated)"""
+        def taxes(values):
+            return [Tax(t['name'], t['rate'], t['amount']) for t in values]
+
+        return cls(
+            document_type=data.get('document_type', ''),
+            fields=[Field(f['label'], f['value'], f['remarks']) for f in data.get('fields', [])],
+            parties=[Party(*(p[slot] for slot in Party.__slots__)) for p in data.get('parties', [])],
+            line_items=[LineItem(*(item[slot] for slot in LineItem.__slots__[:7]),
+                                 taxes=taxes(item['taxes']), other=dict(item['other']))
+                        for item in data.get('line_items', [])],
+            tax_summary=[TaxSummaryRow(r['hsn_sac'], r['taxable_value'], taxes(r['taxes']))
+                         for r in data.get('tax_summary', [])],
+            totals=[Field(f['label'], f['value'], f['remarks']) for f in data.get('totals', [])],
+        )
+
+    @staticmethod
+    def _line_item_columns(item: LineItem) -> Iterator[Tuple[str, str]]:
+        yield 'Product', item.description
+        yield 'HSN/SAC', item.hsn_sac
+        yield 'Quantity', item.quantity
+        yield 'Unit', item.unit
+        yield 'Rate', item.rate
+        yield 'Amount', item.amount
+        yield 'Taxable Value', item.taxable_value
+        for tax in item.taxes:
+            yield f"{tax.name}%", tax.rate
+            yield f"{tax.name} Amount", tax.amount
+        yield from item.other.items()
+
+    def _header_items(self) -> Iterator[Tuple[str, str, str]]:
+        yield 'Document Type', self.document_type, 'Determined from document header'
+        for field in self.fields:
+            yield field.label, field.value, field.remarks
+        for party in self.parties:
+            role = party.role.title() or 'Party'
+            context = f"Belongs to {party.role or 'party'}" + (f" ({party.name})" if party.name else '')
+            yield f"{role} Name", party.name, ''
+            yield f"{role} Address", party.address, context
+            yield f"{role} GST Number", party.gstin, context
+            yield f"{role} PAN", party.pan, context
+            yield f"{role} Contact", party.contact, context
+
+    def _summary_items(self) -> Iterator[Tuple[str, str, str]]:
+        for n, row in enumerate(self.tax_summary, 1):
+            prefix = f"Tax Summary {n} - "
+            yield prefix + 'HSN/SAC', row.hsn_sac, ''
+            yield prefix + 'Taxable Value', row.taxable_value, ''
+            for tax in row.taxes:
+                yield f"{prefix}{tax.name}%", tax.rate, ''
+                yield f"{prefix}{tax.name} Amount", tax.amount, ''
+        for field in self.totals:
+            yield field.label, field.value, field.remarks
+
+    def to_items(self) -> List[Dict[str, str]]:
+        """Flatten into the label/value/remarks items used by the results page"""
+        items = [{'label': label, 'value': value, 'remarks': remarks}
+                 for label, value, remarks in self._header_items() if value]
+        for n, item in enumerate(self.line_items, 1):
+            items.extend({'label': f"Line Item {n} - {column}", 'value': value, 'remarks': ''}
+                         for column, value in self._line_item_columns(item) if value)
+        items.extend({'label': label, 'value': value, 'remarks': remarks}
+                     for label, value, remarks in self._summary_items() if value)
+        return items
+
+    def to_rows(self) -> Tuple[List[Tuple[str, str]], List[List[Tuple[str, str]]]]:
+        """
+        Document fields as (label, value) pairs and one list of (column, value) pairs per
+        line item, for table exports; labels are the same as to_items without the prefix
+        """
+        fields = [(label, value) for label, value, _ in self._header_items() if value]
+        fields += [(label, value) for label, value, _ in self._summary_items() if value]
+        rows = [[(column, value) for column, value in self._line_item_columns(item) if value]
+                for item in self.line_items]
+        return fields, rows
+
+
+def document_items(data: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Label/value/remarks items of a Document stored as a dict"""
+    return Document.from_dict(data).to_items()
+
+
+def merge_documents(documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge the to_dict() results of a document's pages into one: line items and tax summary
+    rows are concatenated in page order, while header fields, parties and totals repeated
+    on several pages are kept once
+    """
+    merged = {'document_type': '', 'fields': [], 'parties': [], 'line_items': [], 'tax_summary': [], 'totals': []}
+    seen = set()
+    for document in documents:
+        merged['document_type'] = merged['document_type'] or document.get('document_type', '')
+        for key in ('line_items', 'tax_summary'):
+            merged[key].extend(document.get(key, []))
+        for key in ('fields', 'parties', 'totals'):
+            for entry in document.get(key, []):
+                identity = (key, tuple(sorted(entry.items())))
+                if identity not in seen:
+                    seen.add(identity)
+                    merged[key].append(entry)
+    return merged
+
+
+# Single-pass validation: each value is checked once while the typed objects are built
+
+def _string(value: Any, path: str) -> str:
+    if isinstance(value, str):
+        return value.strip()
+    if value is None:
+        return ''
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise SchemaValidationError(path, f"expected a string, got {type(value).__name__}")
+
+
+def _list(value: Any, path: str) -> list:
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        raise SchemaValidationError(path, f"expected an array, got {type(value).__name__}")
+    return value
+
+
+def _dict(value: Any, path: str) -> dict:
+    if not isinstance(value, dict):
+        raise SchemaValidationError(path, f"expected an object, got {type(value).__name__}")
+    return value
+
+
+def _fields(value: Any, path: str) -> List[Field]:
+    fields = []
+    for i, entry in enumerate(_list(value, path)):
+        entry = _dict(entry, f"{path}[{i}]")
+        field = Field(_string(entry.get('label'), f"{path}[{i}].label"),
+                      _string(entry.get('value'), f"{path}[{i}].value"),
+                      _string(entry.get('remarks'), f"{path}[{i}].remarks"))
+        if field.label and field.value:
+            fields.append(field)
+    return fields
+
+
+def _taxes(value: Any, path: str) -> List[Tax]:
+    taxes = []
+    for i, entry in enumerate(_list(value, path)):
+        entry = _dict(entry, f"{path}[{i}]")
+        tax = Tax(_string(entry.get('name'), f"{path}[{i}].name"),
+                  _string(entry.get('rate'), f"{path}[{i}].rate"),
+                  _string(entry.get('amount'), f"{path}[{i}].amount"))
+        if tax.name and (tax.rate or tax.amount):
+            taxes.append(tax)
+    return taxes
+
+
+def validate_document(data: Any) -> Document:
+    """Validate a decoded structured response against DOCUMENT_SCHEMA and build the typed Document"""
+    data = _dict(data, '$')
+
+    parties = []
+    for i, entry in enumerate(_list(data.get('parties'), '$.parties')):
+        path = f"$.parties[{i}]"
+        entry = _dict(entry, path)
+        parties.append(Party(*(_string(entry.get(slot), f"{path}.{slot}") for slot in Party.__slots__)))
+
+    line_items = []
+    for i, entry in enumerate(_list(data.get('line_items'), '$.line_items')):
+        path = f"$.line_items[{i}]"
+        entry = _dict(entry, path)
+        other = {}
+        for j, column in enumerate(_list(entry.get('other'), f"{path}.other")):
+            column = _dict(column, f"{path}.other[{j}]")
+            name = _string(column.get('name'), f"{path}.other[{j}].name")
+            if name:
+                other[name] = _string(column.get('value'), f"{path}.other[{j}].value")
+        line_items.append(LineItem(
+            *(_string(entry.get(slot), f"{path}.{slot}") for slot in LineItem.__slots__[:7]),
+            taxes=_taxes(entry.get('taxes'), f"{path}.taxes"),
+            other=other,
+        ))
+
+    tax_summary = []
+    for i, entry in enumerate(_list(data.get('tax_summary'), '$.tax_summary')):
+        path = f"$.tax_summary[{i}]"
+        entry = _dict(entry, path)
+        tax_summary.append(TaxSummaryRow(_string(entry.get('hsn_sac'), f"{path}.hsn_sac"),
+                                         _string(entry.get('taxable_value'), f"{path}.taxable_value"),
+                                         _taxes(entry.get('taxes'), f"{path}.taxes")))
+
+    return Document(
+        document_type=_string(data.get('document_type'), '$.document_type'),
+        fields=_fields(data.get('fields'), '$.fields'),
+        parties=parties,
+        line_items=line_items,
+        tax_summary=tax_summary,
+        totals=_fields(data.get('totals'), '$.totals'),
+    )
@@ -0,0 +1,551 @@
+import os
+import re
+import json
+import time
+import uuid
+import random
+import sqlite3
+import threading
+from typing import Dict, Any, List, BinaryIO, Optional, Set, Tuple, Union
+import numpy as np
+from PIL import Image
+from modules.info_extractor import get_extractor
+from modules.metrics import observe_stage
+from modules.rule_extractor import totals_consistent, value_kind, value_matches_kind
+
+_LINE_ITEM_COLUMN = re.compile(r'^line\s*item\s*\d+\s*-\s*(.+)$', re.I)
+
+TEMPLATE_PROMPT = """This document uses a layout seen before. Extract the following fields and return them as a JSON list of objects with "label", "value" and "remarks", using exactly these labels:
+{fields}
+{line_items}Skip fields that are not present. Return only the JSON list."""
+
+TEMPLATE_LINE_ITEMS_PROMPT = """Extract every line item as separate entries labelled "Line Item N - <column>" (N counting from 1) for these columns:
+{columns}
+"""
+
+
+def layout_hash(gray: np.ndarray, hash_size: int = 16) -> int:
+    """
+    Difference hash of a grayscale page: compares neighbouring cells of a heavily
+    downscaled copy, so it captures the block layout rather than the text itself.
+    """
+    small = np.asarray(Image.fromarray(gray).resize((hash_size + 1, hash_size), Image.BOX), dtype=np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(''.join('1' if bit else '0' for bit in bits), 2)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r'[^a-z0-9]', '', text.lower())
+
+
+def anchor_words(words: List[Dict[str, Any]], min_conf: float = 60) -> Set[str]:
+    """Confidently recognized words that can identify a layout (labels, headings, supplier name)"""
+    return {
+        word['text'].lower() for word in words
+        if word['conf'] >= min_conf and len(word['text']) >= 4 and word['text'].isalpha()
+    }
+
+
+def locate_value(words: List[Dict[str, Any]], value: str, page_size: Tuple[int, int]) -> Optional[List[float]]:
+    """
+    Find the run of words on one line spelling out value.
+    Returns its box as fractions of the page [x, y, w, h], or None.
+    """
+    target = _normalize(value)
+    if not target:
+        return None
+    lines = {}
+    for word in words:
+        # Lines are tuples from OCR but lists once an observation is stored as JSON
+        lines.setdefault(tuple(word['line']), []).append(word)
+
+    width, height = page_size
+    for line in lines.values():
+        for start in range(len(line)):
+            joined = ''
+            for end in range(start, len(line)):
+                joined += _normalize(line[end]['text'])
+                if len(joined) >= len(target):
+                    break
+            if joined == target:
+                run = line[start:end + 1]
+                x0 = min(w['left'] for w in run)
+                y0 = min(w['top'] for w in run)
+                x1 = max(w['left'] + w['width'] for w in run)
+                y1 = max(w['top'] + w['height'] for w in run)
+                return [x0 / width, y0 / height, (x1 - x0) / width, (y1 - y0) / height]
+    return None
+
+
+def region_words(words: List[Dict[str, Any]], box: List[float], page_size: Tuple[int, int]) -> List[Dict[str, Any]]:
+    """
+    Words whose centre falls in a stored field box, in reading order. The box is padded
+    and widened to the right, since values like invoice numbers vary in length.
+    """
+    width, height = page_size
+    x, y, w, h = box
+    x0, x1 = (x - 0.01) * width, (x + w + 0.15) * width
+    y0, y1 = (y - 0.005) * height, (y + h + 0.005) * height
+    found = []
+    for word in words:
+        cx = word['left'] + word['width'] / 2
+        cy = word['top'] + word['height'] / 2
+        if x0 <= cx <= x1 and y0 <= cy <= y1:
+            found.append(word)
+    found.sort(key=lambda word: (tuple(word['line']), word['left']))
+    return found
+
+
+def read_region(words: List[Dict[str, Any]], box: List[float], page_size: Tuple[int, int]) -> str:
+    """Text of the words in a stored field box"""
+    return ' '.join(word['text'] for word in region_words(words, box, page_size))
+
+
+class LSHIndex:
+    """
+    Locality-sensitive index over integer hashes with Hamming distance.
+    Each table buckets hashes by a fixed random sample of their bits, so near
+    duplicates share a bucket in at least one table with high probability while
+    unrelated layouts almost never do. Lookups cost one dict access per table,
+    independent of the number of stored hashes; candidates are verified exactly.
+    """
+
+    def __init__(self, bits: int = 256, tables: int = 20, bits_per_table: int = 16, seed: int = 0):
+        rng = random.Random(seed)
+        self._masks = []
+        for _ in range(tables):
+            mask = 0
+            for position in rng.sample(range(bits), bits_per_table):
+                mask |= 1 << position
+            self._masks.append(mask)
+        self._tables = [{} for _ in self._masks]
+        self._keys = {}
+        self._size = 0
+
+    def add(self, key: int, value: Any) -> None:
+        self._size += 1
+        self._keys.setdefault(key, []).append(value)
+        for mask, table in zip(self._masks, self._tables):
+            bucket = table.setdefault(key & mask, [])
+            if key not in bucket:
+                bucket.append(key)
+
+    def search(self, key: int, radius: int) -> List[Tuple[int, Any]]:
+        """Values within radius of key as (distance, value), closest first"""
+        candidates = set()
+        for mask, table in zip(self._masks, self._tables):
+            candidates.update(table.get(key & mask, ()))
+        found = []
+        for candidate in candidates:
+            distance = hamming(key, candidate)
+            if distance <= radius:
+                found.extend((distance, value) for value in self._keys[candidate])
+        found.sort(key=lambda item: item[0])
+        return found
+
+    def __len__(self) -> int:
+        return self._size
+
+
+def field_keys(fields: List[Dict[str, Any]]) -> List[Tuple[str, int]]:
+    """
+    (label, occurrence) of each field in order, so labels repeated on one document
+    (e.g. the seller's and the buyer's GST Number) are matched to the same occurrence
+    """
+    seen = {}
+    keys = []
+    for field in fields:
+        occurrence = seen.get(field['label'], 0)
+        seen[field['label']] = occurrence + 1
+        keys.append((field['label'], occurrence))
+    return keys
+
+
+class TemplateIndex:
+    """
+    Persistent index of known document layouts.
+    Templates live in SQLite so every worker process shares them; each process keeps an
+    LSH index of layout hashes and picks up templates added by other workers incrementally.
+    Model extractions are only kept as pending observations; templates learn from those
+    a reviewer confirms (see confirm), never from unreviewed model output.
+    """
+
+    # Schema version: 1 resets confirmations counted before learning required a confirmation
+    SCHEMA_VERSION = 1
+
+    def __init__(self, path: str, max_distance: int = 32, min_anchor_score: float = 0.6,
+                 observation_ttl: float = 7 * 24 * 3600):
+        self.path = path
+        self.max_distance = max_distance
+        self.min_anchor_score = min_anchor_score
+        self.observation_ttl = observation_ttl
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._hashes = LSHIndex()
+        self._last_id = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS templates ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, layout_hash TEXT NOT NULL, "
+            "anchors TEXT NOT NULL, fields TEXT NOT NULL, confirmations INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS observations ("
+            "id TEXT PRIMARY KEY, layout_hash TEXT NOT NULL, anchors TEXT NOT NULL, words TEXT NOT NULL, "
+            "page_size TEXT NOT NULL, results TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS observations_created_at ON observations (created_at)")
+        if conn.execute("PRAGMA user_version").fetchone()[0] < self.SCHEMA_VERSION:
+            # Earlier versions counted every model extraction as a confirmation
+            conn.execute("UPDATE templates SET confirmations = 0")
+            conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        conn.commit()
+        self.refresh()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def refresh(self) -> None:
+        """Add templates created since the last refresh (by any process) to the hash index"""
+        rows = self._connection().execute(
+            "SELECT id, layout_hash FROM templates WHERE id > ? ORDER BY id", (self._last_id,)
+        ).fetchall()
+        if not rows:
+            return
+        with self._lock:
+            for template_id, hash_hex in rows:
+                if template_id > self._last_id:
+                    self._hashes.add(int(hash_hex, 16), template_id)
+                    self._last_id = template_id
+
+    def get(self, template_id: int) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(
+            "SELECT id, layout_hash, anchors, fields, confirmations FROM templates WHERE id = ?", (template_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row[0],
+            'layout_hash': int(row[1], 16),
+            'anchors': set(json.loads(row[2])),
+            'fields': json.loads(row[3]),
+            'confirmations': row[4],
+        }
+
+    def match(self, hash_value: int, anchors: Set[str]) -> Optional[Dict[str, Any]]:
+        """
+        Best template for a page: candidates within max_distance of the layout hash,
+        verified by the share of the template's anchor words found on the page
+        """
+        self.refresh()
+        with self._lock:
+            candidates = self._hashes.search(hash_value, self.max_distance)
+
+        best = None
+        for distance, template_id in candidates:
+            template = self.get(template_id)
+            if template is None or not template['anchors']:
+                continue
+            score = len(template['anchors'] & anchors) / len(template['anchors'])
+            if score >= self.min_anchor_score and (best is None or score > best['anchor_score']):
+                best = dict(template, distance=distance, anchor_score=round(score, 3))
+        return best
+
+    def observe(self, hash_value: int, anchors: Set[str], words: List[Dict[str, Any]],
+                page_size: Tuple[int, int], results: List[Dict[str, str]]) -> str:
+        """
+        Keep a model extraction of a page until it is confirmed (or expires after
+        observation_ttl seconds). Returns the observation id to confirm it with.
+        """
+        observation_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connection()
+        conn.execute("DELETE FROM observations WHERE created_at < ?", (now - self.observation_ttl,))
+        conn.execute(
+            "INSERT INTO observations (id, layout_hash, anchors, words, page_size, results, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (observation_id, format(hash_value, 'x'), json.dumps(sorted(anchors)), json.dumps(words),
+             json.dumps(list(page_size)), json.dumps(results), now)
+        )
+        conn.commit()
+        return observation_id
+
+    def confirm(self, observation_id: str, results: Optional[List[Dict[str, str]]] = None) -> int:
+        """
+        Learn from a reviewed extraction: the observed model results, or the corrected
+        `results` when given. Returns the template id; raises KeyError for an unknown
+        or expired observation.
+        """
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT layout_hash, anchors, words, page_size, results FROM observations WHERE id = ?", (observation_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(observation_id)
+        words = json.loads(row[2])
+        page_size = tuple(json.loads(row[3]))
+        confirmed = results if results is not None else json.loads(row[4])
+        confirmed = [item for item in confirmed if item.get('label') and item.get('value')]
+        fields = [
+            {'label': item['label'], 'remarks': item.get('remarks', ''), 'kind': value_kind(item['value']),
+             'box': locate_value(words, item['value'], page_size)}
+            for item in confirmed
+        ]
+        values = dict(zip(field_keys(confirmed), (item['value'] for item in confirmed)))
+        template_id = self.learn(int(row[0], 16), set(json.loads(row[1])), fields, values, words, page_size)
+        conn.execute("DELETE FROM observations WHERE id = ?", (observation_id,))
+        conn.commit()
+        return template_id
+
+    def learn(self, hash_value: int, anchors: Set[str], fields: List[Dict[str, Any]],
+              values: Dict[Tuple[str, int], str], words: List[Dict[str, Any]], page_size: Tuple[int, int]) -> int:
+        """
+        Record a confirmed extraction; `values` holds the confirmed value of each field
+        by field_keys. A new layout becomes a template. For a known layout
+        the extraction confirms the template when it yields the same fields and the
+        template's stored regions, read on this page, give the confirmed values; with
+        the same fields but other values the regions are replaced, and otherwise the
+        fields. Matching and writing happen in one write transaction, so concurrent
+        confirmations of a new layout end up in one template. Returns the template id.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            template = self.match(hash_value, anchors)
+            now = time.time()
+            if template is None:
+                cursor = conn.execute(
+                    "INSERT INTO templates (layout_hash, anchors, fields, confirmations, created_at, updated_at) "
+                    "VALUES (?, ?, ?, 1, ?, ?)",
+                    (format(hash_value, 'x'), json.dumps(sorted(anchors)), json.dumps(fields), now, now)
+                )
+                conn.commit()
+                self.refresh()
+                return cursor.lastrowid
+
+            old_labels = {field['label'] for field in template['fields']}
+            new_labels = {field['label'] for field in fields}
+            agreement = len(old_labels & new_labels) / max(1, len(old_labels | new_labels))
+            if agreement >= 0.8:
+                # Keep only anchors seen every time (drops document-specific words) and
+                # prefer the latest box for each field
+                stable = template['anchors'] & anchors
+                anchors = stable if len(stable) >= 5 else template['anchors']
+                old_fields = dict(zip(field_keys(template['fields']), template['fields']))
+                values_agree = True
+                for key, field in zip(field_keys(fields), fields):
+                    old = old_fields.get(key)
+                    if old is None:
+                        continue
+                    if old.get('box') is not None:
+                        read = read_region(words, old['box'], page_size)
+                        values_agree = values_agree and _normalize(read) == _normalize(values[key])
+                    if field['box'] is None:
+                        field['box'] = old.get('box')
+                    if old.get('kind') != field['kind']:
+                        field['kind'] = 'text'  # Only check a format every confirmed value had
+                confirmations = template['confirmations'] + 1 if values_agree else 1
+            else:
+                confirmations = 1
+            conn.execute(
+                "UPDATE templates SET anchors = ?, fields = ?, confirmations = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(sorted(anchors)), json.dumps(fields), confirmations, now, template['id'])
+            )
+            conn.commit()
+            return template['id']
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM templates").fetchone()[0]
+
+
+def template_prompt(template: Dict[str, Any]) -> str:
+    """Short prompt asking only for the fields a template is known to contain"""
+    fields = []
+    columns = []
+    for field in template['fields']:
+        match = _LINE_ITEM_COLUMN.match(field['label'])
+        if match:
+            if match.group(1) not in columns:
+                columns.append(match.group(1))
+        elif field['label'] not in fields:
+            fields.append(field['label'])
+    line_items = TEMPLATE_LINE_ITEMS_PROMPT.format(columns='\n'.join(f"- {c}" for c in columns)) if columns else ''
+    return TEMPLATE_PROMPT.format(fields='\n'.join(f"- {f}" for f in fields), line_items=line_items)
+
+
+class TemplateExtractor:
+    """
+    Layout-aware extraction in front of an AI extractor.
+    Each page is fingerprinted with a layout hash and OCR anchor words. Known templates
+    are extracted locally from stored field regions once confirmed often enough (and when
+    they have no line items), or sent to the model with a short template-specific prompt.
+    Locally read values must be confidently recognized, have the format of their field
+    and add up; otherwise the page goes to the model. Model extractions are kept as
+    observations (id in metrics['template_observation']) and learned once confirmed.
+    """
+
+    # Bump whenever fingerprinting or template extraction changes so cached results are invalidated
+    VERSION = "2"
+
+    def __init__(self, model_choice="gpt4-mini", index: Optional[TemplateIndex] = None):
+        # Imported here so the AI-only path does not need OpenCV and Tesseract installed
+        from modules.ocr_processor import OCRProcessor
+
+        self.ai_extractor = get_extractor(model_choice)
+        self.ocr_processor = OCRProcessor()
+        self.index = index or get_template_index()
+        self.min_confirmations = int(os.getenv('TEMPLATE_MIN_CONFIRMATIONS', '3'))
+        self.min_ocr_confidence = float(os.getenv('TEMPLATE_MIN_OCR_CONFIDENCE', '70'))
+
+        self.model = f"template/{self.ai_extractor.model}"
+        self.PROMPT_VERSION = f"{self.ai_extractor.PROMPT_VERSION}.l{self.VERSION}"
+
+    def fingerprint(self, source) -> Tuple[int, Set[str], List[Dict[str, Any]], Tuple[int, int]]:
+        """Layout hash, anchor words, OCR words and size of the page content area"""
+        import cv2
+
+        image = self.ocr_processor.load_image(source)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        # Crop blank margins so scans with different borders hash alike
+        bounds = self.ocr_processor.find_content_bounds(gray)
+        if bounds is not None:
+            x, y, w, h = bounds
+            gray = gray[y:y + h, x:x + w]
+        words = self.ocr_processor.extract_words(cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR))
+        return layout_hash(gray), anchor_words(words), words, (gray.shape[1], gray.shape[0])
+
+    def local_ready(self, template: Dict[str, Any]) -> bool:
+        """Whether a template can be extracted from its stored regions alone"""
+        return (template['confirmations'] >= self.min_confirmations
+                and all(field['box'] is not None for field in template['fields'])
+                and not any(_LINE_ITEM_COLUMN.match(field['label']) for field in template['fields']))
+
+    def extract_regions(self, template: Dict[str, Any], words: List[Dict[str, Any]],
+                        page_size: Tuple[int, int]) -> Tuple[Optional[List[Dict[str, str]]], Optional[str]]:
+        """
+        Fields read from the template's regions, or None and the reason when a value is
+        missing, poorly recognized, not in its field's format, or the totals don't add up
+        (a shifted layout reads the wrong text, so the model has to handle the page)
+        """
+        items = []
+        for field in template['fields']:
+            found = region_words(words, field['box'], page_size)
+            value = ' '.join(word['text'] for word in found)
+            if not value:
+                return None, f"no text for {field['label']}"
+            confidence = sum(word['conf'] for word in found) / len(found)
+            if confidence < self.min_ocr_confidence:
+                return None, f"low OCR confidence for {field['label']} ({confidence:.0f})"
+            if not value_matches_kind(value, field.get('kind')):
+                return None, f"{field['label']} is not a valid {field.get('kind')}: {value!r}"
+            items.append({'label': field['label'], 'value': value, 'remarks': field['remarks']})
+        if totals_consistent({item['label']: item['value'] for item in items}) is False:
+            return None, "totals do not add up"
+        return items, None
+
+    def extract_info(self, source: Union[str, BinaryIO, Image.Image],
+                     metrics: Optional[Dict[str, Any]] = None) -> List[Dict[str, str]]:
+        """
+        Extract information using a matching template when there is one, otherwise the full prompt.
+        `metrics` records the tier used, the template matched and fingerprint time.
+        """
+        start = time.perf_counter()
+        template = None
+        fingerprint = None
+        try:
+            fingerprint = self.fingerprint(source)
+            template = self.index.match(fingerprint[0], fingerprint[1])
+        except Exception as e:
+            # Fingerprinting problems (e.g. Tesseract missing) should never fail the request
+            print(f"Template fingerprinting failed, using the full prompt: {str(e)}")
+        template_ms = (time.perf_counter() - start) * 1000
+        observe_stage('template', template_ms / 1000)
+        if metrics is not None:
+            metrics['template_ms'] = round(template_ms, 1)
+            if template is not None:
+                metrics.update(template_id=template['id'], template_distance=template['distance'],
+                               template_score=template['anchor_score'])
+
+        if template is not None and self.local_ready(template):
+            items, reason = self.extract_regions(template, fingerprint[2], fingerprint[3])
+            if items:
+                print(f"Extracted locally with template {template['id']}")
+                if metrics is not None:
+                    metrics['tier'] = 'template'
+                return items
+            print(f"Template {template['id']} regions failed validation ({reason}), asking the model")
+            if metrics is not None:
+                metrics['template_fallback'] = reason
+
+        if template is not None:
+            print(f"Matched template {template['id']}, using its short prompt")
+            tier = 'template_prompt'
+            results = self.ai_extractor.extract_info(source, metrics=metrics, prompt=template_prompt(template))
+        else:
+            tier = 'ai'
+            results = self.ai_extractor.extract_info(source, metrics=metrics)
+        if metrics is not None:
+            metrics['tier'] = tier
+
+        if results and fingerprint is not None:
+            try:
+                observation_id = self.index.observe(*fingerprint, results)
+                if metrics is not None:
+                    metrics['template_observation'] = observation_id
+            except Exception as e:
+                print(f"Template observation failed: {str(e)}")
+        return results
+
+
+_template_index = None
+_template_extractors = {}
+_template_lock = threading.Lock()
+
+
+def get_template_index() -> TemplateIndex:
+    """
+    Return the process-wide template index configured by TEMPLATE_INDEX_PATH,
+    TEMPLATE_MAX_DISTANCE, TEMPLATE_MIN_ANCHOR_SCORE and TEMPLATE_OBSERVATION_TTL (seconds)
+    """
+    global _template_index
+    if _template_index is None:
+        with _template_lock:
+            if _template_index is None:
+                _template_index = TemplateIndex(
+                    os.getenv('TEMPLATE_INDEX_PATH', os.path.join('cache', 'templates.db')),
+                    max_distance=int(os.getenv('TEMPLATE_MAX_DISTANCE', '32')),
+                    min_anchor_score=float(os.getenv('TEMPLATE_MIN_ANCHOR_SCORE', '0.6')),
+                    observation_ttl=float(os.getenv('TEMPLATE_OBSERVATION_TTL', str(7 * 24 * 3600)))
+                )
+    return _template_index
+
+
+def get_template_extractor(model_choice: str = "gpt4-mini") -> TemplateExtractor:
+    """Return the shared template extractor escalating to the given model, creating it on first use"""
+    extractor = _template_extractors.get(model_choice)
+    if extractor is None:
+        index = get_template_index()
+        with _template_lock:
+            extractor = _template_extractors.get(model_choice)
+            if extractor is None:
+                extractor = TemplateExtractor(model_choice=model_choice, index=index)
+                _template_extractors[model_choice] = extractor
+    return extractor
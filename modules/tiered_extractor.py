@@ -0,0 +1,76 @@
+import os
+import time
+import threading
+from typing import Dict, Any, List, BinaryIO, Optional, Union
+from modules.info_extractor import get_extractor
+from modules.metrics import observe_stage
+from modules.rule_extractor import RuleBasedExtractor
+
+
+class TieredExtractor:
+    """
+    Local OCR fast path in front of an AI extractor.
+    Documents are read with Tesseract and parsed with rules first; only those whose
+    local confidence is below the threshold are sent to the vision model.
+    Exposes the same interface as AIInfoExtractor so it works with the result cache.
+    """
+
+    def __init__(self, model_choice="gpt4-mini", threshold: Optional[float] = None):
+        # Imported here so the AI-only path does not need OpenCV and Tesseract installed
+        from modules.ocr_processor import OCRProcessor
+
+        self.ai_extractor = get_extractor(model_choice)
+        self.ocr_processor = OCRProcessor()
+        self.rules = RuleBasedExtractor()
+        self.threshold = threshold if threshold is not None else float(os.getenv('OCR_CONFIDENCE_THRESHOLD', '0.8'))
+
+        # Results depend on the model, both prompt and rule versions and the threshold
+        self.model = f"tiered/{self.ai_extractor.model}"
+        self.PROMPT_VERSION = f"{self.ai_extractor.PROMPT_VERSION}.r{self.rules.VERSION}.t{self.threshold}"
+
+    def extract_info(self, source: Union[str, BinaryIO],
+                     metrics: Optional[Dict[str, Any]] = None) -> List[Dict[str, str]]:
+        """
+        Extract information locally when the document is easy enough, otherwise with the AI model.
+        `metrics` records the tier used, the local confidence and stage timings.
+        """
+        start = time.perf_counter()
+        try:
+            text, ocr_confidence = self.ocr_processor.process_image_with_confidence(source)
+            items, confidence = self.rules.extract_with_confidence(text, ocr_confidence)
+        except Exception as e:
+            # OCR problems (e.g. Tesseract missing) should never fail the request
+            print(f"Local OCR failed, escalating to AI model: {str(e)}")
+            items, confidence = [], 0.0
+        ocr_ms = (time.perf_counter() - start) * 1000
+        observe_stage('ocr', ocr_ms / 1000)
+
+        if metrics is not None:
+            metrics.update(ocr_ms=round(ocr_ms, 1), ocr_confidence=confidence)
+
+        if items and confidence >= self.threshold:
+            print(f"Local extraction accepted (confidence {confidence:.2f}, {len(items)} items)")
+            if metrics is not None:
+                metrics['tier'] = 'ocr'
+            return items
+
+        print(f"Local confidence {confidence:.2f} below {self.threshold}, escalating to {self.ai_extractor.model}")
+        if metrics is not None:
+            metrics['tier'] = 'ai'
+        return self.ai_extractor.extract_info(source, metrics=metrics)
+
+
+_tiered_extractors = {}
+_tiered_extractors_lock = threading.Lock()
+
+
+def get_tiered_extractor(model_choice: str = "gpt4-mini") -> TieredExtractor:
+    """Return the shared tiered extractor escalating to the given model, creating it on first use"""
+    extractor = _tiered_extractors.get(model_choice)
+    if extractor is None:
+        with _tiered_extractors_lock:
+            extractor = _tiered_extractors.get(model_choice)
+            if extractor is None:
+                extractor = TieredExtractor(model_choice=model_choice)
+                _tiered_extractors[model_choice] = extractor
+    return extractor
@@ -0,0 +1,291 @@
+import os
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, BinaryIO, Optional, Tuple, Union
+import numpy as np
+from PIL import Image, ImageOps
+from modules.document_pages import _LINE_ITEM_LABEL, _aggregate_metrics
+from modules.image_encoding import EncodingPolicy
+from modules.info_extractor import AIInfoExtractor, get_extractor
+from modules.metrics import bind_context, observe_stage
+from modules.prompts import EXTRACTION_PROMPT
+
+# Page size used to compare how much encoding policies shrink a page
+A4_300DPI = (2480, 3508)
+
+_TILE_POSITION = {
+    'first': "It is the top of the document, usually the header: parties, document numbers and dates.",
+    'middle': "It is from the middle of the document, usually line items.",
+    'last': "It is the end of the document, usually totals, tax summaries and payment details.",
+}
+
+
+def tile_prompt(index: int, count: int, prompt: str = EXTRACTION_PROMPT) -> str:
+    """
+    Extraction prompt for band `index` (from 1) of a document cut into `count` bands.
+    The band note follows the unchanged `prompt` so providers can cache the instructions.
+    """
+    position = 'first' if index == 1 else 'last' if index == count else 'middle'
+    note = (f"This image is part {index} of {count} of one tall document, cut into horizontal bands "
+            f"that overlap by a line or two. {_TILE_POSITION[position]}\n"
+            "Extract only what is visible in this part and number its line items from 1. "
+            "Skip text cut off at the top or bottom edge; the neighbouring part has it in full.")
+    return f"{prompt}\n\n{note}"
+
+
+def plan_tiles(lines: List[Tuple[int, int]], height: int, tile_height: int,
+               overlap: int) -> List[Tuple[int, int]]:
+    """
+    Cut a page of `height` rows into bands (top, bottom) of at most tile_height rows.
+    Each cut falls in the widest whitespace gap between text lines in the lower half of
+    the band, which is usually a section break (header, line items, totals), so no line
+    is split; each band after the first repeats at least `overlap` rows of the one before.
+    """
+    gaps = [((above[1] + below[0]) // 2, below[0] - above[1]) for above, below in zip(lines, lines[1:])]
+    overlap = min(overlap, tile_height // 4)
+    tiles = []
+    top = cut = 0
+    while top + tile_height < height:
+        lowest = max(top + tile_height // 2, cut + 1)
+        candidates = [(width, middle) for middle, width in gaps if lowest <= middle <= top + tile_height]
+        cut = max(candidates)[1] if candidates else top + tile_height
+        tiles.append((top, cut))
+        # Start the next band in a gap too, far enough up to repeat the last line(s)
+        starts = [middle for middle, _ in gaps if cut - tile_height // 2 <= middle <= cut - overlap]
+        top = max(starts) if starts else cut - overlap
+    tiles.append((top, height))
+    return tiles
+
+
+def _normalize(value: str) -> str:
+    """Compare values as read by two bands: numbers by value, text without case and spacing"""
+    value = re.sub(r'\s+', ' ', value).strip().lower()
+    try:
+        return repr(float(value.replace(',', '')))
+    except ValueError:
+        return value
+
+
+def _same_line_item(a: Dict[str, str], b: Dict[str, str]) -> bool:
+    """Whether two line items (column -> value) are the same row read from two bands"""
+    shared = [column for column in a if column in b]
+    if not shared or len(shared) * 2 < min(len(a), len(b)):
+        return False
+    return all(_normalize(a[column]) == _normalize(b[column]) for column in shared)
+
+
+def overlap_lines(lines: List[Tuple[int, int]], tiles: List[Tuple[int, int]]) -> List[int]:
+    """
+    Text lines (top, bottom) each band shares with the band above, 0 for the first: at most
+    that many rows at the top of a band can repeat rows the band above already read
+    """
+    counts = [0]
+    for (_, above_bottom), (top, _) in zip(tiles, tiles[1:]):
+        counts.append(sum(1 for line_top, line_bottom in lines
+                          if line_bottom - line_top >= 4 and line_top < above_bottom and line_bottom > top))
+    return counts
+
+
+def _column(label: str, match) -> str:
+    """Column of a line item label, e.g. 'unit price' for 'Line Item 3 - Unit Price'"""
+    return re.sub(r'\s+', ' ', label[match.end():].lstrip(' -:')).lower()
+
+
+def merge_tile_results(tile_results: List[List[Dict[str, str]]], overlaps: Optional[List[int]] = None,
+                       window: int = 3) -> List[Dict[str, str]]:
+    """
+    Stitch per-band extractions into one result list, top to bottom.
+    Line items are renumbered across bands. A row in the overlap is read by both bands: the
+    longest run of a band's first line items matching the last rows of the band above, row
+    for row, is dropped, and any columns only the later band read are added to those rows.
+    The run is at most overlaps[i] rows for band i (see overlap_lines), or `window` rows
+    without overlaps, so identical rows (the same product twice) outside the overlap are kept.
+    Fields outside line items repeated with the same label and value are kept once.
+    """
+    entries = []  # Fields, and line items as {'columns', 'items'}, in document order
+    previous = []  # Line items of the band above, as kept
+    seen = set()
+
+    for index, items in enumerate(tile_results):
+        numbering = {}
+        for item in items:
+            match = _LINE_ITEM_LABEL.match(item['label'])
+            if not match:
+                key = (item['label'].lower(), _normalize(item['value']))
+                if key not in seen:
+                    seen.add(key)
+                    entries.append(item)
+                continue
+            line_item = numbering.get(match.group(2))
+            if line_item is None:
+                line_item = numbering[match.group(2)] = {'columns': {}, 'items': []}
+                entries.append(line_item)
+            line_item['columns'].setdefault(_column(item['label'], match), item['value'])
+            line_item['items'].append(item)
+
+        band = list(numbering.values())
+        limit = min(overlaps[index] if overlaps is not None else window, len(band), len(previous))
+        repeated = next((count for count in range(limit, 0, -1)
+                         if all(_same_line_item(row['columns'], kept['columns'])
+                                for row, kept in zip(band, previous[-count:]))), 0)
+        kept_rows = previous[len(previous) - repeated:]
+        for row, kept in zip(band, kept_rows):
+            for item in row['items']:
+                column = _column(item['label'], _LINE_ITEM_LABEL.match(item['label']))
+                if column not in kept['columns']:
+                    kept['columns'][column] = item['value']
+                    kept['items'].append(item)
+            row['items'] = []  # Read in full by the band above
+        previous = kept_rows + band[repeated:]
+
+    merged = []
+    number = 0
+    for entry in entries:
+        if 'label' in entry:
+            merged.append({'label': entry['label'], 'value': entry['value'], 'remarks': entry['remarks']})
+            continue
+        if not entry['items']:
+            continue
+        number += 1
+        for item in entry['items']:
+            match = _LINE_ITEM_LABEL.match(item['label'])
+            merged.append({'label': f"{match.group(1)}{number}{item['label'][match.end():]}",
+                           'value': item['value'], 'remarks': item['remarks']})
+    return merged
+
+
+class TiledExtractor:
+    """
+    Extracts very large or dense pages as overlapping horizontal bands through another extractor.
+    When the encoding policy would shrink the text of a page below min_text_px, the page is cut
+    at whitespace between text lines (see OCRProcessor.find_text_lines) into bands that each fit
+    the model at the highest scale its width allows. Bands are extracted concurrently and their
+    results stitched, dropping rows read twice in the overlaps. Other pages are passed through.
+    Exposes the extractor interface so it works with the result cache and PagedExtractor.
+    """
+
+    # Bump whenever band planning, the band prompt or stitching changes so cached results are invalidated
+    VERSION = "3"
+
+    def __init__(self, extractor, max_workers: Optional[int] = None, min_text_px: Optional[float] = None,
+                 max_tiles: Optional[int] = None):
+        # Imported here so the AI-only path does not need OpenCV installed
+        from modules.ocr_processor import OCRProcessor
+
+        self.extractor = extractor
+        self.ocr_processor = OCRProcessor()
+        self.max_workers = max_workers or int(os.getenv('TILE_CONCURRENCY', '4'))
+        self.min_text_px = min_text_px or float(os.getenv('TILE_MIN_TEXT_PX', '12'))
+        self.max_tiles = max_tiles or int(os.getenv('TILE_MAX_TILES', '8'))
+        self.encoding_policy = getattr(extractor, 'encoding_policy', None)
+        if self.encoding_policy is None:
+            # The router has no policy of its own; plan bands for the most restrictive of its models
+            policies = [EncodingPolicy.from_model_config(AIInfoExtractor.MODELS[m]) for m in extractor.models]
+            self.encoding_policy = min(policies, key=lambda policy: policy.target_size(*A4_300DPI))
+
+        self.model = f"tiled/{extractor.model}"
+        self.PROMPT_VERSION = f"{extractor.PROMPT_VERSION}.t{self.VERSION}.px{self.min_text_px:g}.n{self.max_tiles}"
+
+    def tile_height(self, width: int) -> int:
+        """Tallest band of the given width the policy sends at the highest scale that width allows"""
+        policy = self.encoding_policy
+        best = min(1.0, policy.max_side / width)
+        height = max(width, policy.max_side)
+        if policy.max_short_side and width > policy.max_short_side / best:
+            height = int(policy.max_short_side / best)
+        return height
+
+    def plan(self, image: Image.Image) -> List[Tuple[int, int]]:
+        """Bands (top, bottom) to extract the page in; a single band when tiling would not help"""
+        return self._plan(image)[0]
+
+    def _plan(self, image: Image.Image) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]:
+        """Bands, and the text lines they were cut between"""
+        width, height = image.size
+        lines = self.ocr_processor.find_text_lines(np.asarray(image.convert('L')))
+        # Rows only a few pixels high are table rulings, not text
+        text_heights = [bottom - top for top, bottom in lines if bottom - top >= 4]
+        if len(text_heights) < 4:
+            return [(0, height)], lines
+        line_height = float(np.median(text_heights))
+        scale = self.encoding_policy.target_size(width, height)[0] / width
+        tile_height = self.tile_height(width)
+        tile_scale = self.encoding_policy.target_size(width, min(height, tile_height))[0] / width
+        if line_height * scale >= self.min_text_px or tile_scale < scale * 1.25:
+            return [(0, height)], lines
+        tops = [top for top, bottom in lines if bottom - top >= 4]
+        overlap = int(max(float(np.median(np.diff(tops))), line_height) * 1.5)
+        tiles = plan_tiles(lines, height, tile_height, overlap)
+        while len(tiles) > self.max_tiles:
+            # Fewer, taller bands: some resolution lost, but a bounded number of requests
+            tile_height = int(tile_height * 1.25)
+            tiles = plan_tiles(lines, height, tile_height, overlap)
+        return tiles, lines
+
+    def _extract_tile(self, tile: Image.Image, prompt: str) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        tile_metrics = {}
+        return self.extractor.extract_info(tile, metrics=tile_metrics, prompt=prompt), tile_metrics
+
+    def extract_info(self, source: Union[str, BinaryIO, Image.Image],
+                     metrics: Optional[Dict[str, Any]] = None) -> List[Dict[str, str]]:
+        start = time.perf_counter()
+        try:
+            image = source if isinstance(source, Image.Image) else Image.open(source)
+            image = ImageOps.exif_transpose(image)
+            image.load()
+        except Exception:
+            raise Exception("Invalid or corrupted image file")
+        finally:
+            if not isinstance(source, (str, Image.Image)):
+                source.seek(0)
+        tiles, lines = self._plan(image)
+        plan_ms = (time.perf_counter() - start) * 1000
+        observe_stage('tile_plan', plan_ms / 1000)
+
+        if len(tiles) == 1:
+            del image
+            results = self.extractor.extract_info(source, metrics=metrics)
+            if metrics is not None:
+                metrics.update(tiles=1, tile_plan_ms=round(plan_ms, 1))
+            return results
+
+        print(f"Extracting {image.width}x{image.height} image as {len(tiles)} bands: {tiles}")
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(tiles)),
+                                thread_name_prefix='tile-worker') as executor:
+            prompt = self.extractor.profile.prompt
+            futures = [executor.submit(bind_context(self._extract_tile),
+                                       image.crop((0, top, image.width, bottom)), tile_prompt(index, len(tiles), prompt))
+                       for index, (top, bottom) in enumerate(tiles, 1)]
+            try:
+                ordered = [future.result() for future in futures]
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+
+        results = merge_tile_results([items for items, _ in ordered], overlap_lines(lines, tiles))
+        elapsed = time.perf_counter() - start
+        print(f"Extracted {len(tiles)} bands in {elapsed:.2f}s, {len(results)} items after stitching")
+        if metrics is not None:
+            metrics.update(_aggregate_metrics([tile_metrics for _, tile_metrics in ordered]))
+            metrics['tile_metrics'] = metrics.pop('page_metrics')
+            metrics.update(tiles=len(tiles), tile_plan_ms=round(plan_ms, 1), tiles_ms=round(elapsed * 1000, 1))
+        return results
+
+
+_tiled_extractors = {}
+_tiled_extractors_lock = threading.Lock()
+
+
+def get_tiled_extractor(model_choice: str = "gpt4-mini") -> TiledExtractor:
+    """Return the shared tiled extractor in front of the given model, creating it on first use"""
+    extractor = _tiled_extractors.get(model_choice)
+    if extractor is None:
+        with _tiled_extractors_lock:
+            extractor = _tiled_extractors.get(model_choice)
+            if extractor is None:
+                extractor = TiledExtractor(get_extractor(model_choice))
+                _tiled_extractors[model_choice] = extractor
+    return extractor
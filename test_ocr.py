@@ -1,6 +1,6 @@
 import os
 from modules.ocr_processor import OCRProcessor
-from modules.info_extractor import InfoExtractor
+from modules.rule_extractor import RuleBasedExtractor
 from create_test_image import create_sample_invoice
 
 def test_ocr_extraction():
@@ -10,22 +10,22 @@ def test_ocr_extraction():
     try:
         # Initialize processors
         ocr_processor = OCRProcessor()
-        info_extractor = InfoExtractor()
+        rule_extractor = RuleBasedExtractor()
         
         print("\nProcessing image:", image_path)
         print("\n1. Extracting text using OCR...")
         # Extract text using OCR
-        extracted_text = ocr_processor.process_image(image_path)
-        print("\nExtracted Text:")
+        extracted_text, ocr_confidence = ocr_processor.process_image_with_confidence(image_path)
+        print(f"\nExtracted Text (OCR confidence {ocr_confidence:.2f}):")
         print("-" * 50)
         print(extracted_text)
         print("-" * 50)
         
         print("\n2. Extracting structured information...")
         # Extract structured information
-        extracted_info = info_extractor.extract_info(extracted_text)
+        extracted_info, confidence = rule_extractor.extract_with_confidence(extracted_text, ocr_confidence)
         
-        print("\nExtracted Information:")
+        print(f"\nExtracted Information (confidence {confidence:.2f}):")
         print("-" * 50)
         print(f"{'Label':<20} | {'Value':<30} | {'Remarks'}")
         print("-" * 80)